@@ -1,11 +1,26 @@
 import os
 import json
+import time
 import logging
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, Optional, Set, Tuple
 from enum import Enum
 import asyncio
 import aiohttp
 from datetime import datetime
+from tools.ollama_client import get_ollama_client
+from tools.usage_metrics import UsageMetrics
+from tools.model_availability import get_availability_registry
+from tools.routing_cache import RoutingDecisionCache, routing_key
+from tools.keyword_matcher import KeywordMatcher
+from tools.task_classifier import get_task_classifier, CLASSIFIER_MIN_CONFIDENCE
+from tools.latency_sketch import LatencyTracker, LATENCY_SLO
+from tools.prompt_builder import estimate_tokens
+from tools.model_load import expected_wait, load_penalty
+from tools.shared_state import get_shared_router_state, SHARED_SYNC_INTERVAL
+from tools.request_context import current_agent
+from tools.cascade import (
+    CascadeStats, CASCADE_ENABLED, CASCADE_MODEL, CASCADE_MAX_COMPLEXITY, CASCADE_EXCLUDED_AGENTS
+)
 
 logger = logging.getLogger(__name__)
 
@@ -44,10 +59,16 @@ class AdvancedRouter:
     - Fallback automático em caso de falha
     - Métricas de performance por modelo
     - Cache inteligente de decisões
+    - Cascata: modelo pequeno primeiro, escalonando para o escolhido quando necessário
+    - Modo SLO: o modelo mais capaz cuja conclusão prevista cabe no limite de latência
+    - Penalidade de carga: espera prevista na fila de cada modelo
+    - Estado compartilhado entre workers (métricas, cooldowns e slots) opcional
     """
     
     def __init__(self):
-        self.ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
+        self.client = get_ollama_client()
+        # Inventário e falhas dos modelos, atualizados em background (o roteamento só lê)
+        self.availability = get_availability_registry()
         
         # Configuração de modelos disponíveis
         self.model_configs = {
@@ -98,9 +119,20 @@ class AdvancedRouter:
         }
         
         # Cache de decisões e métricas
-        self.routing_cache = {}
+        self.routing_cache = RoutingDecisionCache()
         self.model_metrics = {model: {"success_rate": 1.0, "avg_response_time": 0, "total_requests": 0} 
                              for model in self.model_configs.keys()}
+        # Classificador opcional por embeddings (as palavras-chave continuam como fallback)
+        self.classifier = get_task_classifier()
+        self.cascade_stats = CascadeStats()
+        # Tokens/s, tempo de carga e tokens por modelo e por agente (contadores do Ollama)
+        self.usage_metrics = UsageMetrics()
+        # Histogramas com decaimento de TTFT e vazões por modelo (previsão de conclusão)
+        self.latency = LatencyTracker()
+        # Métricas e cooldowns globais quando a API roda com vários workers
+        self.shared = get_shared_router_state()
+        self.last_shared_sync = 0.0
+        self._shared_tasks: Set[asyncio.Task] = set()
         
         # Keywords para detecção automática de tipo e complexidade
         self.complexity_keywords = {
@@ -144,37 +176,39 @@ class AdvancedRouter:
                 "analysis", "analyze", "review", "examine", "evaluate", "assess"
             ],
             TaskType.DOCUMENTATION: [
-                "documentação", "documenta", "readme", "docs", "manual",
+                "documentação", "documenta*", "readme", "docs", "manual",
                 "documentation", "document", "readme", "docs", "manual", "guide"
             ]
         }
+        
+        self.technical_indicators = [
+            "microservices", "kubernetes", "docker", "ci/cd", "terraform",
+            "scalability", "performance", "security", "enterprise", "production"
+        ]
+        
+        # Matchers por palavra inteira, montados uma vez (uma normalização por mensagem)
+        self.complexity_matcher = KeywordMatcher(self.complexity_keywords)
+        self.task_type_matcher = KeywordMatcher(self.task_type_keywords)
+        self.technical_matcher = KeywordMatcher({TaskComplexity.EXPERT: self.technical_indicators})
     
     async def get_available_models(self) -> List[str]:
-        """Obtém lista de modelos disponíveis no Ollama"""
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.ollama_url}/api/tags") as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        available = [model["name"] for model in data.get("models", [])]
-                        # Filter only configured models that are available
-                        return [model for model in self.model_configs.keys() if model in available]
-                    return list(self.model_configs.keys())  # Fallback
-        except Exception as e:
-            logger.warning(f"Could not fetch available models: {e}")
+        """
+        Obtém lista de modelos disponíveis no Ollama.
+        Lê o inventário do registro (stale-while-revalidate): sem chamada HTTP em regime.
+        """
+        installed = await self.availability.inventory()
+        if installed is None:
+            logger.warning("Could not fetch available models, assuming all configured models")
             return list(self.model_configs.keys())
+        # Filter only configured models that are available (and not in failure cooldown)
+        return [model for model in self.model_configs.keys()
+                if model in installed and self.availability.is_available(model)]
     
     def analyze_task_complexity(self, message: str, context: Dict[str, Any] = None) -> TaskComplexity:
         """Analisa a complexidade da tarefa baseada no conteúdo"""
-        message_lower = message.lower()
-        
         # Score-based complexity detection
         complexity_scores = {complexity: 0 for complexity in TaskComplexity}
-        
-        for complexity, keywords in self.complexity_keywords.items():
-            for keyword in keywords:
-                if keyword in message_lower:
-                    complexity_scores[complexity] += 1
+        complexity_scores.update(self.complexity_matcher.counts(message))
         
         # Context-based complexity indicators
         if context:
@@ -191,28 +225,16 @@ class AdvancedRouter:
             complexity_scores[TaskComplexity.EXPERT] += 1
         
         # Technical indicators
-        technical_indicators = [
-            "microservices", "kubernetes", "docker", "ci/cd", "terraform",
-            "scalability", "performance", "security", "enterprise", "production"
-        ]
-        for indicator in technical_indicators:
-            if indicator in message_lower:
-                complexity_scores[TaskComplexity.EXPERT] += 1
+        complexity_scores[TaskComplexity.EXPERT] += self.technical_matcher.counts(message)[TaskComplexity.EXPERT]
         
         # Return complexity with highest score
         return max(complexity_scores, key=complexity_scores.get) or TaskComplexity.MEDIUM
     
     def analyze_task_type(self, message: str, context: Dict[str, Any] = None) -> TaskType:
         """Analisa o tipo da tarefa baseada no conteúdo"""
-        message_lower = message.lower()
-        
         # Score-based task type detection
         type_scores = {task_type: 0 for task_type in TaskType}
-        
-        for task_type, keywords in self.task_type_keywords.items():
-            for keyword in keywords:
-                if keyword in message_lower:
-                    type_scores[task_type] += 1
+        type_scores.update(self.task_type_matcher.counts(message))
         
         # Context-based task type indicators
         if context:
@@ -231,6 +253,31 @@ class AdvancedRouter:
         # Return task type with highest score
         return max(type_scores, key=type_scores.get) or TaskType.CODING
     
+    async def classify_task(self, message: str, context: Dict[str, Any] = None) -> Tuple[TaskType, TaskComplexity, Optional[Dict[str, Any]]]:
+        """
+        Tipo e complexidade da tarefa: pelo classificador de embeddings quando ele responde
+        dentro do orçamento com confiança suficiente, senão pelas palavras-chave
+        """
+        task_type = self.analyze_task_type(message, context)
+        task_complexity = self.analyze_task_complexity(message, context)
+        classification = await self.classifier.classify(message)
+        if not classification:
+            return task_type, task_complexity, None
+        
+        keyword_labels = {"task_type": task_type.value, "task_complexity": task_complexity.value}
+        for dimension, result in classification.items():
+            result["keywords"] = keyword_labels[dimension]
+            result["used"] = result["confidence"] >= CLASSIFIER_MIN_CONFIDENCE
+            self.classifier.record_outcome(dimension, result["used"], result["label"] == result["keywords"])
+        
+        type_result = classification.get("task_type")
+        if type_result and type_result["used"]:
+            task_type = TaskType(type_result["label"])
+        complexity_result = classification.get("task_complexity")
+        if complexity_result and complexity_result["used"]:
+            task_complexity = TaskComplexity(complexity_result["label"])
+        return task_type, task_complexity, classification
+    
     def calculate_model_score(self, model: str, task_type: TaskType, complexity: TaskComplexity, context: Dict[str, Any] = None) -> float:
         """Calcula score do modelo para uma tarefa específica"""
         if model not in self.model_configs:
@@ -282,14 +329,19 @@ class AdvancedRouter:
             elif config["resource_usage"] == "high":
                 score -= 1.0
         
+        # Current load: expected queue wait and slot occupancy
+        score -= self.load_penalty(model)
+        
         return max(score, 0.0)
     
-    async def select_optimal_model(self, message: str, context: Dict[str, Any] = None) -> Tuple[str, Dict[str, Any]]:
-        """Seleciona o modelo otimizado para a tarefa"""
+    async def select_optimal_model(self, message: str, context: Dict[str, Any] = None,
+                                   task_type: Optional[TaskType] = None,
+                                   task_complexity: Optional[TaskComplexity] = None) -> Tuple[str, Dict[str, Any]]:
+        """Seleciona o modelo otimizado para a tarefa (tipo e complexidade podem vir já analisados)"""
         
         # Analyze task characteristics
-        task_complexity = self.analyze_task_complexity(message, context)
-        task_type = self.analyze_task_type(message, context)
+        task_complexity = task_complexity or self.analyze_task_complexity(message, context)
+        task_type = task_type or self.analyze_task_type(message, context)
         
         # Get available models
         available_models = await self.get_available_models()
@@ -322,25 +374,94 @@ class AdvancedRouter:
             "reason": "optimal_selection"
         }
         
+        latency_slo = self.latency_slo(context)
+        if latency_slo:
+            best_model = self.apply_latency_slo(message, context, model_scores, latency_slo, routing_info)
+            best_score = model_scores[best_model]
+        
         logger.info(f"Router selected {best_model} (score: {best_score:.2f}) for {task_type.value}/{task_complexity.value} task")
         
         return best_model, routing_info
     
+    def load_penalty(self, model: str) -> float:
+        """Desconto no score pela carga atual do modelo (fila e slots ocupados)"""
+        return load_penalty(self.client.model_load(model), self.latency.service_time(model))
+    
+    def expected_wait(self, model: str) -> float:
+        """Espera prevista na fila do modelo em segundos"""
+        return expected_wait(self.client.model_load(model), self.latency.service_time(model))
+    
+    def latency_slo(self, context: Dict[str, Any] = None) -> float:
+        """Limite de latência total da requisição em segundos (0 = sem SLO)"""
+        value = (context or {}).get("latency_slo") or LATENCY_SLO
+        try:
+            return max(float(value), 0.0)
+        except (TypeError, ValueError):
+            return 0.0
+    
+    def predict_completion(self, model: str, message: str, context: Dict[str, Any] = None) -> Optional[Dict[str, float]]:
+        """Tempo previsto de conclusão no modelo (None sem medições suficientes)"""
+        context = context or {}
+        prompt_chars = context.get("prompt_chars") or len(message)
+        output_tokens = self.latency.expected_output_tokens(context.get("agent"))
+        resident = self.availability.is_resident(model) or self.client.residency.is_resident(model)
+        prediction = self.latency.predict(model, estimate_tokens(model, prompt_chars), output_tokens, resident)
+        if prediction is not None:
+            prediction["output_tokens"] = output_tokens
+            prediction["queue_wait"] = round(self.expected_wait(model), 3)
+            prediction["total"] = round(prediction["total"] + prediction["queue_wait"], 3)
+        return prediction
+    
+    def apply_latency_slo(self, message: str, context: Dict[str, Any], model_scores: Dict[str, float],
+                          latency_slo: float, routing_info: Dict[str, Any]) -> str:
+        """
+        Modelo de maior score cuja conclusão prevista cabe no SLO.
+        Sem nenhum que caiba, prefere os ainda sem medições (a previsão é desconhecida)
+        e, por último, o de menor tempo previsto.
+        """
+        predictions = {model: self.predict_completion(model, message, context) for model in model_scores}
+        meeting = [model for model, prediction in predictions.items()
+                   if prediction is not None and prediction["total"] <= latency_slo]
+        unknown = [model for model, prediction in predictions.items() if prediction is None]
+        if meeting:
+            best_model, reason = max(meeting, key=model_scores.get), "slo_selection"
+        elif unknown:
+            best_model, reason = max(unknown, key=model_scores.get), "slo_unknown"
+        else:
+            best_model = min(predictions, key=lambda model: predictions[model]["total"])
+            reason = "slo_fastest"
+        routing_info.update({
+            "selected_model": best_model,
+            "model_score": model_scores[best_model],
+            "reason": reason,
+            "slo": {"latency_slo": latency_slo, "met": bool(meeting), "predictions": predictions},
+        })
+        return best_model
+    
     async def route_request(self, message: str, context: Dict[str, Any] = None) -> Tuple[str, Dict[str, Any]]:
         """Rota uma requisição para o modelo apropriado com fallback"""
         try:
-            # Check cache first (optional optimization)
-            cache_key = hash(message + str(sorted((context or {}).items())))
-            if cache_key in self.routing_cache:
-                cached_result = self.routing_cache[cache_key]
+            await self.sync_shared_state()
+            # A decisão depende só das características da tarefa, não do texto da mensagem
+            task_type, task_complexity, classification = await self.classify_task(message, context)
+            context = context or {}
+            cache_key = routing_key(task_type.value, task_complexity.value,
+                                    context.get("agent"), context.get("prefer_fast", False))
+            # Com SLO a decisão depende do tamanho do prompt e da latência recente: sem cache
+            use_cache = not self.latency_slo(context)
+            cached_result = self.routing_cache.get(cache_key, self.availability.version) if use_cache else None
+            # Decisão em cache só vale com o modelo ocioso; com carga os scores mudam
+            if cached_result and self.is_model_available(cached_result[0]) and not self.is_busy(cached_result[0]):
                 logger.debug(f"Using cached routing decision for model: {cached_result[0]}")
-                return cached_result
+                return cached_result[0], {**cached_result[1], "cached": True, "classification": classification}
             
             # Select optimal model
-            selected_model, routing_info = await self.select_optimal_model(message, context)
+            selected_model, routing_info = await self.select_optimal_model(
+                message, context, task_type=task_type, task_complexity=task_complexity
+            )
             
             # Verify model availability
-            if not await self.is_model_available(selected_model):
+            if not self.is_model_available(selected_model):
                 # Fallback to next best available model
                 logger.warning(f"Selected model {selected_model} not available, trying fallback")
                 fallback_model = await self.get_fallback_model(selected_model)
@@ -352,8 +473,11 @@ class AdvancedRouter:
                     selected_model = os.getenv("GENERAL_MODEL", "qwen2.5:7b")
                     routing_info["reason"] = "fallback_default"
             
-            # Cache the decision (with some TTL logic if needed)
-            self.routing_cache[cache_key] = (selected_model, routing_info)
+            # Cache the decision (invalidated when availability changes)
+            if use_cache:
+                self.routing_cache.put(cache_key, self.availability.version, selected_model, routing_info)
+            if classification:
+                routing_info = {**routing_info, "classification": classification}
             
             return selected_model, routing_info
             
@@ -363,21 +487,64 @@ class AdvancedRouter:
             fallback_model = os.getenv("GENERAL_MODEL", "qwen2.5:7b")
             return fallback_model, {"reason": "error_fallback", "error": str(e)}
     
-    async def is_model_available(self, model: str) -> bool:
-        """Verifica se um modelo está disponível"""
-        try:
-            async with aiohttp.ClientSession() as session:
-                test_payload = {
-                    "model": model,
-                    "messages": [{"role": "user", "content": "test"}],
-                    "stream": False
-                }
-                async with session.post(f"{self.ollama_url}/api/chat", 
-                                       json=test_payload, 
-                                       timeout=aiohttp.ClientTimeout(total=5)) as response:
-                    return response.status == 200
-        except:
-            return False
+    def get_backup_model(self, selected_model: str, routing_info: Dict[str, Any]) -> Optional[str]:
+        """Próximo melhor modelo da decisão de roteamento (reserva para hedge/failover)"""
+        scores = routing_info.get("all_scores") or {}
+        candidates = [model for model in scores if model != selected_model and scores[model] > 0]
+        if not candidates:
+            return None
+        return max(candidates, key=scores.get)
+    
+    def plan_cascade(self, selected_model: str, agent: Optional[str] = None,
+                     available_models: Optional[List[str]] = None,
+                     task_complexity: Optional[str] = None) -> Optional[str]:
+        """
+        Modelo da primeira tentativa da cascata (None = usar direto o modelo escolhido).
+        Só entra em cascata quando o modelo pequeno está disponível, é mais leve que o
+        escolhido e a complexidade não passa do limite configurado.
+        """
+        small_model = CASCADE_MODEL
+        if not CASCADE_ENABLED or agent in CASCADE_EXCLUDED_AGENTS or small_model == selected_model:
+            return None
+        if available_models is not None and small_model not in available_models:
+            return None
+        resource_rank = {"low": 0, "medium": 1, "high": 2}
+        small_config = self.model_configs.get(small_model, {})
+        selected_config = self.model_configs.get(selected_model, {})
+        if resource_rank.get(small_config.get("resource_usage"), 1) >= resource_rank.get(selected_config.get("resource_usage"), 1):
+            return None
+        if task_complexity:
+            complexity_order = [complexity.value for complexity in TaskComplexity]
+            limit = CASCADE_MAX_COMPLEXITY if CASCADE_MAX_COMPLEXITY in complexity_order else TaskComplexity.COMPLEX.value
+            if complexity_order.index(task_complexity) > complexity_order.index(limit):
+                return None
+        return small_model
+    
+    def record_cascade(self, agent: Optional[str], small_model: str, large_model: str, reason: Optional[str],
+                       small_tokens: int, large_tokens: Optional[int] = None):
+        """Registra uma cascata (aceita no modelo pequeno ou escalonada) nas métricas"""
+        self.cascade_stats.record(agent, small_model, large_model, reason, small_tokens, large_tokens)
+    
+    async def sync_shared_state(self, force: bool = False):
+        """Traz as métricas e cooldowns dos outros workers (no máximo a cada SHARED_SYNC_INTERVAL)"""
+        now = time.monotonic()
+        if not self.shared.enabled or (not force and now - self.last_shared_sync < SHARED_SYNC_INTERVAL):
+            return
+        self.last_shared_sync = now
+        metrics, down = await self.shared.read()
+        for model, shared_metrics in metrics.items():
+            self.model_metrics.setdefault(model, {}).update(shared_metrics)
+        for model, until in down.items():
+            self.availability.mark_down(model, until)
+    
+    def is_busy(self, model: str) -> bool:
+        """Modelo com requisições em execução ou na fila"""
+        load = self.client.model_load(model)
+        return bool(load["in_flight"] or load["queued"])
+    
+    def is_model_available(self, model: str) -> bool:
+        """Verifica se um modelo está disponível (leitura do registro, sem chamada ao Ollama)"""
+        return self.availability.is_available(model)
     
     async def get_fallback_model(self, unavailable_model: str) -> Optional[str]:
         """Obtém modelo de fallback baseado nas capacidades"""
@@ -406,8 +573,9 @@ class AdvancedRouter:
         
         return best_fallback
     
-    def update_model_metrics(self, model: str, success: bool, response_time: float):
-        """Atualiza métricas de performance do modelo"""
+    def update_model_metrics(self, model: str, success: bool, response_time: float,
+                             usage: Optional[Dict[str, int]] = None, agent: Optional[str] = None):
+        """Atualiza métricas de performance do modelo (e os contadores de tokens/tempo do Ollama)"""
         if model not in self.model_metrics:
             self.model_metrics[model] = {"success_rate": 1.0, "avg_response_time": 0, "total_requests": 0}
         
@@ -418,24 +586,67 @@ class AdvancedRouter:
         new_success_rate = 0.9 * current_success_rate + 0.1 * (1.0 if success else 0.0)
         metrics["success_rate"] = new_success_rate
         
-        # Update average response time
-        current_avg = metrics["avg_response_time"]
-        total_requests = metrics["total_requests"]
-        new_avg = (current_avg * total_requests + response_time) / (total_requests + 1)
-        metrics["avg_response_time"] = new_avg
+        # Tempo médio recente (média com decaimento das respostas bem-sucedidas)
+        if success:
+            self.latency.record(model, response_time, usage or {}, agent or current_agent.get())
+            metrics["avg_response_time"] = self.latency.profile(model).response_time.mean()
+        new_avg = metrics["avg_response_time"]
         
         # Update request count
         metrics["total_requests"] += 1
         
+        # Falhas reais alimentam o registro de disponibilidade
+        if success:
+            self.availability.record_success(model)
+        else:
+            self.availability.record_failure(model)
+        
+        if usage:
+            self.usage_metrics.record(model, usage, agent or current_agent.get())
+        
+        if self.shared.enabled:
+            self._record_shared(model, success, response_time)
+        
         logger.debug(f"Updated metrics for {model}: success_rate={new_success_rate:.2f}, avg_time={new_avg:.2f}s")
     
+    def _record_shared(self, model: str, success: bool, response_time: float):
+        """Grava a requisição no estado compartilhado em segundo plano (a resposta não espera o SQLite)"""
+        try:
+            task = asyncio.get_running_loop().create_task(self._apply_shared(model, success, response_time))
+        except RuntimeError:
+            return
+        self._shared_tasks.add(task)
+        task.add_done_callback(self._shared_tasks.discard)
+    
+    async def _apply_shared(self, model: str, success: bool, response_time: float):
+        shared = await self.shared.record_request(model, success, response_time)
+        if shared is None:
+            return
+        # Métricas globais (todos os workers) substituem as locais
+        shared_metrics, down_until = shared
+        self.model_metrics.setdefault(model, {}).update(shared_metrics)
+        if down_until is not None:
+            self.availability.mark_down(model, down_until)
+    
     def get_routing_stats(self) -> Dict[str, Any]:
         """Retorna estatísticas do sistema de roteamento"""
         return {
             "model_metrics": self.model_metrics,
             "cache_size": len(self.routing_cache),
+            "routing_cache": self.routing_cache.get_stats(),
             "available_models": list(self.model_configs.keys()),
-            "total_routes": sum(m["total_requests"] for m in self.model_metrics.values())
+            "total_routes": sum(m["total_requests"] for m in self.model_metrics.values()),
+            "availability": self.availability.get_stats(),
+            "classifier": self.classifier.get_stats(),
+            "cascade": self.cascade_stats.get_stats(),
+            "usage": self.usage_metrics.get_stats(),
+            "latency": self.latency.get_stats(),
+            "shared_state": self.shared.get_stats(),
+            "load": {
+                model: {**load, "expected_wait": round(self.expected_wait(model), 3),
+                        "penalty": round(self.load_penalty(model), 3)}
+                for model, load in self.client.get_load().items()
+            }
         }
 
 
@@ -4,6 +4,7 @@ import logging
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 from .base import BaseAgent, register_agent
+from tools.keyword_matcher import KeywordMatcher
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +22,17 @@ class ArchitectFullstackAgent(BaseAgent):
     - Performance e scalability
     """
     
+    # Limite da resposta final
+    NUM_PREDICT = 3072
+    
+    # Palavras-chave do despacho, na ordem de prioridade (palavra inteira)
+    DISPATCH = KeywordMatcher({
+        "tech_stack": ["stack", "tecnologia", "framework"],
+        "architecture": ["arquitetura", "design", "estrutura"],
+        "database": ["banco", "database", "modelo"],
+        "api": ["api", "endpoint", "rest"],
+    })
+    
     def __init__(self):
         super().__init__(
             name="architect",
@@ -159,22 +171,22 @@ Sempre justifique suas decisões arquiteturais com reasoning técnico sólido.""
     async def process_message(self, message: str, context: Dict[str, Any] = None) -> str:
         """Processamento especializado para arquitetura"""
         
-        message_lower = message.lower()
+        task = self.DISPATCH.first(message)
         
         # Seleção de tecnologia
-        if any(keyword in message_lower for keyword in ["stack", "tecnologia", "framework"]):
+        if task == "tech_stack":
             return await self._recommend_tech_stack(message, context)
         
         # Design de arquitetura
-        if any(keyword in message_lower for keyword in ["arquitetura", "design", "estrutura"]):
+        if task == "architecture":
             return await self._design_architecture(message, context)
         
         # Design de banco de dados
-        if any(keyword in message_lower for keyword in ["banco", "database", "modelo"]):
+        if task == "database":
             return await self._design_database(message, context)
         
         # Design de APIs
-        if any(keyword in message_lower for keyword in ["api", "endpoint", "rest"]):
+        if task == "api":
             return await self._design_api(message, context)
         
         # Caso padrão - arquitetura geral
@@ -202,10 +214,7 @@ STACKS RECOMENDADAS:
 ENTREGA: Stack recomendada + justificativa + roadmap de implementação
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": stack_prompt}
-        ]
+        messages = self.build_messages(stack_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
     
@@ -229,10 +238,7 @@ PADRÕES ARQUITETURAIS:
 ENTREGA: Diagrama arquitetural + componentes + decisões técnicas
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": architecture_prompt}
-        ]
+        messages = self.build_messages(architecture_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
     
@@ -255,10 +261,7 @@ DATABASE SELECTION:
 ENTREGA: Esquema completo + índices + procedures
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": database_prompt}
-        ]
+        messages = self.build_messages(database_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
     
@@ -277,10 +280,7 @@ API DESIGN PRINCIPLES:
 ENTREGA: Especificação OpenAPI + auth flow + performance strategy
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": api_prompt}
-        ]
+        messages = self.build_messages(api_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
     
@@ -298,10 +298,7 @@ ANÁLISE ARQUITETURAL:
 ENTREGA: Arquitetura completa + justificativas + roadmap
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": general_prompt}
-        ]
+        messages = self.build_messages(general_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
 
@@ -1,33 +1,85 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
-import requests
+from typing import List, Dict, Any, Optional, Callable, Type, TypeVar
 import os
+import time
 import logging
 import json
+import aiohttp
+from advanced_router import get_router
+from tools.ollama_client import get_ollama_client, accumulate_usage, extract_usage
+from tools.prompt_builder import get_context_sizer, read_prompt_file
+from tools.structured_output import parse_or_repair
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 class BaseAgent(ABC):
     """Classe base para todos os agentes do sistema"""
     
+    # Opções para sub-chamadas que são funções puras da entrada (elegíveis ao cache de respostas)
+    DETERMINISTIC_OPTIONS = {"temperature": 0, "seed": 42}
+    # Limite de tokens da resposta final (num_predict) e sequências de parada; None = padrão do Ollama
+    NUM_PREDICT: Optional[int] = None
+    STOP: Optional[List[str]] = None
+    
     def __init__(self, name: str, default_model: str, capabilities: List[str]):
         self.name = name
         self.default_model = default_model
         self.capabilities = capabilities
-        self.ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
+        self.client = get_ollama_client()
+        # Quando definido, as respostas finais são transmitidas token a token
+        self.token_sink: Optional[Callable[[str], None]] = None
+        # Contadores do Ollama acumulados em todas as chamadas deste agente
+        self.usage: Dict[str, int] = {}
+        # done_reason da última geração ("length" = cortada pelo num_predict)
+        self.last_done_reason: Optional[str] = None
+        # Modelo que gerou a última resposta (com hedge, pode ser o de reserva)
+        self.last_model: Optional[str] = None
+        # Histórico da conversa (já dentro do orçamento de tokens), definido em `process`
+        self.history: List[Dict[str, str]] = []
+        self._system_prompt: Optional[str] = None
     
     @abstractmethod
     def get_system_prompt(self) -> str:
         """Retorna o prompt de sistema específico do agente"""
         pass
     
+    def system_prompt(self) -> str:
+        """Prompt de sistema calculado uma vez por instância (texto idêntico em todas as chamadas)"""
+        if self._system_prompt is None:
+            self._system_prompt = self.get_system_prompt()
+        return self._system_prompt
+    
+    def build_messages(self, content: str, history: bool = True) -> List[Dict[str, str]]:
+        """
+        Monta mensagens com prefixo estável para o cache de prompt do Ollama:
+        sistema estático primeiro, depois o histórico e por último o conteúdo volátil.
+        """
+        messages = [{"role": "system", "content": self.system_prompt()}]
+        if history:
+            messages += self.history
+        messages.append({"role": "user", "content": content})
+        return messages
+    
     @abstractmethod
     async def process_message(self, message: str, context: Dict[str, Any] = None) -> str:
         """Processa uma mensagem e retorna a resposta"""
         pass
     
-    async def call_ollama(self, model: str, messages: List[Dict[str, str]]) -> str:
-        """Faz chamada para o Ollama"""
+    async def call_ollama(self, model: str, messages: List[Dict[str, str]], emit: bool = True,
+                          options: Optional[Dict[str, Any]] = None,
+                          response_format: Optional[Any] = None) -> str:
+        """
+        Faz chamada para o Ollama.
+        Com `token_sink` definido e `emit=True`, usa streaming e repassa cada token;
+        chamadas intermediárias (planos, queries, arquivos) devem usar `emit=False`.
+        `options` sobrescreve as opções padrão (ex.: DETERMINISTIC_OPTIONS, num_predict, stop).
+        Sem num_ctx explícito, o contexto é dimensionado pelo tamanho medido do prompt.
+        `response_format` é o `format` do Ollama ("json" ou um JSON schema).
+        Cada chamada alimenta as métricas do router (sucesso, tempo e contadores de tokens).
+        """
+        start_time = time.time()
         try:
             payload = {
                 "model": model,
@@ -35,41 +87,108 @@ class BaseAgent(ABC):
                 "stream": False,
                 "options": {
                     "temperature": 0.7,
-                    "top_p": 0.9,
-                    "num_ctx": 4096  # Adicionado para limitar o tamanho do contexto
+                    "top_p": 0.9
                 }
             }
+            if self.NUM_PREDICT is not None:
+                payload["options"]["num_predict"] = self.NUM_PREDICT
+            if self.STOP:
+                payload["options"]["stop"] = self.STOP
+            if options:
+                payload["options"].update(options)
+            if response_format is not None:
+                payload["format"] = response_format
+            if "num_ctx" not in payload["options"]:
+                payload["options"]["num_ctx"] = get_context_sizer().select_for_messages(
+                    model, messages, payload["options"].get("num_predict")
+                )
             
             # Log detalhado do payload que será enviado
             logger.debug(f"Enviando payload para Ollama (modelo: {model}):\n{json.dumps(payload, indent=2)}")
 
-            response = requests.post(
-                f"{self.ollama_url}/api/chat",
-                json=payload,
-                timeout=120
+            if self.token_sink is not None and emit:
+                return await self._stream_ollama(payload, start_time)
+
+            data = await self.client.chat(
+                model=payload["model"],
+                messages=payload["messages"],
+                options=payload["options"],
+                timeout=120,
+                format=payload.get("format")
             )
-            response.raise_for_status()
-            
-            data = response.json()
+            accumulate_usage(self.usage, data)
+            self.last_done_reason = data.get("done_reason")
+            self.last_model = data.get("model", model)
+            self._record_metrics(data.get("model", model), True, start_time, data)
             return data.get("message", {}).get("content", "")
             
-        except requests.exceptions.HTTPError as http_err:
-            logger.error(f"Erro HTTP ao chamar Ollama: {http_err.response.status_code} - {http_err.response.text}")
+        except aiohttp.ClientResponseError as http_err:
+            logger.error(f"Erro HTTP ao chamar Ollama: {http_err.status} - {http_err.message}")
+            self._record_metrics(model, False, start_time)
             raise
         except Exception as e:
             logger.error(f"Erro ao chamar Ollama: {e}")
+            self._record_metrics(model, False, start_time)
             raise
     
+    def _record_metrics(self, model: str, success: bool, start_time: float, data: Optional[Dict[str, Any]] = None):
+        """Registra a chamada nas métricas do router (cancelamentos não chegam aqui)"""
+        if data and data.get("cached"):
+            # Resposta do cache: o tempo e os contadores não medem o modelo
+            return
+        get_router().update_model_metrics(
+            model, success, time.time() - start_time, extract_usage(data) if data else None, agent=self.name
+        )
+    
+    async def call_structured(self, model: str, messages: List[Dict[str, str]], schema: Type[T],
+                              options: Optional[Dict[str, Any]] = None) -> T:
+        """
+        Chamada com saída JSON restrita ao esquema pydantic (`format` do Ollama).
+        Se a validação falhar, faz uma única correção curta no mesmo modelo.
+        Levanta StructuredOutputError quando a resposta não pôde ser validada.
+        """
+        response = await self.call_ollama(model, messages, emit=False, options=options,
+                                          response_format=schema.model_json_schema())
+
+        async def repair(repair_messages: List[Dict[str, str]], num_predict: int) -> str:
+            return await self.call_ollama(model, repair_messages, emit=False,
+                                          options={**self.DETERMINISTIC_OPTIONS, "num_predict": num_predict},
+                                          response_format=schema.model_json_schema())
+
+        return await parse_or_repair(response, schema, repair)
+    
+    async def _stream_ollama(self, payload: Dict[str, Any], start_time: float) -> str:
+        """Chamada com streaming: envia tokens ao `token_sink` e retorna o conteúdo completo"""
+        parts = []
+        async for chunk in self.client.chat_stream(
+            model=payload["model"],
+            messages=payload["messages"],
+            options=payload["options"],
+            format=payload.get("format")
+        ):
+            token = chunk.get("message", {}).get("content", "")
+            if token:
+                parts.append(token)
+                self.token_sink(token)
+            if chunk.get("done"):
+                accumulate_usage(self.usage, chunk)
+                self.last_done_reason = chunk.get("done_reason")
+                self.last_model = chunk.get("model", payload["model"])
+                self._record_metrics(chunk.get("model", payload["model"]), True, start_time, chunk)
+        return "".join(parts)
+    
     async def process(self, message: str, messages: List[Dict[str, str]], model: Optional[str] = None, context: Optional[Dict[str, Any]] = None) -> str:
         """Método principal de processamento"""
         if not model:
             model = self.default_model
         
         # Adiciona o system prompt específico do agente
-        system_message = {"role": "system", "content": self.get_system_prompt()}
+        system_message = {"role": "system", "content": self.system_prompt()}
         
         # Combina mensagens
         full_messages = [system_message] + messages[1:]  # Remove system original e adiciona o específico
+        # Histórico entre o system e a mensagem atual, reutilizado pelos handlers especializados
+        self.history = messages[1:-1] if messages and messages[-1].get("role") == "user" else messages[1:]
         
         # Processa mensagem específica do agente
         agent_context = context or {}
@@ -83,12 +202,11 @@ class BaseAgent(ABC):
         return await self.call_ollama(model, full_messages)
     
     def load_prompt_file(self, filename: str) -> str:
-        """Carrega arquivo de prompt do diretório prompts"""
+        """Carrega arquivo de prompt do diretório prompts (em cache até o arquivo mudar)"""
         try:
-            from pathlib import Path
-            prompt_path = Path("prompts") / filename
-            if prompt_path.exists():
-                return prompt_path.read_text(encoding="utf-8")
+            content = read_prompt_file(filename)
+            if content is not None:
+                return content
             else:
                 logger.warning(f"Arquivo de prompt não encontrado: {filename}")
                 return ""
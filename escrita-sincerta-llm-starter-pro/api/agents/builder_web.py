@@ -1,9 +1,12 @@
 import os
 import json
+import asyncio
 import logging
 from typing import Dict, Any, List
 from .base import BaseAgent, register_agent
-from tools.project_writer import create_project_file, get_generated_projects
+from tools.project_writer import create_project_file
+from tools.structured_output import ProjectStructure, StructuredOutputError
+from tools.request_context import Priority, request_scope
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +16,9 @@ class BuilderAgent(BaseAgent):
     Agente especializado em scaffolding e geração de projetos completos no disco.
     """
     
+    # Limite por arquivo gerado
+    NUM_PREDICT = 4096
+    
     def __init__(self):
         super().__init__(
             name="builder_web",
@@ -53,9 +59,9 @@ Você é o "Arcano", um agente de IA construtor de software. Sua especialidade 
 3.  **SEMPRE FUNCIONAL**: O projeto final deve ser executável. Inclua todas as dependências, configurações e scripts necessários para que o usuário possa rodar o projeto com comandos padrão (ex: `npm install && npm run dev`).
 """
 
-    async def _plan_project_structure(self, user_request: str, model: str) -> str:
+    async def _plan_project_structure(self, user_request: str, model: str) -> ProjectStructure:
         """
-        Pede ao LLM para gerar um plano de estrutura de arquivos em formato JSON.
+        Pede ao LLM para gerar um plano de estrutura de arquivos em formato JSON (restrito ao esquema).
         """
         prompt = f"""
 Baseado na seguinte solicitação do usuário, gere um plano de estrutura de arquivos em formato JSON.
@@ -65,15 +71,10 @@ O JSON deve conter 'project_name' e um objeto 'files' com os caminhos dos arquiv
 
 **JSON de Estrutura:**
 """
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": prompt}
-        ]
+        messages = self.build_messages(prompt, history=False)
         
-        response = await self.call_ollama(model, messages)
-        # Extrai o bloco JSON da resposta do modelo
-        json_block = response[response.find('{'):response.rfind('}')+1]
-        return json_block
+        return await self.call_structured(model, messages, ProjectStructure,
+                                          options={**self.DETERMINISTIC_OPTIONS, "num_predict": 1024})
 
     async def _generate_and_write_files(self, project_name: str, files: Dict[str, str], user_request: str, model: str):
         """
@@ -81,10 +82,12 @@ O JSON deve conter 'project_name' e um objeto 'files' com os caminhos dos arquiv
         """
         logger.info(f"Iniciando a geração de {len(files)} arquivos para o projeto '{project_name}'...")
         
-        for file_path, description in files.items():
-            logger.info(f"Gerando conteúdo para: {file_path} ({description})")
+        index = 0
+        try:
+            for index, (file_path, description) in enumerate(files.items()):
+                logger.info(f"Gerando conteúdo para: {file_path} ({description})")
             
-            generation_prompt = f"""
+                generation_prompt = f"""
 **Solicitação Original do Projeto:** "{user_request}"
 
 **Estrutura do Projeto (JSON):**
@@ -103,35 +106,41 @@ Gere o conteúdo COMPLETO e FUNCIONAL para o seguinte arquivo:
 - O código deve ser completo e pronto para ser salvo diretamente no arquivo.
 """
             
-            messages = [
-                {"role": "system", "content": self.get_system_prompt()},
-                {"role": "user", "content": generation_prompt}
-            ]
+                messages = self.build_messages(generation_prompt, history=False)
             
-            logger.debug(f"Payload para o Ollama: {json.dumps(messages, indent=2)}")
+                logger.debug(f"Payload para o Ollama: {json.dumps(messages, indent=2)}")
             
-            file_content = await self.call_ollama(model, messages)
+                file_content = await self.call_ollama(model, messages, emit=False)
             
-            # Limpa o conteúdo para remover blocos de código markdown
-            if file_content.startswith("```") and file_content.endswith("```"):
-                file_content = '\n'.join(file_content.split('\n')[1:-1])
+                # Limpa o conteúdo para remover blocos de código markdown
+                if file_content.startswith("```") and file_content.endswith("```"):
+                    file_content = '\n'.join(file_content.split('\n')[1:-1])
 
-            create_project_file(project_name, file_path, file_content)
+                create_project_file(project_name, file_path, file_content)
+        except asyncio.CancelledError:
+            # Requisição cancelada (ex.: cliente desconectou): os arquivos restantes não são gerados
+            logger.info(f"Build de '{project_name}' cancelado após {index} de {len(files)} arquivos.")
+            raise
 
     async def process_message(self, message: str, context: Dict[str, Any] = None) -> str:
         """
         Implementa o método abstrato e orquestra o processo de build.
+        As dezenas de chamadas do build entram como passos de agente, abaixo do chat interativo.
         """
+        with request_scope(priority=Priority.AGENT_STEP):
+            return await self._build_project(message, context)
+
+    async def _build_project(self, message: str, context: Dict[str, Any]) -> str:
+        """Planeja, gera e grava os arquivos do projeto."""
         model = context.get("model", self.default_model)
         
         # Etapa 1: Planejar a estrutura do projeto
         try:
-            plan_json_str = await self._plan_project_structure(message, model)
-            plan = json.loads(plan_json_str)
-            project_name = plan.get("project_name", "novo-projeto-gerado")
-            files_to_create = plan.get("files", {})
-        except (json.JSONDecodeError, TypeError):
-            logger.error("Falha ao decodificar o plano JSON do LLM.")
+            plan = await self._plan_project_structure(message, model)
+            project_name = plan.project_name or "novo-projeto-gerado"
+            files_to_create = plan.files
+        except StructuredOutputError as e:
+            logger.error(f"Falha ao decodificar o plano JSON do LLM: {e}")
             return "Desculpe, não consegui criar um plano de projeto válido. A resposta do modelo não era um JSON formatado corretamente."
 
         if not files_to_create:
@@ -2,6 +2,7 @@ import os
 import logging
 from typing import Dict, Any, List
 from .base import BaseAgent, register_agent
+from tools.keyword_matcher import KeywordMatcher
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +20,17 @@ class DevFullstackAgent(BaseAgent):
     - DevOps e deployment
     """
     
+    # Limite da resposta final
+    NUM_PREDICT = 3072
+    
+    # Palavras-chave do despacho, na ordem de prioridade (palavra inteira)
+    DISPATCH = KeywordMatcher({
+        "debugging": ["debug", "erro", "bug", "falha", "não funciona"],
+        "code_generation": ["criar", "implementar", "gerar", "desenvolver", "código"],
+        "architecture": ["arquitetura", "estrutura", "design", "modelar"],
+        "code_review": ["revisar", "analisar", "melhorar", "otimizar"],
+    })
+    
     def __init__(self):
         super().__init__(
             name="dev_fullstack",
@@ -73,22 +85,22 @@ Seja técnico, direto e entregue soluções funcionais."""
         """Processamento específico para desenvolvimento"""
         
         # Identifica tipo de tarefa
-        message_lower = message.lower()
+        task = self.DISPATCH.first(message)
         
         # Análise de código
-        if any(keyword in message_lower for keyword in ["debug", "erro", "bug", "falha", "não funciona"]):
+        if task == "debugging":
             return await self._handle_debugging(message, context)
         
         # Geração de código
-        if any(keyword in message_lower for keyword in ["criar", "implementar", "gerar", "desenvolver", "código"]):
+        if task == "code_generation":
             return await self._handle_code_generation(message, context)
         
         # Arquitetura
-        if any(keyword in message_lower for keyword in ["arquitetura", "estrutura", "design", "modelar"]):
+        if task == "architecture":
             return await self._handle_architecture(message, context)
         
         # Review de código
-        if any(keyword in message_lower for keyword in ["revisar", "analisar", "melhorar", "otimizar"]):
+        if task == "code_review":
             return await self._handle_code_review(message, context)
         
         # Caso padrão - delega para Ollama
@@ -109,10 +121,7 @@ METODOLOGIA DE DEBUG:
 Forneça diagnóstico completo e solução testável.
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": debug_prompt}
-        ]
+        messages = self.build_messages(debug_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
     
@@ -133,10 +142,7 @@ REQUISITOS TÉCNICOS:
 ENTREGA: Código completo + testes + instruções de uso
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": code_prompt}
-        ]
+        messages = self.build_messages(code_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
     
@@ -159,10 +165,7 @@ CONSIDERAÇÕES ARQUITETURAIS:
 ENTREGA: Diagrama conceitual + decisões técnicas justificadas + implementação inicial
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": arch_prompt}
-        ]
+        messages = self.build_messages(arch_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
     
@@ -183,10 +186,7 @@ CHECKLIST DE REVIEW:
 ENTREGA: Análise detalhada + refactor sugerido + justificativas técnicas
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": review_prompt}
-        ]
+        messages = self.build_messages(review_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
 
@@ -4,6 +4,7 @@ import logging
 from typing import Dict, Any
 from .base import BaseAgent, register_agent
 from tools.project_writer import read_project_file, create_project_file
+from tools.prompt_builder import count_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -83,12 +84,11 @@ Você é um Engenheiro de Software de IA especialista em refatoração e ediçã
 Agora, gere o conteúdo COMPLETO e ATUALIZADO do arquivo `{file_path}` após aplicar a modificação solicitada. Sua resposta deve ser apenas o código.
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": edit_prompt}
-        ]
+        messages = self.build_messages(edit_prompt, history=False)
         
-        modified_content = await self.call_ollama(model, messages)
+        # O arquivo volta inteiro: a saída precisa comportar o original mais a modificação
+        num_predict = int(count_tokens(model, original_content) * 1.3) + 512
+        modified_content = await self.call_ollama(model, messages, emit=False, options={"num_predict": num_predict})
 
         # Etapa 4: Salvar (sobrescrever) o arquivo com o novo conteúdo
         try:
@@ -4,6 +4,7 @@ import logging
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 from .base import BaseAgent, register_agent
+from tools.keyword_matcher import KeywordMatcher
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +22,18 @@ class IdeatorAgent(BaseAgent):
     - Personas e user stories
     """
     
+    # Limite da resposta final
+    NUM_PREDICT = 2048
+    
+    # Palavras-chave do despacho, na ordem de prioridade (palavra inteira)
+    DISPATCH = KeywordMatcher({
+        "saas": ["saas", "software", "plataforma", "sistema"],
+        "app": ["app", "mobile", "android", "ios", "flutter"],
+        "market": ["mercado", "competição", "análise", "oportunidade"],
+        "mvp": ["mvp", "produto", "features", "funcionalidades"],
+        "personas": ["persona", "usuário", "cliente", "user story"],
+    })
+    
     def __init__(self):
         super().__init__(
             name="ideator",
@@ -148,26 +161,26 @@ Seja criativo mas pragmático. Gere ideias inovadoras que sejam tecnicamente vi
     async def process_message(self, message: str, context: Dict[str, Any] = None) -> str:
         """Processamento especializado para ideação"""
         
-        message_lower = message.lower()
+        task = self.DISPATCH.first(message)
         
         # Geração de ideias SaaS
-        if any(keyword in message_lower for keyword in ["saas", "software", "plataforma", "sistema"]):
+        if task == "saas":
             return await self._generate_saas_idea(message, context)
         
         # Ideias de apps mobile
-        if any(keyword in message_lower for keyword in ["app", "mobile", "android", "ios", "flutter"]):
+        if task == "app":
             return await self._generate_app_idea(message, context)
         
         # Análise de mercado
-        if any(keyword in message_lower for keyword in ["mercado", "competição", "análise", "oportunidade"]):
+        if task == "market":
             return await self._analyze_market(message, context)
         
         # Definição de MVP
-        if any(keyword in message_lower for keyword in ["mvp", "produto", "features", "funcionalidades"]):
+        if task == "mvp":
             return await self._define_mvp(message, context)
         
         # Personas e user stories
-        if any(keyword in message_lower for keyword in ["persona", "usuário", "cliente", "user story"]):
+        if task == "personas":
             return await self._create_personas(message, context)
         
         # Caso padrão - ideação geral
@@ -203,10 +216,7 @@ CRITÉRIOS DE AVALIAÇÃO:
 ENTREGA: JSON estruturado com conceito completo + análise de viabilidade
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": ideation_prompt}
-        ]
+        messages = self.build_messages(ideation_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
     
@@ -249,10 +259,7 @@ MÉTRICAS DE SUCESSO:
 ENTREGA: Conceito de app com wireframes básicos + estratégia de lançamento
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": app_prompt}
-        ]
+        messages = self.build_messages(app_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
     
@@ -302,10 +309,7 @@ FERRAMENTAS DE ANÁLISE:
 ENTREGA: Relatório executivo com oportunidades priorizadas e recomendações estratégicas
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": market_prompt}
-        ]
+        messages = self.build_messages(market_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
     
@@ -357,10 +361,7 @@ ROADMAP STRATEGY:
 ENTREGA: MVP specification + roadmap detalhado + success metrics
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": mvp_prompt}
-        ]
+        messages = self.build_messages(mvp_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
     
@@ -413,10 +414,7 @@ ACCEPTANCE CRITERIA:
 ENTREGA: 3-5 personas primárias + user stories priorizadas + journey maps
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": persona_prompt}
-        ]
+        messages = self.build_messages(persona_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
     
@@ -456,10 +454,7 @@ INSPIRAÇÃO CROSS-INDUSTRY:
 ENTREGA: Top 5 ideias ranqueadas + análise de potencial + próximos passos
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": general_prompt}
-        ]
+        messages = self.build_messages(general_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
 
@@ -3,6 +3,9 @@ import json
 import logging
 from typing import Dict, Any, List
 from .base import BaseAgent, register_agent
+from tools.cascade import usage_tokens
+from tools.structured_output import OrchestratorPlan, StructuredOutputError
+from advanced_router import get_router
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +16,9 @@ class OrchestratorAgent(BaseAgent):
     e delega tarefas para outros agentes especializados.
     """
     
+    # Planos JSON curtos
+    NUM_PREDICT = 1024
+    
     def __init__(self):
         super().__init__(
             name="orchestrator",
@@ -21,6 +27,8 @@ class OrchestratorAgent(BaseAgent):
         )
         # No futuro, isso poderia ser carregado dinamicamente
         self.available_agents = ["builder_web", "editor", "researcher", "dev_fullstack"]
+        # Modelo que gerou o último plano (o pequeno, quando a cascata aceita)
+        self.plan_model = self.default_model
 
     def get_system_prompt(self) -> str:
         """Prompt especializado para planejamento e orquestração."""
@@ -89,24 +97,37 @@ Crie um plano de ação em JSON para a seguinte solicitação do usuário:
 "{message}"
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": plan_prompt}
-        ]
-        
-        response = await self.call_ollama(self.default_model, messages)
-        
-        # Extrai e valida o JSON da resposta
-        try:
-            json_block = response[response.find('{'):response.rfind('}')+1]
-            plan = json.loads(json_block)
-            if "plan" in plan and isinstance(plan["plan"], list):
-                logger.info(f"Plano gerado com sucesso com {len(plan['plan'])} passos.")
-                # Retorna o JSON como uma string para ser processado pela API
-                return json.dumps(plan)
-            else:
-                raise ValueError("O JSON não contém a chave 'plan' ou não é uma lista.")
-        except (json.JSONDecodeError, ValueError) as e:
-            logger.error(f"Falha ao gerar ou validar o plano JSON: {e}")
-            logger.debug(f"Resposta recebida do LLM: {response}")
-            return json.dumps({"error": "Não foi possível criar um plano de ação válido.", "details": str(e)})
+        messages = self.build_messages(plan_prompt, history=False)
+
+        # Cascata: o modelo pequeno tenta primeiro; JSON inválido ou truncado escala para o padrão
+        router = get_router()
+        cascade_model = router.plan_cascade(self.default_model, self.name, await router.get_available_models())
+        models = [cascade_model, self.default_model] if cascade_model else [self.default_model]
+
+        tokens_by_model = {}
+        plan = None
+        error = None
+        reason = None
+        for model in models:
+            tokens_before = usage_tokens(self.usage)
+            try:
+                plan = await self.call_structured(model, messages, OrchestratorPlan, options=self.DETERMINISTIC_OPTIONS)
+                error = None
+            except StructuredOutputError as e:
+                error = str(e)
+            tokens_by_model[model] = usage_tokens(self.usage) - tokens_before
+            if plan is not None or model != cascade_model:
+                break
+            reason = "truncated" if self.last_done_reason == "length" else "invalid_json"
+            logger.warning(f"Plano de {cascade_model} rejeitado ({reason}), refazendo com {self.default_model}")
+        if cascade_model:
+            router.record_cascade(self.name, cascade_model, self.default_model, reason,
+                                  tokens_by_model[cascade_model], tokens_by_model.get(self.default_model))
+        self.plan_model = model
+
+        if plan is not None:
+            logger.info(f"Plano gerado com sucesso com {len(plan.plan)} passos.")
+            # Retorna o JSON como uma string para ser processado pela API
+            return plan.model_dump_json()
+        logger.error(f"Falha ao gerar ou validar o plano JSON: {error}")
+        return json.dumps({"error": "Não foi possível criar um plano de ação válido.", "details": error})
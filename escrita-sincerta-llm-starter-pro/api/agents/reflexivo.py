@@ -2,6 +2,7 @@ import os
 import logging
 from typing import Dict, Any, List
 from .base import BaseAgent, register_agent
+from tools.keyword_matcher import KeywordMatcher
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +20,17 @@ class ReflexivoAgent(BaseAgent):
     - Facilitação de tomada de decisão
     """
     
+    # Limite da resposta final
+    NUM_PREDICT = 2048
+    
+    # Palavras-chave do despacho, na ordem de prioridade (palavra inteira)
+    DISPATCH = KeywordMatcher({
+        "problem": ["problema", "dificuldade", "desafio", "bloqueio", "stuck"],
+        "planning": ["plano", "estratégia", "como", "passos", "roadmap"],
+        "decision": ["decisão", "escolha", "opção", "dilema", "vs", "ou"],
+        "reflection": ["reflexão", "pensar", "analisar", "entender", "porque"],
+    })
+    
     def __init__(self):
         super().__init__(
             name="reflexivo",
@@ -81,22 +93,22 @@ Seja um espelho inteligente que revela clareza onde há confusão."""
     async def process_message(self, message: str, context: Dict[str, Any] = None) -> str:
         """Processamento especializado para análise reflexiva"""
         
-        message_lower = message.lower()
+        task = self.DISPATCH.first(message)
         
         # Análise de problemas
-        if any(keyword in message_lower for keyword in ["problema", "dificuldade", "desafio", "bloqueio", "stuck"]):
+        if task == "problem":
             return await self._handle_problem_analysis(message, context)
         
         # Planejamento e estratégia
-        if any(keyword in message_lower for keyword in ["plano", "estratégia", "como", "passos", "roadmap"]):
+        if task == "planning":
             return await self._handle_strategic_planning(message, context)
         
         # Tomada de decisão
-        if any(keyword in message_lower for keyword in ["decisão", "escolha", "opção", "dilema", "vs", "ou"]):
+        if task == "decision":
             return await self._handle_decision_support(message, context)
         
         # Auto-reflexão
-        if any(keyword in message_lower for keyword in ["reflexão", "pensar", "analisar", "entender", "porque"]):
+        if task == "reflection":
             return await self._handle_self_reflection(message, context)
         
         # Caso padrão
@@ -124,10 +136,7 @@ PERGUNTAS REFLEXIVAS:
 ENTREGA: Reformulação do problema + análise de causas + plano inicial
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": analysis_prompt}
-        ]
+        messages = self.build_messages(analysis_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
     
@@ -159,10 +168,7 @@ TÉCNICAS DE EXECUÇÃO:
 ENTREGA: Roadmap detalhado + critérios de sucesso + plano de contingência
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": planning_prompt}
-        ]
+        messages = self.build_messages(planning_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
     
@@ -195,10 +201,7 @@ VIESES COGNITIVOS A EVITAR:
 ENTREGA: Matriz de decisão + recomendação fundamentada + plano de implementação
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": decision_prompt}
-        ]
+        messages = self.build_messages(decision_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
     
@@ -231,10 +234,7 @@ FRAMEWORK DE GROWTH MINDSET:
 ENTREGA: Insights profundos + blind spots revelados + plano de desenvolvimento pessoal
 """
         
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": reflection_prompt}
-        ]
+        messages = self.build_messages(reflection_prompt)
         
         return await self.call_ollama(context.get("model", self.default_model), messages)
 
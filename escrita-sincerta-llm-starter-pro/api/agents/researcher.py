@@ -13,6 +13,9 @@ class ResearcherAgent(BaseAgent):
     Agente especializado em buscar informações atualizadas na internet.
     """
     
+    # Limite da resposta final
+    NUM_PREDICT = 1536
+    
     def __init__(self):
         super().__init__(
             name="researcher",
@@ -56,7 +59,9 @@ Pergunta: "{message}"
 Query de Busca:"""
         
         messages = [{"role": "user", "content": query_formulation_prompt}]
-        search_query = await self.call_ollama(self.default_model, messages)
+        # A query cabe em uma linha
+        search_query = await self.call_ollama(self.default_model, messages, emit=False,
+                                             options={**self.DETERMINISTIC_OPTIONS, "num_predict": 48, "stop": ["\n"]})
         search_query = search_query.strip().strip('"')
         
         logger.info(f"Query de busca formulada: {search_query}")
@@ -85,10 +90,7 @@ Com base nos resultados da busca, escreva uma resposta completa e bem estruturad
 Lembre-se de citar as fontes (links) no final da sua resposta.
 """
         
-        synthesis_messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": synthesis_prompt}
-        ]
+        synthesis_messages = self.build_messages(synthesis_prompt)
         
         final_response = await self.call_ollama(self.default_model, synthesis_messages)
         
@@ -1,10 +1,34 @@
-from fastapi import FastAPI, HTTPException, Body, UploadFile, File
+from fastapi import FastAPI, HTTPException, Body, UploadFile, File, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, ConfigDict
-import os, requests, json, glob, logging, asyncio, time
+from contextlib import asynccontextmanager
+import os, json, glob, logging, asyncio, time
+import aiohttp
 from pathlib import Path
 from typing import List, Optional, Dict, Any
 from advanced_router import get_router, TaskType, TaskComplexity
+from tools.ollama_client import (
+    get_ollama_client,
+    close_ollama_client,
+    get_residency_manager,
+    accumulate_usage,
+    extract_usage,
+)
+from tools.llm_cache import get_llm_cache
+from tools.prompt_builder import get_prompt_builder, get_context_sizer, read_prompt_file
+from tools.scheduler import get_scheduler
+from tools.ollama_pool import conversation_key
+from tools.model_availability import get_availability_registry
+from tools.task_classifier import get_task_classifier, ROUTING_EXAMPLES
+from tools.router_state import get_router_state_store
+from tools.shared_state import get_shared_router_state
+from tools.structured_output import get_structured_output_stats
+from tools.cascade import (
+    escalation_reason, rate_confidence, usage_tokens, CASCADE_RATE_CONFIDENCE, CASCADE_MIN_CONFIDENCE
+)
+from tools.request_context import Priority, request_scope, scoped_iter
+from tools.cancellation import run_until_disconnect, get_cancellation_stats, ClientDisconnected
 from tools.history import (
     get_projects as get_projects_from_history,
     create_project as create_project_in_history,
@@ -27,10 +51,31 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Ciclo de vida da aplicação: recursos compartilhados entre requisições"""
+    # Pré-carga opcional (OLLAMA_PRELOAD_MODELS) só do modelo padrão e renovação dos modelos quentes
+    get_residency_manager().start(preload=[os.getenv("GENERAL_MODEL", "qwen2.5:7b")])
+    # Sessão HTTP única com o Ollama, aberta aqui e fechada no shutdown
+    await get_ollama_client().get_session()
+    # Health check e inventário dos nós Ollama (OLLAMA_URLS), lidos pelo router
+    get_availability_registry().start(get_ollama_client())
+    # Centroides do classificador de tarefas (ROUTER_CLASSIFIER_ENABLED), montados em background
+    get_task_classifier().start()
+    # Restaura métricas e latências aprendidas antes do restart e grava snapshots periódicos
+    get_router_state_store().start(get_router())
+    yield
+    await get_router_state_store().stop(get_router())
+    await get_availability_registry().stop()
+    await get_shared_router_state().close()
+    # Fecha o pool de conexões com o Ollama
+    await close_ollama_client()
+
 app = FastAPI(
     title="Escrita Sincerta API",
     description="API Orquestradora para LLM Local com Agentes Especializados",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -44,50 +89,269 @@ app.add_middleware(
 
 # --- Lógica de Execução de Agente (Refatorada) ---
 
-async def execute_agent_task(agent_name: str, message: str, history: List[Dict[str, str]], context: Dict[str, Any]) -> str:
+AGENT_MAP = {
+    "ideator_saas": "agents.ideator_saas.IdeatorAgent",
+    "architect_fullstack": "agents.architect_fullstack.ArchitectFullstackAgent",
+    "builder_web": "agents.builder_web.BuilderAgent",
+    "editor": "agents.editor.EditorAgent",
+    "researcher": "agents.researcher.ResearcherAgent",
+    "dev_fullstack": "agents.dev_fullstack.DevFullstackAgent",
+    "orchestrator": "agents.orchestrator.OrchestratorAgent",
+}
+
+def load_agent(agent_name: str):
+    """Importa e instancia o agente dinamicamente (None se desconhecido)"""
+    if agent_name not in AGENT_MAP:
+        return None
+    module_path, class_name = AGENT_MAP[agent_name].rsplit('.', 1)
+    module = __import__(module_path, fromlist=[class_name])
+    AgentClass = getattr(module, class_name)
+    return AgentClass()
+
+def try_load_agent(agent_name: str):
+    """Como `load_agent`, mas registra falhas de importação e retorna None"""
+    try:
+        agent_instance = load_agent(agent_name)
+    except Exception as load_error:
+        logger.error(f"Erro ao carregar o agente '{agent_name}': {load_error}", exc_info=True)
+        return None
+    if agent_instance is None:
+        logger.warning(f"Agente '{agent_name}' desconhecido. Usando chat direto.")
+    return agent_instance
+
+def base_system_prompt() -> str:
+    """Prompt base + manifesto, usado no chat direto (sem agente)"""
+    prompts = load_prompts()
+    return f"{prompts['system_base']}\n\n{prompts['manifesto']}"
+
+# Chaves do contexto da requisição repassadas ao router
+ROUTING_CONTEXT_KEYS = ("prefer_fast", "latency_slo", "project_size")
+
+async def prepare_agent_task(agent_name: str, message: str, history: List[Dict[str, str]],
+                             system_prompt: Optional[str] = None,
+                             context: Optional[Dict[str, Any]] = None,
+                             reserved_output: Optional[int] = None) -> tuple[str, Dict[str, Any], List[Dict[str, str]], Dict[str, Any]]:
     """
-    Função centralizada para selecionar, instanciar e executar um agente.
+    Roteia a requisição e monta as mensagens para o agente dentro do orçamento de tokens do modelo.
+    `system_prompt` é o prompt do agente (o mesmo que ele usará); sem ele, usa o prompt base.
+    `reserved_output` é o num_predict do agente, reservado para a saída no orçamento do prompt.
+    Do contexto da requisição, `prefer_fast` e `latency_slo` (segundos) chegam ao router.
+    Retorna modelo, roteamento, mensagens e o relatório do orçamento (tokens cortados do histórico).
     """
+    # Começa a carregar o modelo habitual do agente enquanto o roteamento acontece
+    residency = get_residency_manager()
+    residency.warm_for_agent(agent_name)
+
+    if system_prompt is None:
+        system_prompt = base_system_prompt()
+    routing_context = {key: value for key, value in (context or {}).items() if key in ROUTING_CONTEXT_KEYS}
+    routing_context["agent"] = agent_name
+    # Tamanho do prompt completo (antes do corte do histórico) para a previsão de latência
+    routing_context["prompt_chars"] = len(system_prompt) + len(message) + sum(
+        len(turn.get("content", "")) for turn in history
+    )
+
     router = get_router()
-    selected_model, routing_info = await router.route_request(message, {"agent": agent_name})
+    selected_model, routing_info = await router.route_request(message, routing_context)
     logger.info(f"Router selected '{selected_model}' for agent '{agent_name}' - {routing_info.get('reason', 'unknown')}")
 
-    # Constrói as mensagens para o agente
-    prompts = load_prompts()
-    system_content = f"{prompts['system_base']}\n\n{prompts['manifesto']}"
-    messages = [{"role": "system", "content": system_content}] + history + [{"role": "user", "content": message}]
+    # Constrói as mensagens para o agente, descartando os turnos mais antigos que não cabem
+    # no maior contexto (o ContextSizer escolhe depois o menor bucket que comporta o prompt)
+    messages, prompt_info = get_prompt_builder().build(
+        selected_model, system_prompt, history, message,
+        num_ctx=get_context_sizer().max_num_ctx(), reserved_output=reserved_output
+    )
+    return selected_model, routing_info, messages, prompt_info
 
+async def run_agent(agent_name: str, agent_instance, model: str, message: str, messages: List[Dict[str, str]],
+                    context: Dict[str, Any]) -> tuple[str, Dict[str, Any]]:
+    """
+    Executa o agente (ou o chat direto, sem agente) em um modelo.
+    Retorna a resposta e modelo usado, uso de tokens, done_reason e fallback.
+    """
     try:
-        agent_map = {
-            "ideator_saas": "agents.ideator_saas.IdeatorAgent",
-            "architect_fullstack": "agents.architect_fullstack.ArchitectFullstackAgent",
-            "builder_web": "agents.builder_web.BuilderAgent",
-            "editor": "agents.editor.EditorAgent",
-            "researcher": "agents.researcher.ResearcherAgent",
-            "dev_fullstack": "agents.dev_fullstack.DevFullstackAgent",
-            "orchestrator": "agents.orchestrator.OrchestratorAgent",
-        }
-        
-        if agent_name not in agent_map:
-            logger.warning(f"Agente '{agent_name}' desconhecido. Usando chat direto.")
-            return await ollama_chat(selected_model, messages)
+        if agent_instance is None:
+            return await ollama_chat_with_routing(model, messages)
 
-        # Importa e instancia o agente dinamicamente
-        module_path, class_name = agent_map[agent_name].rsplit('.', 1)
-        module = __import__(module_path, fromlist=[class_name])
-        AgentClass = getattr(module, class_name)
-        agent_instance = AgentClass()
-        
-        return await agent_instance.process(message=message, messages=messages, model=selected_model, context=context)
+        reply = await agent_instance.process(message=message, messages=messages, model=model, context=context)
+        # Com hedge, a resposta final pode ter vindo do modelo de reserva
+        return reply, {"model_used": agent_instance.last_model or model, "usage": agent_instance.usage,
+                       "done_reason": agent_instance.last_done_reason}
 
     except Exception as agent_error:
         logger.error(f"Erro ao processar com o agente '{agent_name}': {agent_error}", exc_info=True)
         # Fallback para chat direto em caso de erro no agente
-        return await ollama_chat(selected_model, messages)
+        reply, info = await ollama_chat_with_routing(model, messages)
+        info["fallback"] = "direct_chat"
+        return reply, info
+
+async def execute_agent_task(agent_name: str, message: str, history: List[Dict[str, str]], context: Dict[str, Any]) -> tuple[str, Dict[str, Any]]:
+    """
+    Função centralizada para selecionar, instanciar e executar um agente.
+    Em cascata, tenta primeiro o modelo pequeno e só refaz no modelo escolhido quando a resposta parece ruim.
+    Retorna a resposta e os metadados (roteamento, orçamento do prompt, cascata e uso de tokens).
+    """
+    with request_scope(agent=agent_name):
+        agent_instance = try_load_agent(agent_name)
+        system_prompt = agent_instance.system_prompt() if agent_instance else None
+        reserved_output = agent_instance.NUM_PREDICT if agent_instance else None
+        selected_model, routing_info, messages, prompt_info = await prepare_agent_task(
+            agent_name, message, history, system_prompt, context, reserved_output
+        )
+        router = get_router()
+        backup_model = router.get_backup_model(selected_model, routing_info)
+        metadata = {"model_used": selected_model, "backup_model": backup_model, "routing": routing_info, "prompt": prompt_info}
+
+        cascade_model = router.plan_cascade(
+            selected_model, agent_name, routing_info.get("available_models"), routing_info.get("task_complexity")
+        )
+        if cascade_model:
+            cascade_messages, _ = get_prompt_builder().build(
+                cascade_model, system_prompt or base_system_prompt(), history, message,
+                num_ctx=get_context_sizer().max_num_ctx(), reserved_output=reserved_output
+            )
+            # Se o modelo pequeno atrasar o primeiro token, o hedge vai direto ao modelo escolhido
+            with request_scope(backup_model=selected_model):
+                reply, info = await run_agent(agent_name, agent_instance, cascade_model, message, cascade_messages, context)
+            small_tokens = usage_tokens(info.get("usage", {}))
+            reason = None
+            confidence = None
+            if info.get("fallback"):
+                # O agente falhou no modelo pequeno: a resposta do chat direto não é o que foi pedido
+                reason = "fallback"
+            elif info["model_used"] != cascade_model:
+                # O hedge respondeu com o modelo escolhido: resposta final, mas não é acerto da cascata
+                router.record_cascade(agent_name, cascade_model, info["model_used"], "hedged", 0, small_tokens)
+                metadata["cascade"] = {"first_model": cascade_model, "escalated": True,
+                                       "reason": "hedged", "confidence": None}
+                metadata.update({"model_used": info["model_used"], "usage": info.get("usage", {})})
+                return reply, metadata
+            else:
+                reason = escalation_reason(reply, info.get("done_reason"))
+                if reason is None and CASCADE_RATE_CONFIDENCE:
+                    confidence = await rate_confidence(get_ollama_client(), cascade_model, cascade_messages, reply)
+                    if confidence is not None and confidence < CASCADE_MIN_CONFIDENCE:
+                        reason = "low_confidence"
+            metadata["cascade"] = {"first_model": cascade_model, "escalated": reason is not None,
+                                   "reason": reason, "confidence": confidence}
+            if reason is None:
+                router.record_cascade(agent_name, cascade_model, selected_model, None, small_tokens)
+                metadata.update({"model_used": info["model_used"], "usage": info.get("usage", {})})
+                return reply, metadata
+            # Nova instância: o agente guarda histórico e contadores da tentativa anterior
+            agent_instance = try_load_agent(agent_name)
+            first_usage = info.get("usage", {})
+        else:
+            first_usage = None
+
+        # O modelo de reserva recebe a requisição se o primeiro token atrasar (hedge)
+        with request_scope(backup_model=backup_model):
+            reply, info = await run_agent(agent_name, agent_instance, selected_model, message, messages, context)
+        metadata["model_used"] = info["model_used"]
+        metadata["usage"] = info.get("usage", {})
+        if info.get("fallback"):
+            metadata["fallback"] = info["fallback"]
+        if first_usage is not None:
+            router.record_cascade(agent_name, cascade_model, selected_model, metadata["cascade"]["reason"],
+                                  usage_tokens(first_usage), usage_tokens(metadata["usage"]))
+            # Uso total da requisição inclui a tentativa no modelo pequeno
+            usage = dict(metadata["usage"])
+            for key, value in first_usage.items():
+                usage[key] = usage.get(key, 0) + value
+            metadata["usage"] = usage
+        return reply, metadata
+
+async def stream_agent_task(agent_name: str, message: str, history: List[Dict[str, str]], context: Dict[str, Any]):
+    """
+    Versão com streaming de `execute_agent_task`.
+    Produz frames: primeiro o roteamento, depois os tokens e por fim o uso (frame "done", sempre o último).
+    """
+    async for frame in scoped_iter(_stream_agent_frames(agent_name, message, history, context), agent=agent_name):
+        yield frame
+
+async def _stream_agent_frames(agent_name: str, message: str, history: List[Dict[str, str]], context: Dict[str, Any]):
+    start_time = time.time()
+    first_token_time = None
+    agent_instance = try_load_agent(agent_name)
+    system_prompt = agent_instance.system_prompt() if agent_instance else None
+    selected_model, routing_info, messages, prompt_info = await prepare_agent_task(
+        agent_name, message, history, system_prompt, context,
+        agent_instance.NUM_PREDICT if agent_instance else None
+    )
+    yield {"type": "routing", "agent": agent_name, "model": selected_model, "routing": routing_info, "prompt": prompt_info}
+
+    backup_model = get_router().get_backup_model(selected_model, routing_info)
+    model_used = selected_model
+    usage: Dict[str, int] = {}
+    emitted = False
+    fallback = None
+    error = None
+
+    try:
+        if agent_instance is None:
+            fallback = "direct_chat"
+        else:
+            # Tokens do agente chegam por uma fila; None sinaliza o fim do processamento
+            queue: asyncio.Queue = asyncio.Queue()
+            agent_instance.token_sink = queue.put_nowait
+            # A task copia o contexto na criação: o modelo de reserva (hedge) vale para todo o agente
+            with request_scope(backup_model=backup_model):
+                task = asyncio.create_task(
+                    agent_instance.process(message=message, messages=messages, model=selected_model, context=context)
+                )
+            task.add_done_callback(lambda _: queue.put_nowait(None))
+            try:
+                while (token := await queue.get()) is not None:
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                    emitted = True
+                    yield {"type": "token", "content": token}
+                reply = task.result()
+            finally:
+                if not task.done():
+                    task.cancel()
+            usage = agent_instance.usage
+            model_used = agent_instance.last_model or model_used
+            # Agentes que não transmitem (builder, editor...) entregam a resposta de uma vez
+            if not emitted and reply:
+                first_token_time = time.time()
+                yield {"type": "token", "content": reply}
+    except Exception as agent_error:
+        logger.error(f"Erro ao processar com o agente '{agent_name}': {agent_error}", exc_info=True)
+        if emitted:
+            # Tokens já enviados não podem ser refeitos no chat direto: o erro vai antes do frame final
+            error = str(agent_error)
+            yield {"type": "error", "detail": error}
+        else:
+            fallback = "direct_chat"
+
+    if fallback:
+        async for chunk in scoped_iter(ollama_chat_stream(selected_model, messages), backup_model=backup_model):
+            token = chunk.get("message", {}).get("content", "")
+            if token:
+                if first_token_time is None:
+                    first_token_time = time.time()
+                yield {"type": "token", "content": token}
+            if chunk.get("done"):
+                accumulate_usage(usage, chunk)
+                model_used = chunk.get("model", model_used)
+
+    end_time = time.time()
+    yield {
+        "type": "done",
+        "model_used": model_used,
+        "agent": agent_name,
+        "usage": usage,
+        "fallback": fallback,
+        "error": error,
+        "timing": {
+            "time_to_first_token": round(first_token_time - start_time, 3) if first_token_time else None,
+            "total_time": round(end_time - start_time, 3)
+        }
+    }
 
 
 # Configurações
-OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
 DEV_MODEL = os.getenv("DEV_MODEL", "qwen2.5:7b")
 REFLEX_MODEL = os.getenv("REFLEX_MODEL", "phi3:3.8b")
 DATA_DIR = Path("/app/data")
@@ -100,6 +364,7 @@ class ChatRequest(BaseModel):
     task_type: Optional[str] = None
     complexity: Optional[str] = None
     context: Optional[Dict[str, Any]] = None
+    conversation_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     reply: str
@@ -130,80 +395,130 @@ class ProjectRequest(BaseModel):
 class RenameProjectRequest(BaseModel):
     new_project_name: str
 
+class RoutingFeedback(BaseModel):
+    message: str
+    task_type: Optional[str] = None
+    task_complexity: Optional[str] = None
+
 # Utilitários para Ollama com roteamento inteligente
-async def ollama_chat_with_routing(model: str, messages: List[Dict[str, str]], stream: bool = False, 
+async def ollama_chat_with_routing(model: str, messages: List[Dict[str, str]],
                                   routing_context: Dict[str, Any] = None) -> tuple[str, Dict[str, Any]]:
     """Envia mensagens para o Ollama com sistema de roteamento avançado"""
     start_time = time.time()
     success = False
+    cancelled = False
+    cached = False
+    usage = None
     router = get_router()
     
     try:
         payload = {
             "model": model,
             "messages": messages,
-            "stream": stream,
             "options": {
                 "temperature": 0.7,
                 "top_p": 0.9,
-                "top_k": 40
+                "top_k": 40,
+                "num_ctx": get_context_sizer().select_for_messages(model, messages)
             }
         }
         
-        response = requests.post(
-            f"{OLLAMA_URL}/api/chat", 
-            json=payload, 
+        data = await get_ollama_client().chat(
+            model=payload["model"],
+            messages=payload["messages"],
+            options=payload["options"],
             timeout=120
         )
-        response.raise_for_status()
-        
-        data = response.json()
         content = data.get("message", {}).get("content", "")
         success = True
+        # Com hedge, a resposta pode ter vindo do modelo de reserva
+        model = data.get("model", model)
+        usage = extract_usage(data)
+        cached = data.get("cached", False)
         
-        return content, {"model_used": model, "success": True}
+        return content, {"model_used": model, "success": True, "usage": usage,
+                         "done_reason": data.get("done_reason")}
     
-    except requests.exceptions.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logger.error(f"Erro ao comunicar com Ollama: {e}")
         raise HTTPException(status_code=503, detail=f"Ollama indisponível: {str(e)}")
     
+    except asyncio.CancelledError:
+        # Cancelamento pelo cliente não conta como falha do modelo
+        cancelled = True
+        raise
+    
     finally:
         # Update model performance metrics
         response_time = time.time() - start_time
-        router.update_model_metrics(model, success, response_time)
+        # Respostas do cache não medem o modelo
+        if not cancelled and not cached:
+            router.update_model_metrics(model, success, response_time, usage)
 
-async def ollama_chat(model: str, messages: List[Dict[str, str]], stream: bool = False) -> str:
+async def ollama_chat(model: str, messages: List[Dict[str, str]]) -> str:
     """Backward compatibility wrapper"""
-    content, _ = await ollama_chat_with_routing(model, messages, stream)
+    content, _ = await ollama_chat_with_routing(model, messages)
     return content
 
+def warm_plan_models(plan_json: str):
+    """Aquece os modelos dos agentes que executarão os passos de um plano do Orquestrador"""
+    try:
+        steps = json.loads(plan_json).get("plan", [])
+    except (json.JSONDecodeError, AttributeError):
+        return
+    residency = get_residency_manager()
+    for agent_name in {step.get("agent") for step in steps if isinstance(step, dict)}:
+        if agent_name:
+            residency.warm_for_agent(agent_name)
+
+async def ollama_chat_stream(model: str, messages: List[Dict[str, str]]):
+    """Chat direto com streaming; produz os chunks do Ollama e atualiza as métricas do router"""
+    start_time = time.time()
+    success = False
+    cancelled = False
+    usage = None
+    router = get_router()
+    
+    try:
+        async for chunk in get_ollama_client().chat_stream(
+            model=model,
+            messages=messages,
+            options={
+                "temperature": 0.7,
+                "top_p": 0.9,
+                "top_k": 40,
+                "num_ctx": get_context_sizer().select_for_messages(model, messages)
+            }
+        ):
+            if chunk.get("done"):
+                model = chunk.get("model", model)
+                usage = extract_usage(chunk)
+            yield chunk
+        success = True
+    except (asyncio.CancelledError, GeneratorExit):
+        # Cancelamento pelo cliente não conta como falha do modelo
+        cancelled = True
+        raise
+    finally:
+        if not cancelled:
+            router.update_model_metrics(model, success, time.time() - start_time, usage)
+
 def load_prompts() -> Dict[str, str]:
-    """Carrega prompts do diretório"""
+    """Carrega prompts do diretório (arquivos em cache até serem modificados)"""
     prompts = {}
-    prompts_dir = Path("prompts")
     
     try:
         # Manifesto Sincerta
-        manifesto_path = prompts_dir / "manifesto_sincerta.md"
-        if manifesto_path.exists():
-            prompts["manifesto"] = manifesto_path.read_text(encoding="utf-8")
-        else:
-            prompts["manifesto"] = "Seja direto, técnico e honesto."
+        manifesto = read_prompt_file("manifesto_sincerta.md")
+        prompts["manifesto"] = manifesto if manifesto is not None else "Seja direto, técnico e honesto."
         
         # System base
-        system_path = prompts_dir / "system_base.md"
-        if system_path.exists():
-            prompts["system_base"] = system_path.read_text(encoding="utf-8")
-        else:
-            prompts["system_base"] = "Você é um assistente técnico especializado."
+        system_base = read_prompt_file("system_base.md")
+        prompts["system_base"] = system_base if system_base is not None else "Você é um assistente técnico especializado."
             
         # Styles
-        styles_path = prompts_dir / "styles.json"
-        if styles_path.exists():
-            styles_content = styles_path.read_text(encoding="utf-8")
-            prompts["styles"] = json.loads(styles_content)
-        else:
-            prompts["styles"] = {}
+        styles_content = read_prompt_file("styles.json")
+        prompts["styles"] = json.loads(styles_content) if styles_content is not None else {}
             
     except Exception as e:
         logger.warning(f"Erro ao carregar prompts: {e}")
@@ -280,9 +595,9 @@ async def health_check():
     """Verifica saúde da API e conectividade com Ollama"""
     try:
         # Teste conectividade Ollama
-        response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=5)
-        ollama_status = "ok" if response.status_code == 200 else "error"
-        models_count = len(response.json().get("models", [])) if ollama_status == "ok" else 0
+        models = await get_ollama_client().list_models(timeout=5)
+        ollama_status = "ok"
+        models_count = len(models)
         
         return {
             "api_status": "ok",
@@ -302,10 +617,7 @@ async def health_check():
 async def list_models():
     """Lista modelos disponíveis no Ollama"""
     try:
-        response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=10)
-        response.raise_for_status()
-        
-        models = response.json().get("models", [])
+        models = await get_ollama_client().list_models(timeout=10)
         return [
             ModelInfo(
                 name=model["name"],
@@ -374,26 +686,30 @@ async def list_agents():
     return agents
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, http_request: Request):
     """Endpoint principal para chat com agentes - com roteamento inteligente"""
-    try:
+    project = (request.context or {}).get("project_name")
+    conversation = conversation_key(request.conversation_id, request.history, request.message)
+
+    async def handle() -> ChatResponse:
         if request.agent == "auto":
             # O modo "Auto" agora invoca o Orquestrador para criar um plano
             from agents.orchestrator import OrchestratorAgent
             orchestrator = OrchestratorAgent()
             plan_json = await orchestrator.process_message(request.message, request.context)
-            
+            warm_plan_models(plan_json)
+        
             # Por enquanto, apenas retornamos o plano para o frontend
             # A execução passo a passo será a próxima etapa
             return ChatResponse(
                 reply=f"ORCHESTRATOR_PLAN|{plan_json}",
-                model_used=orchestrator.default_model,
+                model_used=orchestrator.plan_model,
                 agent="orchestrator",
                 metadata={"plan": json.loads(plan_json)}
             )
         else:
             # Execução de agente único (como antes, mas usando a função refatorada)
-            reply = await execute_agent_task(
+            reply, metadata = await execute_agent_task(
                 agent_name=request.agent,
                 message=request.message,
                 history=request.history,
@@ -401,15 +717,69 @@ async def chat_endpoint(request: ChatRequest):
             )
             return ChatResponse(
                 reply=reply,
-                model_used="varied", # O roteador decide
+                model_used=metadata["model_used"], # O roteador decide
                 agent=request.agent,
-                metadata={}
+                metadata=metadata
             )
+
+    try:
+        with request_scope(priority=Priority.INTERACTIVE, project=project, conversation=conversation):
+            # Se o cliente desconectar, o agente e as gerações no Ollama são cancelados
+            return await run_until_disconnect(http_request, handle(), "chat", request.agent)
         
+    except ClientDisconnected:
+        return Response(status_code=499)
     except Exception as e:
         logger.error(f"Erro no chat: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Chat com streaming de tokens (NDJSON).
+    Frames: {"type": "routing"} → {"type": "token"}* → {"type": "done"}; em caso de falha,
+    um {"type": "error"} vem antes do "done", que é sempre o último frame.
+    """
+    async def frames():
+        if request.agent == "auto":
+            from agents.orchestrator import OrchestratorAgent
+            orchestrator = OrchestratorAgent()
+            yield {"type": "routing", "agent": "orchestrator", "model": orchestrator.default_model, "routing": {"reason": "orchestrator_plan"}}
+            plan_json = await orchestrator.process_message(request.message, request.context)
+            warm_plan_models(plan_json)
+            yield {"type": "token", "content": f"ORCHESTRATOR_PLAN|{plan_json}"}
+            yield {"type": "done", "model_used": orchestrator.plan_model, "agent": "orchestrator", "usage": orchestrator.usage, "plan": json.loads(plan_json)}
+            return
+        async for frame in stream_agent_task(
+            agent_name=request.agent,
+            message=request.message,
+            history=request.history,
+            context=request.context or {}
+        ):
+            yield frame
+
+    async def ndjson():
+        project = (request.context or {}).get("project_name")
+        conversation = conversation_key(request.conversation_id, request.history, request.message)
+        finished = False
+        try:
+            async for frame in scoped_iter(frames(), priority=Priority.INTERACTIVE, project=project,
+                                           conversation=conversation):
+                finished = frame["type"] == "done"
+                yield json.dumps(frame, ensure_ascii=False) + "\n"
+        except asyncio.CancelledError:
+            # Desconexão do cliente: o Starlette cancela o gerador, que fecha os streams do Ollama
+            get_cancellation_stats().record("chat_stream", request.agent)
+            raise
+        except Exception as e:
+            logger.error(f"Erro no chat com streaming: {e}", exc_info=True)
+            detail = f"Erro interno: {str(e)}"
+            yield json.dumps({"type": "error", "detail": detail}, ensure_ascii=False) + "\n"
+            if not finished:
+                yield json.dumps({"type": "done", "agent": request.agent, "error": detail}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
 class TaskRequest(BaseModel):
     agent: str
     prompt: str
@@ -417,19 +787,26 @@ class TaskRequest(BaseModel):
     step: int # Para referência
 
 @app.post("/execute_task")
-async def execute_task_endpoint(request: TaskRequest):
+async def execute_task_endpoint(request: TaskRequest, http_request: Request):
     """Executa uma única tarefa de um plano usando um agente específico."""
     try:
         # O histórico é construído a partir do projeto atual para dar contexto
         history = get_conversation_history(request.project_name)
         
         # O 'message' aqui é o prompt detalhado do passo do plano
-        reply = await execute_agent_task(
-            agent_name=request.agent,
-            message=request.prompt,
-            history=history,
-            context={"project_name": request.project_name}
-        )
+        with request_scope(priority=Priority.AGENT_STEP, project=request.project_name,
+                           conversation=request.project_name):
+            reply, _ = await run_until_disconnect(
+                http_request,
+                execute_agent_task(
+                    agent_name=request.agent,
+                    message=request.prompt,
+                    history=history,
+                    context={"project_name": request.project_name}
+                ),
+                "execute_task",
+                request.agent
+            )
         
         # Salva o resultado da execução no histórico do projeto
         history.append({"role": "user", "content": f"Executando tarefa: {request.prompt}"})
@@ -437,6 +814,8 @@ async def execute_task_endpoint(request: TaskRequest):
         save_conversation_history(request.project_name, history)
 
         return {"status": "success", "reply": reply}
+    except ClientDisconnected:
+        return Response(status_code=499)
     except Exception as e:
         logger.error(f"Erro ao executar tarefa: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Erro ao executar tarefa: {str(e)}")
@@ -542,6 +921,14 @@ async def get_routing_stats():
     try:
         router = get_router()
         stats = router.get_routing_stats()
+        stats["ollama_client"] = get_ollama_client().get_stats()
+        stats["llm_cache"] = get_llm_cache().get_stats()
+        stats["scheduler"] = get_scheduler().get_stats()
+        stats["residency"] = get_residency_manager().get_stats()
+        stats["context_sizer"] = get_context_sizer().get_stats()
+        stats["cancellations"] = get_cancellation_stats().get_stats()
+        stats["structured_output"] = get_structured_output_stats().get_stats()
+        stats["state"] = get_router_state_store().get_stats()
         
         # Add available models check
         available_models = await router.get_available_models()
@@ -575,6 +962,7 @@ async def analyze_routing_request(
             "task_type": task_type.value,
             "task_complexity": task_complexity.value,
             "routing_decision": routing_info,
+            "classification": routing_info.get("classification"),
             "analysis": {
                 "message_length": len(message),
                 "context_provided": context is not None,
@@ -644,7 +1032,7 @@ async def test_model_routing(
         selected_model, routing_info = await router.route_request(message, routing_context)
         
         # Test model availability
-        model_available = await router.is_model_available(selected_model)
+        model_available = router.is_model_available(selected_model)
         
         # Get fallback if needed
         fallback_model = None
@@ -677,6 +1065,7 @@ async def benchmark_models(
     """Executa benchmark dos modelos com mensagens de teste"""
     try:
         router = get_router()
+        client = get_ollama_client()
         available_models = await router.get_available_models()
         
         if not available_models:
@@ -699,30 +1088,23 @@ async def benchmark_models(
                     try:
                         start_time = time.time()
                         
-                        # Simple test message
-                        test_payload = {
-                            "model": model,
-                            "messages": [{"role": "user", "content": message[:100]}],  # Limit message size
-                            "stream": False
-                        }
-                        
-                        response = requests.post(
-                            f"{OLLAMA_URL}/api/chat",
-                            json=test_payload,
-                            timeout=30  # Shorter timeout for benchmarking
-                        )
+                        # Simple test message (benchmarks never take slots ahead of users)
+                        with request_scope(priority=Priority.BATCH, project="benchmark"):
+                            await client.chat(
+                                model=model,
+                                messages=[{"role": "user", "content": message[:100]}],  # Limit message size
+                                timeout=30  # Shorter timeout for benchmarking
+                            )
                         
                         response_time = time.time() - start_time
-                        
-                        if response.status_code == 200:
-                            model_results["successful_tests"] += 1
-                            model_results["response_times"].append(response_time)
-                        else:
-                            model_results["failed_tests"] += 1
-                            model_results["errors"].append(f"HTTP {response.status_code}")
-                        
+                        model_results["successful_tests"] += 1
+                        model_results["response_times"].append(response_time)
                         model_results["total_tests"] += 1
                         
+                    except aiohttp.ClientResponseError as e:
+                        model_results["failed_tests"] += 1
+                        model_results["total_tests"] += 1
+                        model_results["errors"].append(f"HTTP {e.status}")
                     except Exception as e:
                         model_results["failed_tests"] += 1
                         model_results["total_tests"] += 1
@@ -757,70 +1139,29 @@ async def benchmark_models(
 @app.get("/routing/examples")
 async def get_routing_examples():
     """Retorna exemplos de roteamento para diferentes tipos de tarefa"""
-    examples = [
-        {
-            "category": "Ideação de SaaS",
-            "messages": [
-                "Preciso de uma ideia para um SaaS de gestão de projetos para startups",
-                "Quero criar um app que resolva problemas de comunicação em equipes remotas",
-                "Gere uma ideia inovadora para marketplace de serviços digitais"
-            ],
-            "expected_agent": "ideator",
-            "expected_complexity": "medium",
-            "expected_models": ["qwen2.5:7b", "llama3.1:8b-instruct"]
-        },
-        {
-            "category": "Arquitetura de Sistema",
-            "messages": [
-                "Design a arquitetura para um sistema de e-commerce enterprise com microservices",
-                "Preciso de uma arquitetura escalável para uma plataforma de streaming",
-                "Como estruturar um sistema de chat em tempo real com alta disponibilidade"
-            ],
-            "expected_agent": "architect",
-            "expected_complexity": "expert",
-            "expected_models": ["llama3.1:8b-instruct", "qwen2.5:7b"]
-        },
-        {
-            "category": "Desenvolvimento de Código",
-            "messages": [
-                "Crie um projeto React com TypeScript e setup completo",
-                "Gere o scaffolding para uma API FastAPI com autenticação JWT",
-                "Build um app Flutter com navegação e gerenciamento de estado"
-            ],
-            "expected_agent": "builder",
-            "expected_complexity": "complex",
-            "expected_models": ["codegemma:7b", "llama3.1:8b-instruct"]
-        },
-        {
-            "category": "Desenvolvimento Simples",
-            "messages": [
-                "Crie uma função Python para calcular fibonacci",
-                "Faça um componente React básico de botão",
-                "Escreva um endpoint FastAPI simples para health check"
-            ],
-            "expected_agent": "dev_fullstack",
-            "expected_complexity": "simple",
-            "expected_models": ["phi3:3.8b", "qwen2.5:7b"]
-        },
-        {
-            "category": "Análise e Planejamento",
-            "messages": [
-                "Analise os prós e contras de usar microservices vs monolito",
-                "Revise esta arquitetura e sugira melhorias de performance",
-                "Faça uma análise estratégica deste plano de produto"
-            ],
-            "expected_agent": "reflexivo",
-            "expected_complexity": "complex",
-            "expected_models": ["llama3.1:8b-instruct", "qwen2.5:7b"]
-        }
-    ]
-    
     return {
-        "routing_examples": examples,
+        "routing_examples": ROUTING_EXAMPLES,
         "usage": "Use esses exemplos para testar o sistema de roteamento em /routing/test",
         "note": "O sistema escolhe automaticamente o modelo baseado na complexidade e tipo da tarefa"
     }
 
+@app.post("/routing/feedback")
+async def routing_feedback(feedback: RoutingFeedback):
+    """Registra o tipo/complexidade corretos de uma mensagem (tráfego rotulado do classificador)"""
+    task_types = {task_type.value for task_type in TaskType}
+    complexities = {complexity.value for complexity in TaskComplexity}
+    if not feedback.task_type and not feedback.task_complexity:
+        raise HTTPException(status_code=400, detail="Informe task_type e/ou task_complexity")
+    if feedback.task_type and feedback.task_type not in task_types:
+        raise HTTPException(status_code=400, detail=f"task_type inválido; use um de {sorted(task_types)}")
+    if feedback.task_complexity and feedback.task_complexity not in complexities:
+        raise HTTPException(status_code=400, detail=f"task_complexity inválido; use um de {sorted(complexities)}")
+    
+    centroids_updated = await get_task_classifier().add_label(
+        feedback.message, feedback.task_type, feedback.task_complexity
+    )
+    return {"stored": True, "centroids_updated": centroids_updated}
+
 @app.get("/")
 async def root():
     """Endpoint raiz com informações da API"""
@@ -837,10 +1178,12 @@ async def root():
     
     endpoints_dict = {
         "chat": "/chat - Chat principal com agentes",
+        "chat_stream": "/chat/stream - Chat com streaming de tokens (NDJSON)",
         "agents": "/agents - Lista agentes disponíveis",
         "models": "/models - Lista modelos Ollama",
         "routing_stats": "/routing/stats - Estatísticas do roteamento",
         "routing_examples": "/routing/examples - Exemplos de uso",
+        "routing_feedback": "/routing/feedback - Rotula uma mensagem para o classificador de tarefas",
         "health": "/health - Status da API"
     }
     
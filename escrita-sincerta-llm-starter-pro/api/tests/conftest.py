@@ -0,0 +1,67 @@
+"""
+Configuração dos testes da API (rodar do diretório api: `python -m pytest -q`)
+O Ollama dos testes ponta a ponta é o simulado (tools.fake_ollama) em uma porta livre;
+as variáveis são definidas antes de qualquer import dos módulos da API.
+As fixtures `fake_ollama` e `client` sobem o servidor simulado e a API por módulo de teste.
+"""
+
+import os
+import sys
+import time
+import socket
+import threading
+from pathlib import Path
+
+import pytest
+
+API_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(API_DIR))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+FAKE_OLLAMA_PORT = _free_port()
+os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{FAKE_OLLAMA_PORT}"
+os.environ.pop("OLLAMA_URLS", None)
+os.environ.setdefault("OLLAMA_PRELOAD_MODELS", "false")
+os.environ.setdefault("ROUTER_STATE_ENABLED", "false")
+os.environ.setdefault("ROUTER_SHARED_STATE_ENABLED", "false")
+
+
+@pytest.fixture(scope="module")
+def fake_ollama():
+    import uvicorn
+    from tools.fake_ollama import create_app
+
+    app = create_app(speed=50)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=FAKE_OLLAMA_PORT, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        assert time.monotonic() < deadline, "Ollama simulado não iniciou"
+        time.sleep(0.05)
+    yield app.state.fake
+    server.should_exit = True
+    thread.join(5)
+
+
+@pytest.fixture(scope="module")
+def client(fake_ollama, tmp_path_factory):
+    from fastapi.testclient import TestClient
+
+    # A API grava histórico e estado em caminhos relativos: roda em um diretório temporário
+    workdir = tmp_path_factory.mktemp("api")
+    (workdir / "prompts").symlink_to(API_DIR / "prompts")
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import app as api
+        with TestClient(api.app) as test_client:
+            yield test_client
+    finally:
+        os.chdir(previous)
@@ -0,0 +1,80 @@
+"""
+Cancelamento por desconexão do cliente: trabalho do endpoint e geração no Ollama simulado
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from conftest import FAKE_OLLAMA_PORT
+from tools import cancellation
+from tools.cancellation import CancellationStats, ClientDisconnected, run_until_disconnect
+from tools.ollama_client import OllamaClient
+from tools.ollama_pool import NodePool
+
+
+class FakeRequest:
+    """Request do Starlette que desconecta depois de `after` verificações"""
+
+    def __init__(self, after=None):
+        self.after = after
+        self.checks = 0
+
+    async def is_disconnected(self) -> bool:
+        self.checks += 1
+        return self.after is not None and self.checks > self.after
+
+
+@pytest.fixture(autouse=True)
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(cancellation, "DISCONNECT_POLL_INTERVAL", 0.01)
+    stats = CancellationStats()
+    monkeypatch.setattr(cancellation, "get_cancellation_stats", lambda: stats)
+    return stats
+
+
+def test_result_is_returned_while_connected():
+    async def work():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    assert asyncio.run(run_until_disconnect(FakeRequest(), work(), "chat")) == "ok"
+
+
+def test_disconnect_cancels_the_work(fast_poll):
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    with pytest.raises(ClientDisconnected):
+        asyncio.run(run_until_disconnect(FakeRequest(after=2), work(), "chat", "dev_fullstack"))
+    assert cancelled == [True]
+    assert fast_poll.get_stats() == {"total": 1, "by_endpoint": {"chat": 1}, "by_agent": {"dev_fullstack": 1}}
+
+
+def test_closing_a_stream_stops_the_ollama_generation(fake_ollama, monkeypatch):
+    # Geração lenta: ~10s simulados para 128 tokens
+    monkeypatch.setitem(fake_ollama.profiles["phi3:3.8b"], "tokens_per_second", 0.25)
+    cancelled = fake_ollama.stats["cancelled"]
+
+    async def scenario():
+        client = OllamaClient(NodePool([f"http://127.0.0.1:{FAKE_OLLAMA_PORT}"]))
+        try:
+            stream = client.chat_stream("phi3:3.8b", [{"role": "user", "content": "geração longa"}])
+            first = await stream.__anext__()
+            await stream.aclose()
+        finally:
+            await client.close()
+        return first
+
+    assert not asyncio.run(scenario())["done"]
+    deadline = time.monotonic() + 5
+    while fake_ollama.stats["cancelled"] == cancelled:
+        assert time.monotonic() < deadline, "o Ollama simulado não viu a desconexão"
+        time.sleep(0.02)
@@ -0,0 +1,94 @@
+"""
+Cascata de modelos ponta a ponta contra o Ollama simulado: resposta aceita no modelo
+pequeno, escalonamento (saída truncada, falha do agente) e atribuição do hedge.
+"""
+
+import pytest
+
+import advanced_router
+from advanced_router import get_router
+from agents.dev_fullstack import DevFullstackAgent
+from tools.cascade import CASCADE_MODEL, escalation_reason
+from tools.ollama_client import get_ollama_client
+
+MESSAGE = "Explique listas em Python"
+
+
+@pytest.fixture
+def cascade(monkeypatch):
+    monkeypatch.setattr(advanced_router, "CASCADE_ENABLED", True)
+    return get_router().cascade_stats
+
+
+def chat(client, message: str = MESSAGE) -> dict:
+    response = client.post("/chat", json={"agent": "dev_fullstack", "message": message})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_escalation_reason():
+    assert escalation_reason("") == "empty"
+    assert escalation_reason("  \n") == "empty"
+    assert escalation_reason("def f(): ...", "length") == "truncated"
+    assert escalation_reason("Desculpe, não posso ajudar com isso.") == "refusal"
+    assert escalation_reason("Listas guardam itens em ordem.", "stop") is None
+
+
+def test_small_model_reply_is_accepted(client, cascade):
+    accepted = cascade.accepted
+    data = chat(client)
+    assert data["model_used"] == CASCADE_MODEL
+    assert data["reply"].startswith(f"[{CASCADE_MODEL}]")
+    assert data["metadata"]["cascade"] == {"first_model": CASCADE_MODEL, "escalated": False,
+                                           "reason": None, "confidence": None}
+    assert cascade.accepted == accepted + 1
+
+
+def test_truncated_reply_escalates(client, cascade, monkeypatch):
+    # num_predict curto: o simulado corta a resposta (done_reason "length")
+    monkeypatch.setattr(DevFullstackAgent, "NUM_PREDICT", 8)
+    truncated = cascade.escalations["truncated"]
+    data = chat(client, "Explique dicionários em Python")
+    assert data["metadata"]["cascade"]["reason"] == "truncated"
+    assert data["model_used"] != CASCADE_MODEL
+    assert data["reply"].startswith(f"[{data['model_used']}]")
+    assert cascade.escalations["truncated"] == truncated + 1
+    # O uso informado soma as duas tentativas
+    assert data["metadata"]["usage"]["eval_count"] > 8
+
+
+def test_agent_failure_escalates_instead_of_accepting_fallback(client, cascade, monkeypatch):
+    process_message = DevFullstackAgent.process_message
+
+    async def fail_on_small_model(self, message, context=None):
+        if context["model"] == CASCADE_MODEL:
+            raise RuntimeError("falha simulada do agente")
+        return await process_message(self, message, context)
+
+    monkeypatch.setattr(DevFullstackAgent, "process_message", fail_on_small_model)
+    accepted = cascade.accepted
+    data = chat(client, "Explique tuplas em Python")
+    assert data["metadata"]["cascade"]["reason"] == "fallback"
+    assert data["model_used"] != CASCADE_MODEL
+    assert data["reply"].startswith(f"[{data['model_used']}]")
+    assert "fallback" not in data["metadata"]
+    assert cascade.accepted == accepted
+
+
+def test_hedged_reply_is_attributed_to_the_model_that_answered(client, fake_ollama, cascade, monkeypatch):
+    hedger = get_ollama_client().hedger
+    monkeypatch.setattr(hedger, "enabled", True)
+    monkeypatch.setattr(hedger.ttft, "deadline", lambda model: 0.05)
+    # O modelo pequeno demora ~2s para o primeiro token; o hedge vai ao modelo escolhido
+    monkeypatch.setitem(fake_ollama.profiles[CASCADE_MODEL], "ttft", 100)
+    accepted = cascade.accepted
+    hedged = cascade.escalations["hedged"]
+    wins = hedger.stats["hedge_wins"]
+
+    data = chat(client, "Explique conjuntos em Python")
+    assert data["model_used"] != CASCADE_MODEL
+    assert data["reply"].startswith(f"[{data['model_used']}]")
+    assert data["metadata"]["cascade"]["reason"] == "hedged"
+    assert hedger.stats["hedge_wins"] == wins + 1
+    assert cascade.escalations["hedged"] == hedged + 1
+    assert cascade.accepted == accepted
@@ -0,0 +1,52 @@
+"""
+Smoke test ponta a ponta: /chat e /chat/stream da API contra o Ollama simulado
+(fixtures `fake_ollama` e `client` do conftest).
+"""
+
+import json
+
+
+def test_chat_routes_and_replies(client, fake_ollama):
+    requests_before = fake_ollama.stats["requests"]
+    response = client.post("/chat", json={"agent": "dev_fullstack", "message": "Crie uma função Python simples"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["agent"] == "dev_fullstack"
+    assert data["reply"].startswith(f"[{data['model_used']}]")
+    assert data["model_used"] in fake_ollama.profiles
+    assert fake_ollama.stats["requests"] > requests_before
+
+
+def test_chat_stream_frames(client):
+    with client.stream("POST", "/chat/stream",
+                       json={"agent": "dev_fullstack", "message": "Explique listas em Python"}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        frames = [json.loads(line) for line in response.iter_lines() if line]
+    types = [frame["type"] for frame in frames]
+    assert types[0] == "routing"
+    assert types[-1] == "done"
+    assert "error" not in types
+    tokens = "".join(frame["content"] for frame in frames if frame["type"] == "token")
+    assert tokens.startswith(f"[{frames[-1]['model_used']}]")
+
+
+def test_routing_stats_after_traffic(client):
+    response = client.get("/routing/stats")
+    assert response.status_code == 200
+    assert sum(metrics["total_requests"] for metrics in response.json()["model_metrics"].values()) >= 1
+
+
+def test_prompt_budget_reserves_agent_output(client):
+    from agents.dev_fullstack import DevFullstackAgent
+    from tools.prompt_builder import get_context_sizer
+
+    history = [{"role": "user", "content": "pergunta anterior"}, {"role": "assistant", "content": "resposta anterior"}]
+    response = client.post("/chat", json={"agent": "dev_fullstack", "message": "Explique filas em Python",
+                                          "history": history})
+    assert response.status_code == 200
+    prompt = response.json()["metadata"]["prompt"]
+    # O histórico é limitado pelo maior contexto, não pelo OLLAMA_NUM_CTX padrão
+    assert prompt["num_ctx"] == get_context_sizer().max_num_ctx()
+    assert prompt["reserved_output"] == DevFullstackAgent.NUM_PREDICT
+    assert prompt["history_turns_kept"] == 2
@@ -0,0 +1,50 @@
+from tools import prompt_builder
+from tools.prompt_builder import ContextSizer
+
+BUCKETS = [2048, 4096, 8192]
+
+
+def test_smallest_bucket_that_fits_prompt_and_output():
+    sizer = ContextSizer(buckets=BUCKETS)
+    assert sizer.select("a", 500, num_predict=500) == 2048
+    assert sizer.select("b", 2000, num_predict=100) == 4096
+    assert sizer.select("c", 2048, num_predict=0) == 2048
+    assert sizer.select("d", 6000, num_predict=1000) == 8192
+
+
+def test_default_output_reservation():
+    sizer = ContextSizer(buckets=BUCKETS)
+    assert sizer.select("a", 2048 - prompt_builder.RESERVED_OUTPUT_TOKENS) == 2048
+    assert sizer.select("b", 2049 - prompt_builder.RESERVED_OUTPUT_TOKENS) == 4096
+
+
+def test_overflow_uses_largest_bucket():
+    sizer = ContextSizer(buckets=BUCKETS)
+    assert sizer.select("a", 10000, num_predict=100) == 8192
+    assert sizer.stats["overflows"] == 1
+
+
+def test_recently_used_model_keeps_larger_bucket(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(prompt_builder.time, "time", lambda: now[0])
+    sizer = ContextSizer(buckets=BUCKETS, shrink_after=300)
+    assert sizer.select("m", 5000, num_predict=100) == 8192
+    now[0] += 10
+    # Reduzir o contexto recarregaria o modelo: mantém o bucket enquanto ele é usado
+    assert sizer.select("m", 100, num_predict=100) == 8192
+    now[0] += 301
+    assert sizer.select("m", 100, num_predict=100) == 2048
+    assert sizer.stats["resizes"] == 1
+
+
+def test_growing_prompt_resizes_immediately():
+    sizer = ContextSizer(buckets=BUCKETS)
+    assert sizer.select("m", 100, num_predict=100) == 2048
+    assert sizer.select("m", 3000, num_predict=100) == 4096
+    assert sizer.num_ctx_for("m") == 4096
+    assert sizer.stats["resizes"] == 1
+
+
+def test_num_ctx_for_unknown_model_uses_default_bucket():
+    sizer = ContextSizer(buckets=BUCKETS)
+    assert sizer.num_ctx_for("novo") == sizer.bucket_for(prompt_builder.DEFAULT_NUM_CTX)
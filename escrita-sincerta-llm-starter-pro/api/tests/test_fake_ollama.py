@@ -0,0 +1,29 @@
+import json
+
+import pytest
+
+from tools.fake_ollama import _close_brackets
+
+
+@pytest.mark.parametrize("broken, fixed", [
+    ('{"a": 1', '{"a": 1}'),
+    ('{"a": [1, 2', '{"a": [1, 2]}'),
+    ('{"a": {"b": [{"c": 1}', '{"a": {"b": [{"c": 1}]}}'),
+    ('{"a": 1}', '{"a": 1}'),
+    ('', ''),
+])
+def test_closes_open_brackets_in_order(broken, fixed):
+    assert _close_brackets(broken) == fixed
+
+
+def test_brackets_inside_strings_are_ignored():
+    broken = '{"texto": "use { e [ à vontade", "escape": "aspas \\" e }", "lista": ["]"'
+    fixed = _close_brackets(broken)
+    assert fixed == broken + "]}"
+    assert json.loads(fixed)["escape"] == 'aspas " e }'
+
+
+def test_truncated_plan_becomes_valid_json():
+    plan = {"plan": [{"step": 1, "agent": "builder", "action": "x", "details": {"files": ["a.py"]}}]}
+    text = json.dumps(plan)
+    assert json.loads(_close_brackets(text.rstrip("}"))) == plan
@@ -0,0 +1,97 @@
+"""
+Hedger: vencedor do hedge, failover, orçamento e cancelamento da perna perdedora
+"""
+
+import asyncio
+
+from tools.hedging import Hedger, HedgeBudget, TTFTTracker
+
+
+def make_opener(delays, closed, failures=()):
+    """Streams simulados: `delays[modelo]` segundos até o primeiro token"""
+
+    def open_stream(model):
+        async def stream():
+            try:
+                await asyncio.sleep(delays[model])
+                if model in failures:
+                    raise ConnectionError(f"{model} indisponível")
+                yield {"model": model, "message": {"content": f"[{model}] "}, "done": False}
+                yield {"model": model, "message": {"content": ""}, "done": True, "eval_count": 1}
+            finally:
+                closed.append(model)
+
+        return stream()
+
+    return open_stream
+
+
+def collect(hedger, delays, failures=()):
+    closed = []
+
+    async def scenario():
+        return [chunk async for chunk in hedger.stream("big", "small", make_opener(delays, closed, failures))]
+
+    return asyncio.run(scenario()), closed
+
+
+def fast_hedger(deadline=0.05):
+    hedger = Hedger(enabled=True)
+    hedger.ttft.deadline = lambda model: deadline
+    return hedger
+
+
+def test_primary_within_deadline_is_not_hedged():
+    hedger = fast_hedger()
+    chunks, _ = collect(hedger, {"big": 0, "small": 0})
+    assert {chunk["model"] for chunk in chunks} == {"big"}
+    assert chunks[-1]["done"]
+    assert hedger.stats["hedged"] == 0
+
+
+def test_backup_wins_and_primary_is_closed():
+    hedger = fast_hedger()
+    chunks, closed = collect(hedger, {"big": 5, "small": 0})
+    # Os chunks (incluindo o final) identificam o modelo que respondeu
+    assert {chunk["model"] for chunk in chunks} == {"small"}
+    assert hedger.stats["hedged"] == 1
+    assert hedger.stats["hedge_wins"] == 1
+    assert "big" in closed
+    assert hedger.budget.active == 0
+
+
+def test_primary_failure_fails_over_without_budget():
+    hedger = fast_hedger(deadline=5)
+    hedger.budget.max_concurrent = 0
+    chunks, _ = collect(hedger, {"big": 0, "small": 0}, failures={"big"})
+    assert chunks[0]["model"] == "small"
+    assert hedger.stats["failovers"] == 1
+    assert hedger.stats["hedged"] == 0
+
+
+def test_exhausted_budget_waits_for_primary():
+    hedger = fast_hedger()
+    hedger.budget.max_concurrent = 0
+    chunks, _ = collect(hedger, {"big": 0.2, "small": 0})
+    assert {chunk["model"] for chunk in chunks} == {"big"}
+    assert hedger.stats["budget_denied"] == 1
+
+
+def test_budget_limits_hedge_ratio():
+    budget = HedgeBudget(ratio=0.1, max_concurrent=5)
+    for _ in range(10):
+        budget.note_request()
+    assert budget.try_acquire()
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+    budget.release()
+    assert budget.active == 1
+
+
+def test_deadline_uses_measured_percentile():
+    tracker = TTFTTracker()
+    assert tracker.deadline("big") == 20
+    for ttft in range(1, 21):
+        tracker.record("big", float(ttft))
+    assert tracker.percentile("big", 0.5) == 10
+    assert tracker.deadline("big") == 19
@@ -0,0 +1,49 @@
+"""
+KeywordMatcher: palavra inteira, plurais simples, frases e radicais em uma única passada
+"""
+
+from agents.dev_fullstack import DevFullstackAgent
+from tools.keyword_matcher import KeywordMatcher, normalize
+
+MATCHER = KeywordMatcher({
+    "logic": ["ou", "api"],
+    "debugging": ["bug", "erro", "não funciona"],
+    "devops": ["ci/cd"],
+    "docs": ["documenta*"],
+})
+
+
+def test_whole_words_only():
+    assert MATCHER.find("outro exemplo de rapidez") == {}
+    assert set(MATCHER.find("isto ou aquilo na API?")) == {"ou", "api"}
+
+
+def test_simple_plurals():
+    assert set(MATCHER.find("Vários bugs e erros.")) == {"bug", "erro"}
+    assert "erro" in normalize("erros").words
+
+
+def test_phrases_accept_punctuation_between_words():
+    assert "não funciona" in MATCHER.find("O login não, funciona!")
+    assert "não funciona" not in MATCHER.find("funciona? não")
+    # Frases são devolvidas pelas palavras normalizadas
+    assert MATCHER.find("pipeline de CI-CD") == {"ci cd": ["devops"]}
+
+
+def test_stems_match_word_prefixes():
+    assert "documenta*" in MATCHER.find("documentação da API")
+    assert "documenta*" not in MATCHER.find("sem docs")
+
+
+def test_counts_and_first_follow_declaration_order():
+    assert MATCHER.counts("bug na API, não funciona") == {"logic": 1, "debugging": 2, "devops": 0, "docs": 0}
+    assert MATCHER.first("bug na API") == "logic"
+    assert MATCHER.first("documentar o bug") == "debugging"
+    assert MATCHER.first("nada relevante") is None
+
+
+def test_agent_dispatch_uses_whole_words():
+    dispatch = DevFullstackAgent.DISPATCH
+    assert dispatch.first("o deploy não funciona") == "debugging"
+    # "erro" dentro de "ferrovia" não é mais um pedido de debugging
+    assert dispatch.first("sistema de ferrovia") is None
@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+from tools import latency_sketch
+from tools.latency_sketch import DecayingHistogram, LatencyTracker, DEFAULT_OUTPUT_TOKENS
+
+
+def usage(prompt_tokens=1000, prompt_seconds=1.0, output_tokens=200, output_seconds=4.0, load_seconds=0.0):
+    return {
+        "prompt_eval_count": prompt_tokens,
+        "prompt_eval_duration": int(prompt_seconds * 1e9),
+        "eval_count": output_tokens,
+        "eval_duration": int(output_seconds * 1e9),
+        "load_duration": int(load_seconds * 1e9),
+    }
+
+
+def test_quantiles_within_bucket_resolution():
+    histogram = DecayingHistogram(0.001, 3600)
+    for value in range(1, 101):
+        histogram.record(value / 10)
+    assert histogram.quantile(0.5) == pytest.approx(5.0, rel=0.08)
+    assert histogram.quantile(0.9) == pytest.approx(9.0, rel=0.08)
+    assert histogram.mean() == pytest.approx(5.05)
+
+
+def test_values_outside_range_are_clamped_and_invalid_ignored():
+    histogram = DecayingHistogram(1, 100)
+    histogram.record(0.01)
+    histogram.record(1e9)
+    histogram.record(-1)
+    histogram.record(float("nan"))
+    assert histogram.weight == 2
+    assert histogram.quantile(0.0) == pytest.approx(1, rel=0.08)
+    assert histogram.quantile(1.0) == pytest.approx(100, rel=0.08)
+
+
+def test_old_samples_lose_weight_after_half_life(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(latency_sketch.time, "time", lambda: now[0])
+    histogram = DecayingHistogram(0.001, 3600, half_life=10)
+    for _ in range(8):
+        histogram.record(1.0)
+    now[0] += 10
+    assert histogram.weight == pytest.approx(8.0)  # o decaimento só é aplicado na próxima leitura
+    assert histogram.reliable
+    assert histogram.weight == pytest.approx(4.0)
+    # Amostras novas dominam o quantil depois de algumas meias-vidas
+    now[0] += 30
+    for _ in range(2):
+        histogram.record(10.0)
+    assert histogram.quantile(0.5) == pytest.approx(10.0, rel=0.08)
+
+
+def test_round_trip_keeps_distribution():
+    histogram = DecayingHistogram(0.001, 3600)
+    for value in (0.5, 1.0, 2.0, 4.0):
+        histogram.record(value)
+    restored = DecayingHistogram(0.001, 3600)
+    restored.load(histogram.to_dict())
+    assert restored.weight == pytest.approx(histogram.weight)
+    assert restored.quantile(0.75) == histogram.quantile(0.75)
+
+
+def test_predict_needs_reliable_throughput():
+    tracker = LatencyTracker(quantile=0.9)
+    assert tracker.predict("m", 1000, 200) is None
+    for _ in range(2):
+        tracker.record("m", 5.0, usage())
+    assert tracker.predict("m", 1000, 200) is None
+    tracker.record("m", 5.0, usage())
+    prediction = tracker.predict("m", 1000, 200)
+    # 1000 tokens/s de prefill e 50 tokens/s de geração
+    assert prediction["ttft"] == pytest.approx(1.0, rel=0.1)
+    assert prediction["total"] == pytest.approx(5.0, rel=0.1)
+    assert prediction["load"] == 0.0
+
+
+def test_cold_model_adds_load_time():
+    tracker = LatencyTracker()
+    for _ in range(3):
+        tracker.record("m", 5.0, usage())
+    warm = tracker.predict("m", 1000, 200, resident=True)
+    cold = tracker.predict("m", 1000, 200, resident=False)
+    assert cold["load"] == latency_sketch.DEFAULT_LOAD_TIME
+    assert cold["total"] == pytest.approx(warm["total"] + cold["load"], abs=0.01)
+
+
+def test_expected_output_tokens_per_agent():
+    tracker = LatencyTracker(quantile=0.9)
+    assert tracker.expected_output_tokens("builder") == DEFAULT_OUTPUT_TOKENS
+    for tokens in (100, 100, 100, 1000):
+        tracker.record("m", 5.0, usage(output_tokens=tokens), agent="builder")
+    assert tracker.expected_output_tokens("builder") == pytest.approx(1000, rel=0.08)
+    assert tracker.expected_output_tokens("ideator") == DEFAULT_OUTPUT_TOKENS
+
+
+def test_tracker_round_trip():
+    tracker = LatencyTracker()
+    for _ in range(3):
+        tracker.record("m", 5.0, usage(), agent="builder")
+    restored = LatencyTracker()
+    restored.load(tracker.to_dict())
+    assert restored.predict("m", 1000, 200) == tracker.predict("m", 1000, 200)
+    assert restored.service_time("m") == pytest.approx(5.0, rel=0.01)
@@ -0,0 +1,87 @@
+"""
+Cache persistente de respostas: elegibilidade, chave, TTL, despejo LRU e estatísticas
+"""
+
+import asyncio
+import time
+
+from tools.llm_cache import LLMResponseCache
+
+PAYLOAD = {
+    "model": "phi3:3.8b",
+    "messages": [{"role": "user", "content": "oi"}],
+    "options": {"temperature": 0, "num_ctx": 2048},
+}
+
+
+def make_cache(tmp_path, **kwargs) -> LLMResponseCache:
+    return LLMResponseCache(path=str(tmp_path / "cache" / "llm.sqlite"), enabled=True, **kwargs)
+
+
+def reply(text: str) -> dict:
+    return {"model": "phi3:3.8b", "message": {"role": "assistant", "content": text}, "done": True}
+
+
+def test_only_deterministic_calls_are_cacheable():
+    assert LLMResponseCache.is_cacheable(PAYLOAD)
+    assert LLMResponseCache.is_cacheable({**PAYLOAD, "options": {"temperature": 0.7, "seed": 42}})
+    assert not LLMResponseCache.is_cacheable({**PAYLOAD, "options": {"temperature": 0.7}})
+    assert not LLMResponseCache.is_cacheable({**PAYLOAD, "stream": True})
+
+
+def test_key_covers_model_messages_options_and_format():
+    key = LLMResponseCache.cache_key(PAYLOAD)
+    assert key == LLMResponseCache.cache_key(dict(PAYLOAD))
+    assert key != LLMResponseCache.cache_key({**PAYLOAD, "model": "qwen2.5:7b"})
+    assert key != LLMResponseCache.cache_key({**PAYLOAD, "options": {"temperature": 0, "seed": 1}})
+    assert key != LLMResponseCache.cache_key({**PAYLOAD, "format": "json"})
+
+
+def test_round_trip_and_stats(tmp_path):
+    cache = make_cache(tmp_path)
+
+    async def scenario():
+        assert await cache.get("k") is None
+        await cache.put("k", "phi3:3.8b", reply("olá"))
+        return await cache.get("k")
+
+    assert asyncio.run(scenario()) == reply("olá")
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["stores"]) == (1, 1, 1)
+    assert stats["entries"] == 1
+    assert stats["bytes"] > 0
+
+
+def test_persists_across_instances(tmp_path):
+    asyncio.run(make_cache(tmp_path).put("k", "phi3:3.8b", reply("olá")))
+    cache = make_cache(tmp_path)
+    assert asyncio.run(cache.get("k")) == reply("olá")
+    assert cache.get_stats()["entries"] == 1
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = make_cache(tmp_path, ttl=0)
+
+    async def scenario():
+        await cache.put("k", "phi3:3.8b", reply("olá"))
+        return await cache.get("k")
+
+    assert asyncio.run(scenario()) is None
+    assert cache.stats["expired"] >= 1
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+
+    async def scenario():
+        await cache.put("a", "phi3:3.8b", reply("a"))
+        await cache.put("b", "phi3:3.8b", reply("b"))
+        time.sleep(0.01)
+        await cache.get("a")
+        await cache.put("c", "phi3:3.8b", reply("c"))
+        return [await cache.get(key) is not None for key in ("a", "b", "c")]
+
+    assert asyncio.run(scenario()) == [True, False, True]
+    assert cache.stats["evictions"] == 1
+    assert cache.get_stats()["entries"] == 2
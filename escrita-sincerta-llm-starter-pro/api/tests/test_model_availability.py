@@ -0,0 +1,108 @@
+"""
+AvailabilityRegistry: cooldown após falhas seguidas, inventário dos nós e stale-while-revalidate
+(inventário real lido do Ollama simulado)
+"""
+
+import asyncio
+
+from conftest import FAKE_OLLAMA_PORT
+from tools import model_availability
+from tools.model_availability import AvailabilityRegistry
+from tools.ollama_client import OllamaClient
+from tools.ollama_pool import NodePool
+
+
+def make_registry():
+    return AvailabilityRegistry(NodePool([f"http://127.0.0.1:{FAKE_OLLAMA_PORT}"]))
+
+
+def test_consecutive_failures_take_model_out_of_rotation(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(model_availability.time, "time", lambda: now[0])
+    registry = make_registry()
+    for _ in range(model_availability.AVAILABILITY_MAX_FAILURES - 1):
+        registry.record_failure("phi3:3.8b")
+    assert registry.is_available("phi3:3.8b")
+    version = registry.version
+    registry.record_failure("phi3:3.8b")
+    assert not registry.is_available("phi3:3.8b")
+    assert registry.version == version + 1
+    assert registry.stats["marked_down"] == 1
+    # Fim do cooldown: volta à rotação com a contagem zerada
+    now[0] += model_availability.AVAILABILITY_COOLDOWN + 1
+    assert registry.is_available("phi3:3.8b")
+    assert "phi3:3.8b" not in registry.consecutive_failures
+
+
+def test_success_resets_the_failure_count():
+    registry = make_registry()
+    for _ in range(model_availability.AVAILABILITY_MAX_FAILURES - 1):
+        registry.record_failure("phi3:3.8b")
+    registry.record_success("phi3:3.8b")
+    registry.record_failure("phi3:3.8b")
+    assert registry.is_available("phi3:3.8b")
+    assert registry.stats["marked_down"] == 0
+
+
+def test_mark_down_keeps_the_latest_cooldown(monkeypatch):
+    monkeypatch.setattr(model_availability.time, "time", lambda: 1000.0)
+    registry = make_registry()
+    registry.mark_down("phi3:3.8b", 999.0)
+    assert registry.is_available("phi3:3.8b")
+    registry.mark_down("phi3:3.8b", 1100.0)
+    registry.mark_down("phi3:3.8b", 1050.0)
+    assert registry.down_until["phi3:3.8b"] == 1100.0
+    assert registry.stats["marked_down"] == 1
+    assert not registry.is_available("phi3:3.8b")
+
+
+def test_refresh_reads_the_node_inventory(fake_ollama):
+    registry = make_registry()
+
+    async def scenario():
+        client = OllamaClient(registry.pool)
+        try:
+            await registry.refresh(client)
+        finally:
+            await client.close()
+
+    assert registry.is_available("inexistente:1b")  # inventário desconhecido não exclui nada
+    asyncio.run(scenario())
+    assert registry.installed == set(fake_ollama.profiles)
+    assert registry.version == 1 and registry.is_fresh()
+    assert registry.is_available("phi3:3.8b")
+    assert not registry.is_available("inexistente:1b")
+
+
+def test_stale_inventory_is_served_while_revalidating(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(model_availability.time, "time", lambda: now[0])
+    registry = make_registry()
+    refreshes = []
+
+    async def fake_refresh(client):
+        refreshes.append(client)
+        await asyncio.sleep(0.01)
+        registry.installed = {"qwen2.5:7b"}
+        registry.last_refresh = now[0]
+
+    monkeypatch.setattr(registry, "_safe_refresh", fake_refresh)
+    monkeypatch.setattr(model_availability, "get_ollama_client", lambda: "client")
+
+    async def scenario():
+        first = await registry.inventory()  # primeira consulta espera o refresh
+        now[0] += model_availability.AVAILABILITY_TTL + 1
+        registry.installed = {"phi3:3.8b"}
+        stale = await asyncio.gather(registry.inventory(), registry.inventory())
+        await registry._revalidation
+        return first, stale, await registry.inventory()
+
+    first, stale, fresh = asyncio.run(scenario())
+    assert first == {"qwen2.5:7b"}
+    assert stale == [{"phi3:3.8b"}, {"phi3:3.8b"}]
+    assert fresh == {"qwen2.5:7b"}
+    # Consultas vencidas simultâneas compartilham um único refresh
+    assert len(refreshes) == 2
+    assert registry.stats["inventory_blocking"] == 1
+    assert registry.stats["inventory_stale"] == 2
+    assert registry.stats["inventory_fresh"] == 1
@@ -0,0 +1,99 @@
+"""
+Descoberta de modelos do router: inventário servido pelo registro de disponibilidade,
+sem chamadas HTTP em regime, e sessão HTTP única do cliente Ollama
+"""
+
+import asyncio
+
+from conftest import FAKE_OLLAMA_PORT
+from advanced_router import AdvancedRouter
+from tools import model_availability
+from tools.model_availability import AvailabilityRegistry
+from tools.ollama_client import OllamaClient
+from tools.ollama_pool import NodePool
+
+
+def run_with_router(monkeypatch, scenario, url=f"http://127.0.0.1:{FAKE_OLLAMA_PORT}"):
+    """Router com registro e cliente próprios, contando as consultas de inventário aos nós"""
+    client = OllamaClient(NodePool([url]))
+    inventory_checks = []
+    check_all = client.pool.check_all
+
+    async def counting_check_all(ollama_client):
+        inventory_checks.append(ollama_client)
+        await check_all(ollama_client)
+
+    monkeypatch.setattr(client.pool, "check_all", counting_check_all)
+    monkeypatch.setattr(model_availability, "get_ollama_client", lambda: client)
+    router = AdvancedRouter()
+    router.client = client
+    router.availability = AvailabilityRegistry(client.pool)
+
+    async def main():
+        try:
+            return await scenario(router)
+        finally:
+            await client.close()
+
+    return router, asyncio.run(main()), inventory_checks
+
+
+def test_only_the_first_lookup_waits_on_ollama(fake_ollama, monkeypatch):
+    async def scenario(router):
+        return [await router.get_available_models() for _ in range(20)]
+
+    router, results, inventory_checks = run_with_router(monkeypatch, scenario)
+    expected = [model for model in router.model_configs if model in fake_ollama.profiles]
+    assert results == [expected] * 20
+    assert len(inventory_checks) == 1
+    stats = router.availability.stats
+    assert (stats["inventory_blocking"], stats["inventory_fresh"]) == (1, 19)
+
+
+def test_expired_inventory_refreshes_once_in_background(fake_ollama, monkeypatch):
+    async def scenario(router):
+        await router.get_available_models()
+        # Inventário vencido: todas as consultas respondem na hora e dividem um refresh
+        router.availability.last_refresh -= model_availability.AVAILABILITY_TTL + 1
+        results = await asyncio.gather(*(router.get_available_models() for _ in range(10)))
+        await router.availability._revalidation
+        return results
+
+    router, results, inventory_checks = run_with_router(monkeypatch, scenario)
+    assert all(result == results[0] for result in results)
+    assert len(inventory_checks) == 2
+    assert router.availability.stats["inventory_stale"] == 10
+    assert router.availability.is_fresh()
+
+
+def test_models_in_cooldown_are_left_out(fake_ollama, monkeypatch):
+    async def scenario(router):
+        for _ in range(model_availability.AVAILABILITY_MAX_FAILURES):
+            router.availability.record_failure("phi3:3.8b")
+        return await router.get_available_models()
+
+    _, available, _ = run_with_router(monkeypatch, scenario)
+    assert "phi3:3.8b" not in available
+    assert "qwen2.5:7b" in available
+
+
+def test_unreachable_nodes_assume_all_configured_models(monkeypatch):
+    async def scenario(router):
+        return await router.get_available_models()
+
+    # Porta sem servidor: nenhum nó responde ao inventário
+    router, available, inventory_checks = run_with_router(monkeypatch, scenario, url="http://127.0.0.1:9")
+    assert available == list(router.model_configs)
+    assert len(inventory_checks) == 1
+    assert router.availability.refresh_error
+
+
+def test_client_reuses_a_single_session():
+    async def scenario():
+        client = OllamaClient(NodePool([f"http://127.0.0.1:{FAKE_OLLAMA_PORT}"]))
+        try:
+            return await client.get_session() is await client.get_session()
+        finally:
+            await client.close()
+
+    assert asyncio.run(scenario())
@@ -0,0 +1,98 @@
+"""
+Penalidade de carga: espera prevista na fila e ocupação dos slots descontadas do score,
+com o router distribuindo requisições entre os modelos em vez de empilhá-las em um só
+"""
+
+import time
+import asyncio
+
+from conftest import FAKE_OLLAMA_PORT
+from advanced_router import AdvancedRouter, TaskComplexity, TaskType
+from tools import model_load
+from tools.model_availability import AvailabilityRegistry
+from tools.model_load import expected_wait, load_penalty, requests_ahead
+from tools.ollama_client import OllamaClient
+from tools.ollama_pool import NodePool
+from tools.scheduler import ModelScheduler
+
+
+def load(in_flight=0, queued=0, capacity=2):
+    return {"in_flight": in_flight, "queued": queued, "capacity": capacity}
+
+
+def test_requests_ahead_counts_only_what_exceeds_the_slots():
+    assert requests_ahead(load()) == 0
+    assert requests_ahead(load(in_flight=1)) == 0
+    assert requests_ahead(load(in_flight=2)) == 1
+    assert requests_ahead(load(in_flight=2, queued=3)) == 4
+
+
+def test_expected_wait_uses_service_time_or_default():
+    assert expected_wait(load(in_flight=1), 4.0) == 0.0
+    assert expected_wait(load(in_flight=2, queued=1), 4.0) == 4.0
+    assert expected_wait(load(in_flight=2)) == model_load.DEFAULT_SERVICE_TIME / 2
+
+
+def test_penalty_combines_wait_and_occupancy():
+    assert load_penalty(load()) == 0.0
+    assert load_penalty(load(in_flight=1), 4.0) == model_load.LOAD_IN_FLIGHT_WEIGHT * 0.5
+    assert load_penalty(load(in_flight=2, queued=1), 4.0) == (
+        model_load.LOAD_WAIT_WEIGHT * 4.0 + model_load.LOAD_IN_FLIGHT_WEIGHT
+    )
+
+
+def make_router() -> AdvancedRouter:
+    """Router com cliente e escalonador próprios e inventário já conhecido (todos os modelos instalados)"""
+    router = AdvancedRouter()
+    router.client = OllamaClient(NodePool([f"http://127.0.0.1:{FAKE_OLLAMA_PORT}"]))
+    # Slots ocupados pelos testes não vazam para o escalonador do processo
+    router.client.scheduler = ModelScheduler()
+    router.availability = AvailabilityRegistry(router.client.pool)
+    router.availability.installed = set(router.model_configs)
+    router.availability.last_refresh = time.time()
+    return router
+
+
+def test_busy_model_loses_the_selection():
+    router = make_router()
+    scheduler = router.client.scheduler
+
+    async def scenario():
+        idle, _ = await router.select_optimal_model(
+            "implementar", task_type=TaskType.CODING, task_complexity=TaskComplexity.MEDIUM)
+        # Todos os slots do escolhido ocupados e uma requisição na fila
+        for _ in range(scheduler.slots_per_model):
+            await scheduler.acquire(idle)
+        waiter = asyncio.create_task(scheduler.acquire(idle))
+        await asyncio.sleep(0)
+        busy, info = await router.select_optimal_model(
+            "implementar", task_type=TaskType.CODING, task_complexity=TaskComplexity.MEDIUM)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        await router.client.close()
+        return idle, busy, info
+
+    idle, busy, info = asyncio.run(scenario())
+    assert busy != idle
+    assert info["all_scores"][idle] < info["all_scores"][busy]
+    assert router.is_busy(idle)
+    assert router.expected_wait(idle) > 0
+
+
+def test_cached_decision_is_not_reused_while_its_model_is_busy():
+    router = make_router()
+    router.routing_cache.clear()
+
+    async def scenario():
+        context = {"agent": "carga_teste"}
+        first, _ = await router.route_request("implementar uma função", context)
+        _, cached = await router.route_request("implementar uma função", context)
+        await router.client.scheduler.acquire(first)
+        _, recomputed = await router.route_request("implementar uma função", context)
+        router.client.scheduler.release(first)
+        await router.client.close()
+        return cached, recomputed
+
+    cached, recomputed = asyncio.run(scenario())
+    assert cached.get("cached")
+    assert not recomputed.get("cached")
@@ -0,0 +1,80 @@
+"""
+ModelResidencyManager: keep_alive de modelos quentes, aprendizado por agente e pré-carga
+(pré-cargas reais contra o Ollama simulado)
+"""
+
+import asyncio
+
+from conftest import FAKE_OLLAMA_PORT
+from tools import model_residency
+from tools.ollama_client import OllamaClient
+from tools.ollama_pool import NodePool
+
+
+def run_with_residency(scenario):
+    async def main():
+        client = OllamaClient(NodePool([f"http://127.0.0.1:{FAKE_OLLAMA_PORT}"]))
+        try:
+            return await scenario(client.residency)
+        finally:
+            await client.residency.stop()
+            await client.close()
+
+    return asyncio.run(main())
+
+
+def test_frequent_models_get_the_longer_keep_alive():
+    async def scenario(residency):
+        keep_alive = [residency.keep_alive_for("qwen2.5:7b")]
+        for _ in range(model_residency.HOT_MIN_USES):
+            residency.record_use("qwen2.5:7b")
+        keep_alive.append(residency.keep_alive_for("qwen2.5:7b"))
+        return keep_alive
+
+    assert run_with_residency(scenario) == [model_residency.KEEP_ALIVE_DEFAULT, model_residency.KEEP_ALIVE_HOT]
+
+
+def test_learns_models_per_agent():
+    async def scenario(residency):
+        residency.record_use("codegemma:7b", agent="dev_fullstack")
+        residency.record_use("codegemma:7b", agent="dev_fullstack")
+        residency.record_use("qwen2.5:7b", agent="dev_fullstack")
+        return residency.predicted_models("dev_fullstack"), residency.predicted_models("editor")
+
+    assert run_with_residency(scenario) == (["codegemma:7b"], [])
+
+
+def test_preload_loads_model_once(fake_ollama):
+    async def scenario(residency):
+        first = await residency.preload("llama3.1:8b-instruct")
+        second = await residency.preload("llama3.1:8b-instruct")
+        return first, second, residency.is_resident("llama3.1:8b-instruct"), dict(residency.stats)
+
+    first, second, resident, stats = run_with_residency(scenario)
+    assert (first, second, resident) == (True, False, True)
+    assert stats["preloads"] == 1
+    assert fake_ollama.is_loaded("llama3.1:8b-instruct")
+
+
+def test_warm_schedules_a_single_background_preload(fake_ollama):
+    async def scenario(residency):
+        residency.warm("codegemma:7b")
+        residency.warm("codegemma:7b")
+        warming = residency.is_warming("codegemma:7b")
+        await asyncio.gather(*residency._warm_tasks)
+        return warming, dict(residency.stats)
+
+    warming, stats = run_with_residency(scenario)
+    assert warming
+    assert stats["predictive_warmups"] == 1
+    assert stats["preloads"] == 1
+    assert fake_ollama.is_loaded("codegemma:7b")
+
+
+def test_preload_failure_is_counted(fake_ollama):
+    async def scenario(residency):
+        return await residency.preload("inexistente:1b"), dict(residency.stats)
+
+    loaded, stats = run_with_residency(scenario)
+    assert not loaded
+    assert stats["preload_failures"] == 1
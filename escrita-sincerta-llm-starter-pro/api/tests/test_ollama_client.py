@@ -0,0 +1,97 @@
+"""
+OllamaClient contra o Ollama simulado: sessão única, contadores de uso e event loop livre
+"""
+
+import asyncio
+
+import aiohttp
+import pytest
+
+from conftest import FAKE_OLLAMA_PORT
+from tools.ollama_client import OllamaClient, accumulate_usage, extract_usage
+from tools.ollama_pool import NodePool
+
+MODEL = "phi3:3.8b"
+
+
+def run_with_client(scenario):
+    async def main():
+        client = OllamaClient(NodePool([f"http://127.0.0.1:{FAKE_OLLAMA_PORT}"]))
+        try:
+            return await scenario(client)
+        finally:
+            await client.close()
+
+    return asyncio.run(main())
+
+
+def test_usage_counters():
+    data = {"eval_count": 10, "prompt_eval_count": 5, "eval_duration": 1e9, "model": MODEL, "done": True}
+    assert extract_usage(data) == {"eval_count": 10, "prompt_eval_count": 5, "eval_duration": 1000000000}
+    total = {}
+    accumulate_usage(total, data)
+    accumulate_usage(total, {"eval_count": 2})
+    assert total == {"eval_count": 12, "prompt_eval_count": 5, "eval_duration": 1000000000, "calls": 2}
+
+
+def test_session_is_shared_and_closed(fake_ollama):
+    async def scenario(client):
+        session = await client.get_session()
+        await client.chat(MODEL, [{"role": "user", "content": "sessão única"}])
+        assert await client.get_session() is session
+        await client.close()
+        assert session.closed
+        return await client.get_session() is not session
+
+    assert run_with_client(scenario)
+
+
+def test_chat_and_stream_return_counters(fake_ollama):
+    async def scenario(client):
+        messages = [{"role": "user", "content": "contadores do chat"}]
+        data = await client.chat(MODEL, messages, options={"num_predict": 8})
+        chunks = [chunk async for chunk in client.chat_stream(MODEL, messages, options={"num_predict": 8})]
+        return data, chunks
+
+    data, chunks = run_with_client(scenario)
+    assert data["message"]["content"].startswith(f"[{MODEL}]")
+    assert data["eval_count"] > 0 and data["prompt_eval_count"] > 0
+    assert chunks[-1]["done"] and chunks[-1]["eval_count"] > 0
+    assert "".join(chunk["message"]["content"] for chunk in chunks) == data["message"]["content"]
+
+
+def test_generation_does_not_block_the_event_loop(fake_ollama):
+    async def scenario(client):
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        await client.chat(MODEL, [{"role": "user", "content": "event loop livre"}])
+        ticking.cancel()
+        return ticks
+
+    assert run_with_client(scenario) >= 3
+
+
+def test_unknown_model_raises_http_error(fake_ollama):
+    async def scenario(client):
+        await client.chat("inexistente:1b", [{"role": "user", "content": "oi"}])
+
+    with pytest.raises(aiohttp.ClientResponseError) as error:
+        run_with_client(scenario)
+    assert error.value.status == 404
+
+
+def test_lists_installed_and_running_models(fake_ollama):
+    async def scenario(client):
+        await client.chat(MODEL, [{"role": "user", "content": "carrega o modelo"}])
+        return await client.list_models(), await client.list_running_models()
+
+    installed, running = run_with_client(scenario)
+    assert MODEL in {model["name"] for model in installed}
+    assert MODEL in {model["name"] for model in running}
@@ -0,0 +1,80 @@
+"""
+NodePool: afinidade de modelo e de conversa, falhas de nó e contadores usados por threads
+"""
+
+import threading
+
+import pytest
+
+from tools.ollama_pool import NodePool, conversation_key
+
+URLS = ["http://a:11434", "http://b:11434"]
+
+
+def make_pool() -> NodePool:
+    pool = NodePool(URLS)
+    for node in pool.nodes:
+        node.installed = {"qwen2.5:7b", "phi3:3.8b"}
+    return pool
+
+
+def test_prefers_node_with_model_resident():
+    pool = make_pool()
+    a, b = pool.nodes
+    b.resident = {"qwen2.5:7b": None}
+    a.in_flight = 0
+    b.in_flight = 2
+    assert pool.select("qwen2.5:7b") is b
+    assert pool.stats["resident_hits"] == 1
+
+
+def test_skips_nodes_without_model_installed():
+    pool = make_pool()
+    pool.nodes[0].installed = {"phi3:3.8b"}
+    assert pool.select("qwen2.5:7b") is pool.nodes[1]
+
+
+def test_conversation_sticks_to_its_node():
+    pool = make_pool()
+    first = pool.select("qwen2.5:7b", conversation="c1")
+    first.in_flight = 3
+    assert pool.select("qwen2.5:7b", conversation="c1") is first
+    assert pool.stats["sticky"] == 1
+
+
+def test_conversation_key_is_stable_across_turns():
+    history = [{"role": "user", "content": "primeira"}, {"role": "assistant", "content": "ok"}]
+    assert conversation_key(None, history, "terceira") == conversation_key(None, history[:1], "outra")
+    assert conversation_key("explicito", history, "x") == "explicito"
+
+
+def test_connection_errors_take_node_out_of_rotation():
+    pool = make_pool()
+    node = pool.nodes[0]
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            with pool.use("qwen2.5:7b", node):
+                raise ConnectionError("recusada")
+    assert not node.healthy
+    assert pool.healthy_nodes() == [pool.nodes[1]]
+    assert node.in_flight == 0
+
+
+def test_counters_are_consistent_across_threads():
+    pool = make_pool()
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        for _ in range(500):
+            with pool.use("bge-m3"):
+                pass
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(node.in_flight == 0 for node in pool.nodes)
+    assert pool.model_in_flight("bge-m3") == {}
+    assert sum(node.requests for node in pool.nodes) == 8 * 500
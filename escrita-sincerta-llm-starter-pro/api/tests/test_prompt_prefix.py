@@ -0,0 +1,86 @@
+"""
+Prefixo estável do prompt: arquivos de prompt em cache, layout das mensagens dos agentes
+e diagnóstico de reaproveitamento do KV cache (PromptCacheMonitor)
+"""
+
+import asyncio
+import os
+
+from conftest import FAKE_OLLAMA_PORT
+from agents.base import SimpleAgent
+from tools.ollama_client import OllamaClient
+from tools.ollama_pool import NodePool
+from tools.prompt_builder import PromptCacheMonitor, count_message_tokens, read_prompt_file
+
+HISTORY = [{"role": "user", "content": "pergunta anterior"}, {"role": "assistant", "content": "resposta anterior"}]
+
+
+class CountingAgent(SimpleAgent):
+    def __init__(self):
+        super().__init__("contador", "Você é um assistente.")
+        self._system_prompt = None
+        self.prompt_builds = 0
+
+    def get_system_prompt(self) -> str:
+        self.prompt_builds += 1
+        return "Você é um assistente."
+
+
+def test_prompt_files_are_cached_until_they_change(tmp_path):
+    path = tmp_path / "system.md"
+    path.write_text("versão 1", encoding="utf-8")
+    first = read_prompt_file("system.md", tmp_path)
+    assert read_prompt_file("system.md", tmp_path) is first
+    path.write_text("versão 2", encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert read_prompt_file("system.md", tmp_path) == "versão 2"
+    path.unlink()
+    assert read_prompt_file("system.md", tmp_path) is None
+
+
+def test_agent_messages_keep_static_prefix_first():
+    agent = CountingAgent()
+    agent.history = HISTORY
+    first = agent.build_messages("tarefa 1")
+    second = agent.build_messages("tarefa 2")
+    assert first[:-1] == second[:-1]
+    assert [message["role"] for message in first] == ["system", "user", "assistant", "user"]
+    assert first[-1]["content"] == "tarefa 1"
+    assert agent.build_messages("sub-chamada", history=False)[:-1] == first[:1]
+    # O prompt de sistema é calculado uma vez por instância
+    assert agent.prompt_builds == 1
+
+
+def test_monitor_estimates_reused_tokens():
+    monitor = PromptCacheMonitor()
+    messages = [{"role": "system", "content": "instruções " * 100}, {"role": "user", "content": "oi"}]
+    estimated = count_message_tokens("phi3:3.8b", messages)
+    assert monitor.observe("phi3:3.8b", messages, {"prompt_eval_count": estimated}) == 0
+    assert monitor.observe("phi3:3.8b", messages, {"prompt_eval_count": 5}) == estimated - 5
+    assert monitor.observe("phi3:3.8b", messages, {}) is None
+    stats = monitor.get_stats()["phi3:3.8b"]
+    assert (stats["calls"], stats["hits"]) == (2, 1)
+    assert 0 < stats["reuse_ratio"] < 1
+
+
+def test_follow_up_turn_reuses_the_prefix(fake_ollama):
+    system = {"role": "system", "content": "Você é um assistente de programação. " * 40}
+
+    async def scenario():
+        client = OllamaClient(NodePool([f"http://127.0.0.1:{FAKE_OLLAMA_PORT}"]))
+        try:
+            first = await client.chat("qwen2.5:7b", [system, {"role": "user", "content": "primeira pergunta"}])
+            second = await client.chat("qwen2.5:7b", [
+                system,
+                {"role": "user", "content": "primeira pergunta"},
+                {"role": "assistant", "content": first["message"]["content"]},
+                {"role": "user", "content": "segunda pergunta"},
+            ])
+        finally:
+            await client.close()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    # O simulado só avalia o que vem depois do prefixo em comum com o prompt anterior
+    assert second["prompt_cached_tokens"] > first.get("prompt_cached_tokens", 0)
@@ -0,0 +1,100 @@
+"""
+RouterStateStore: snapshot do estado aprendido pelo router, restauração em outra instância,
+envelhecimento pelo tempo fora do ar e snapshots descartados
+"""
+
+import json
+
+import pytest
+
+from conftest import FAKE_OLLAMA_PORT
+from advanced_router import AdvancedRouter
+from tools import router_state
+from tools.latency_sketch import LATENCY_HALF_LIFE
+from tools.model_availability import AvailabilityRegistry
+from tools.ollama_client import OllamaClient
+from tools.ollama_pool import NodePool
+from tools.router_state import STATE_VERSION, RouterStateStore
+
+MODEL = "qwen2.5:7b"
+USAGE = {"prompt_eval_count": 100, "prompt_eval_duration": 500_000_000,
+         "eval_count": 40, "eval_duration": 2_000_000_000}
+
+
+def make_router() -> AdvancedRouter:
+    """Router com cliente e registro próprios (hedger e falhas não vazam entre testes)"""
+    router = AdvancedRouter()
+    router.client = OllamaClient(NodePool([f"http://127.0.0.1:{FAKE_OLLAMA_PORT}"]))
+    router.availability = AvailabilityRegistry(router.client.pool)
+    return router
+
+
+def trained_router() -> AdvancedRouter:
+    router = make_router()
+    for response_time in (2.0, 3.0, 4.0):
+        router.update_model_metrics(MODEL, True, response_time, USAGE, "dev_fullstack")
+    router.update_model_metrics(MODEL, False, 0.0)
+    router.routing_cache.put("chave", router.availability.version, MODEL, {"reason": "optimal_selection"})
+    router.client.hedger.ttft.record(MODEL, 0.4)
+    return router
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RouterStateStore(tmp_path / "router" / "state.json", enabled=True)
+
+
+def test_snapshot_round_trip(store):
+    source = trained_router()
+    assert store.save(source)
+    assert not list(store.path.parent.glob("*.tmp"))
+
+    target = make_router()
+    assert store.restore(target)
+    metrics = target.model_metrics[MODEL]
+    assert metrics["total_requests"] == 4
+    assert metrics["success_rate"] == pytest.approx(source.model_metrics[MODEL]["success_rate"], abs=1e-3)
+    assert target.latency.service_time(MODEL) == pytest.approx(source.latency.service_time(MODEL), rel=1e-2)
+    assert target.routing_cache.get("chave", target.availability.version)[0] == MODEL
+    assert list(target.client.hedger.ttft.samples[MODEL]) == [0.4]
+    assert store.get_stats()["restored_from"] == store.last_save
+
+
+def test_failures_fade_with_time_offline(store, monkeypatch):
+    source = trained_router()
+    failure_share = 1.0 - source.model_metrics[MODEL]["success_rate"]
+    store.save(source)
+    now = store.last_save + LATENCY_HALF_LIFE
+    monkeypatch.setattr(router_state.time, "time", lambda: now)
+
+    target = make_router()
+    assert store.restore(target)
+    assert 1.0 - target.model_metrics[MODEL]["success_rate"] == pytest.approx(failure_share / 2)
+
+
+@pytest.mark.parametrize("content", [
+    "{não é json",
+    json.dumps({"version": STATE_VERSION + 1, "saved_at": 0}),
+    json.dumps({"version": STATE_VERSION, "saved_at": 0}),  # velho demais
+])
+def test_invalid_snapshots_are_discarded(store, content):
+    store.path.parent.mkdir(parents=True)
+    store.path.write_text(content, encoding="utf-8")
+    router = make_router()
+    assert not store.restore(router)
+    assert store.stats["discarded"] == 1
+    assert router.model_metrics[MODEL]["total_requests"] == 0
+
+
+def test_missing_snapshot_is_not_an_error(store):
+    assert not store.restore(make_router())
+    assert store.stats == {"saves": 0, "save_errors": 0, "restores": 0, "discarded": 0}
+
+
+def test_save_failure_is_counted(tmp_path):
+    # Diretório pai é um arquivo: a gravação falha sem derrubar o router
+    (tmp_path / "arquivo").write_text("", encoding="utf-8")
+    store = RouterStateStore(tmp_path / "arquivo" / "state.json", enabled=True)
+    assert not store.save(make_router())
+    assert store.stats["save_errors"] == 1
+    assert store.last_save is None
@@ -0,0 +1,70 @@
+from tools import routing_cache
+from tools.routing_cache import RoutingDecisionCache, routing_key
+
+
+def test_key_depends_only_on_routing_features():
+    key = routing_key("coding", "simple", "dev_fullstack", False)
+    assert key == routing_key("coding", "simple", "dev_fullstack", False)
+    assert len(key) == 20
+    assert key != routing_key("coding", "medium", "dev_fullstack", False)
+    assert key != routing_key("coding", "simple", "builder", False)
+    assert key != routing_key("coding", "simple", "dev_fullstack", True)
+    # Sem agente e agente vazio são a mesma decisão; prefer_fast é normalizado
+    assert routing_key("coding", "simple", None, 0) == routing_key("coding", "simple", "", False)
+
+
+def test_hit_and_miss():
+    cache = RoutingDecisionCache()
+    key = routing_key("coding", "simple", None, False)
+    assert cache.get(key, 1) is None
+    cache.put(key, 1, "phi3:3.8b", {"reason": "score"})
+    assert cache.get(key, 1) == ("phi3:3.8b", {"reason": "score"})
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(routing_cache.time, "time", lambda: now[0])
+    cache = RoutingDecisionCache(ttl=60)
+    cache.put("k", 1, "phi3:3.8b", {})
+    now[0] += 60
+    assert cache.get("k", 1) is not None
+    now[0] += 1
+    assert cache.get("k", 1) is None
+    assert cache.stats["expired"] == 1
+    assert len(cache) == 0
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = RoutingDecisionCache(max_entries=2)
+    cache.put("a", 1, "m1", {})
+    cache.put("b", 1, "m2", {})
+    cache.get("a", 1)
+    cache.put("c", 1, "m3", {})
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) is not None
+    assert cache.stats["evictions"] == 1
+
+
+def test_availability_version_change_clears_cache():
+    cache = RoutingDecisionCache()
+    cache.put("k", 1, "m", {})
+    assert cache.get("k", 2) is None
+    assert cache.stats["invalidations"] == 1
+    assert len(cache) == 0
+
+
+def test_restored_entries_adopt_current_version_and_drop_expired(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(routing_cache.time, "time", lambda: now[0])
+    cache = RoutingDecisionCache(ttl=60)
+    cache.put("fresh", 3, "m1", {})
+    now[0] += 50
+    cache.put("newer", 3, "m2", {})
+    snapshot = cache.to_dict()
+    now[0] += 20
+    restored = RoutingDecisionCache(ttl=60)
+    restored.load(snapshot)
+    assert len(restored) == 1
+    # O registro do novo processo tem outra versão: a entrada restaurada continua válida
+    assert restored.get("newer", 7) == ("m2", {})
@@ -0,0 +1,96 @@
+"""
+ModelScheduler: slots por modelo, prioridades, rodízio entre projetos e cancelamento na fila
+"""
+
+import asyncio
+
+from tools.request_context import Priority
+from tools.scheduler import ModelScheduler
+
+MODEL = "qwen2.5:7b"
+
+
+def make_scheduler(slots: int = 1) -> ModelScheduler:
+    # Estado compartilhado desligado no conftest: só os slots locais valem
+    return ModelScheduler(slots)
+
+
+async def admitted_order(scheduler, requests):
+    """Segura o único slot, enfileira `requests` (prioridade, projeto, nome) e devolve a ordem de admissão"""
+    order = []
+    await scheduler.acquire(MODEL, Priority.INTERACTIVE, "dono")
+
+    async def request(priority, project, name):
+        async with scheduler.slot(MODEL, priority, project):
+            order.append(name)
+
+    tasks = [asyncio.create_task(request(*item)) for item in requests]
+    await asyncio.sleep(0)
+    scheduler.release(MODEL)
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_capacity_limits_concurrency():
+    scheduler = make_scheduler(slots=2)
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        async with scheduler.slot(MODEL):
+            peak = max(peak, scheduler.load(MODEL)["in_flight"])
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        await asyncio.gather(*(request() for _ in range(5)))
+
+    asyncio.run(scenario())
+    assert peak == 2
+    assert scheduler.load(MODEL) == {"in_flight": 0, "queued": 0, "capacity": 2}
+
+
+def test_higher_priority_is_admitted_first():
+    scheduler = make_scheduler()
+    order = asyncio.run(admitted_order(scheduler, [
+        (Priority.BATCH, "p", "batch"),
+        (Priority.AGENT_STEP, "p", "step"),
+        (Priority.INTERACTIVE, "p", "chat"),
+    ]))
+    assert order == ["chat", "step", "batch"]
+
+
+def test_round_robin_between_projects():
+    scheduler = make_scheduler()
+    order = asyncio.run(admitted_order(scheduler, [
+        (Priority.AGENT_STEP, "a", "a1"),
+        (Priority.AGENT_STEP, "a", "a2"),
+        (Priority.AGENT_STEP, "a", "a3"),
+        (Priority.AGENT_STEP, "b", "b1"),
+    ]))
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    scheduler = make_scheduler()
+
+    async def scenario():
+        await scheduler.acquire(MODEL)
+        waiter = asyncio.create_task(scheduler.acquire(MODEL, Priority.BATCH, "p"))
+        await asyncio.sleep(0)
+        assert scheduler.load(MODEL)["queued"] == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert scheduler.load(MODEL)["queued"] == 0
+        scheduler.release(MODEL)
+        return scheduler.load(MODEL)
+
+    assert asyncio.run(scenario())["in_flight"] == 0
+
+
+def test_wait_time_stats():
+    scheduler = make_scheduler()
+    asyncio.run(admitted_order(scheduler, [(Priority.BATCH, "p", "batch")]))
+    stats = scheduler.get_stats()["models"][MODEL]
+    assert stats["priorities"]["interactive"]["admitted"] == 1
+    assert stats["priorities"]["batch"]["admitted"] == 1
+    assert stats["active"] == 0
@@ -0,0 +1,147 @@
+import os
+import time
+import asyncio
+import subprocess
+import sys
+
+import pytest
+
+from tools import shared_state
+from tools.shared_state import SharedRouterState
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def insert_lease(state: SharedRouterState, model: str, pid: int):
+    def insert():
+        with state._transaction() as conn:
+            conn.execute("INSERT INTO leases (model, pid, acquired_at) VALUES (?, ?, ?)", (model, pid, time.time()))
+    return state._call(insert)
+
+
+@pytest.fixture
+def state(tmp_path):
+    return SharedRouterState(tmp_path / "shared.db", enabled=True)
+
+
+def test_lease_limit_and_release(state):
+    async def scenario():
+        first = await state.acquire_lease("m", 1)
+        waiter = asyncio.create_task(state.acquire_lease("m", 1, poll=0.01))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        assert state.stats["lease_waits"] == 1
+        state.release_lease(first)
+        second = await asyncio.wait_for(waiter, 1)
+        assert second != first
+        state.release_lease(second)
+        await state.close()
+
+    asyncio.run(scenario())
+
+
+def test_leases_of_dead_workers_are_reaped_when_full(state):
+    async def scenario():
+        await insert_lease(state, "m", dead_pid())
+        lease = await asyncio.wait_for(state.acquire_lease("m", 1, poll=0.01), 1)
+        assert lease is not None
+        assert state.stats["reaped"] == 1
+        await state.close()
+
+    asyncio.run(scenario())
+
+
+def test_live_worker_leases_are_kept(state):
+    async def scenario():
+        # O processo do pytest está vivo: o lease dele não é recolhido
+        await insert_lease(state, "m", os.getppid())
+        waiter = asyncio.create_task(state.acquire_lease("m", 1, poll=0.01))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert state.stats["reaped"] == 0
+        await state.close()
+
+    asyncio.run(scenario())
+
+
+def test_leases_left_by_a_previous_process_with_the_same_pid_are_dropped(tmp_path):
+    async def scenario():
+        old = SharedRouterState(tmp_path / "shared.db", enabled=True)
+        await old.acquire_lease("m", 1)
+        await old.close()
+        # Novo processo (mesmo pid) abrindo o arquivo: os leases antigos dele não valem mais
+        new = SharedRouterState(tmp_path / "shared.db", enabled=True)
+        assert await asyncio.wait_for(new.acquire_lease("m", 1), 1) is not None
+        await new.close()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_acquire_does_not_leak_a_lease(state):
+    async def scenario():
+        for _ in range(20):
+            task = asyncio.create_task(state.acquire_lease("m", 1))
+            await asyncio.sleep(0)
+            task.cancel()
+            try:
+                lease = await task
+            except asyncio.CancelledError:
+                continue
+            state.release_lease(lease)
+        await state._call(lambda: None)
+        assert await state._call(state._count_in_flight) == {}
+        await state.close()
+
+    asyncio.run(scenario())
+
+
+def test_in_flight_is_served_from_cache_and_refreshed_in_background(state):
+    async def scenario():
+        lease = await state.acquire_lease("m", 2)
+        assert state.in_flight("m", max_age=0) == 0  # primeira leitura agenda a contagem
+        await state._call(lambda: None)
+        assert state.in_flight("m", max_age=60) == 1
+        state.release_lease(lease)
+        await state.close()
+
+    asyncio.run(scenario())
+
+
+def test_failures_put_model_in_cooldown(state, monkeypatch):
+    monkeypatch.setattr(shared_state, "SHARED_MAX_FAILURES", 2)
+
+    async def scenario():
+        metrics, down_until = await state.record_request("m", False, 1.0)
+        assert down_until is None
+        metrics, down_until = await state.record_request("m", False, 1.0)
+        assert down_until is not None and down_until > time.time()
+        assert metrics["total_requests"] == 2
+        shared_metrics, down = await state.read()
+        assert shared_metrics["m"]["success_rate"] == pytest.approx(0.81)
+        assert down["m"] == pytest.approx(down_until)
+        await state.close()
+
+    asyncio.run(scenario())
+
+
+def test_unwritable_path_degrades_to_local_state(tmp_path):
+    # O diretório do banco é um arquivo: mkdir levanta OSError, não sqlite3.Error
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    state = SharedRouterState(blocker / "shared.db", enabled=True)
+
+    async def scenario():
+        assert await state.record_request("m", True, 1.0) is None
+        assert await state.read() == ({}, {})
+        assert await state.acquire_lease("m", 1) is None
+        await state.close()
+
+    asyncio.run(scenario())
+    assert state.stats["errors"] == 3
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from tools.single_flight import SingleFlight, request_key
+
+
+def test_request_key_is_order_independent():
+    a = {"model": "m", "messages": [{"role": "user", "content": "oi"}], "options": {"seed": 1, "temperature": 0}}
+    b = {"options": {"temperature": 0, "seed": 1}, "messages": [{"role": "user", "content": "oi"}], "model": "m"}
+    assert request_key(a) == request_key(b)
+    assert request_key(a) != request_key({**a, "model": "outro"})
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flights = SingleFlight()
+        executions = 0
+
+        async def work():
+            nonlocal executions
+            executions += 1
+            await asyncio.sleep(0.01)
+            return {"content": "ok"}
+
+        results = await asyncio.gather(*(flights.do("k", work) for _ in range(5)))
+        assert executions == 1
+        assert all(result == {"content": "ok"} for result in results)
+        assert flights.stats["coalesced"] == 4
+        # Depois de terminar, a chave é esquecida: uma nova chamada executa de novo
+        await flights.do("k", work)
+        assert executions == 2
+        assert flights.get_stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_errors_reach_every_waiter():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("falhou")
+
+        results = await asyncio.gather(*(flights.do("k", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    asyncio.run(scenario())
+
+
+def test_execution_survives_until_last_waiter_cancels():
+    async def scenario():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def work():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        first = asyncio.create_task(flights.do("k", work))
+        second = asyncio.create_task(flights.do("k", work))
+        await started.wait()
+        first.cancel()
+        await asyncio.sleep(0)
+        assert not cancelled.is_set()
+        second.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        for task in (first, second):
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(scenario())
+
+
+def test_stream_subscribers_get_all_chunks():
+    async def scenario():
+        flights = SingleFlight()
+        generations = 0
+
+        async def generate():
+            nonlocal generations
+            generations += 1
+            for index in range(3):
+                await asyncio.sleep(0.005)
+                yield {"index": index}
+
+        async def collect():
+            return [chunk async for chunk in flights.stream("k", generate)]
+
+        first = asyncio.create_task(collect())
+        await asyncio.sleep(0.007)
+        # Assinante tardio recebe o replay dos chunks já gerados
+        second = asyncio.create_task(collect())
+        results = await asyncio.gather(first, second)
+        assert generations == 1
+        assert results[0] == results[1] == [{"index": 0}, {"index": 1}, {"index": 2}]
+        assert flights.stats["stream_coalesced"] == 1
+
+    asyncio.run(scenario())
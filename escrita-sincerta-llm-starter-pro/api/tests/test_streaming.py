@@ -0,0 +1,93 @@
+"""
+Streaming do /chat/stream: escopo da requisição por passo do gerador e frame final garantido
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from agents.dev_fullstack import DevFullstackAgent
+from tools.request_context import current_agent, current_backup_model, scoped_iter
+
+
+async def scope_values(count: int = 3):
+    for _ in range(count):
+        yield current_agent.get(), current_backup_model.get()
+        await asyncio.sleep(0)
+
+
+def test_scope_is_active_only_inside_each_step():
+    async def scenario():
+        seen = []
+        async for values in scoped_iter(scope_values(), agent="dev_fullstack", backup_model="qwen2.5:7b"):
+            seen.append(values)
+            # Entre os passos (no consumidor), o escopo já foi desfeito
+            assert current_agent.get() is None
+        return seen
+
+    assert asyncio.run(scenario()) == [("dev_fullstack", "qwen2.5:7b")] * 3
+
+
+def test_aclose_from_another_context():
+    async def scenario():
+        closed = []
+
+        async def source():
+            try:
+                while True:
+                    yield current_agent.get()
+            finally:
+                closed.append(current_agent.get())
+
+        frames = scoped_iter(source(), agent="dev_fullstack")
+        assert await frames.__anext__() == "dev_fullstack"
+        # O servidor fecha o gerador em outra task (outro contexto): sem ValueError do reset
+        await asyncio.create_task(frames.aclose())
+        return closed
+
+    assert asyncio.run(scenario()) == ["dev_fullstack"]
+
+
+def stream(client, message: str):
+    with client.stream("POST", "/chat/stream", json={"agent": "dev_fullstack", "message": message}) as response:
+        assert response.status_code == 200
+        return [json.loads(line) for line in response.iter_lines() if line]
+
+
+def test_agent_error_after_tokens_ends_with_done(client, monkeypatch):
+    async def fail_midway(self, message, context=None):
+        self.token_sink("parcial ")
+        raise RuntimeError("falha simulada")
+
+    monkeypatch.setattr(DevFullstackAgent, "process_message", fail_midway)
+    frames = stream(client, "Explique geradores em Python")
+    types = [frame["type"] for frame in frames]
+    assert types == ["routing", "token", "error", "done"]
+    assert frames[-1]["error"] == "falha simulada"
+    assert frames[-1]["fallback"] is None
+
+
+def test_agent_error_before_tokens_falls_back_to_direct_chat(client, monkeypatch):
+    async def fail_early(self, message, context=None):
+        raise RuntimeError("falha simulada")
+
+    monkeypatch.setattr(DevFullstackAgent, "process_message", fail_early)
+    frames = stream(client, "Explique decoradores em Python")
+    assert frames[-1]["type"] == "done"
+    assert frames[-1]["fallback"] == "direct_chat"
+    assert frames[-1]["error"] is None
+    tokens = "".join(frame["content"] for frame in frames if frame["type"] == "token")
+    assert tokens.startswith(f"[{frames[-1]['model_used']}]")
+
+
+def test_internal_error_still_sends_done(client, monkeypatch):
+    import app as api
+
+    async def broken(*args, **kwargs):
+        raise RuntimeError("roteamento indisponível")
+
+    monkeypatch.setattr(api, "prepare_agent_task", broken)
+    frames = stream(client, "Explique listas em Python")
+    assert [frame["type"] for frame in frames] == ["error", "done"]
+    assert "roteamento indisponível" in frames[-1]["error"]
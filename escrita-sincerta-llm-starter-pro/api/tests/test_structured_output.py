@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+import pytest
+
+from tools.structured_output import (
+    OrchestratorPlan, ProjectStructure, StructuredOutputError,
+    extract_json, parse_or_repair, parse_structured, get_structured_output_stats,
+)
+
+PLAN = {"plan": [{"step": 1, "agent": "builder", "action": "criar projeto"}]}
+
+
+def test_extract_json_strips_fences_and_prose():
+    text = "Aqui está:\n```json\n" + json.dumps(PLAN) + "\n```\nAbraços"
+    assert json.loads(extract_json(text)) == PLAN
+    assert json.loads(extract_json("Plano: " + json.dumps(PLAN) + " fim")) == PLAN
+
+
+def test_parse_structured_validates_schema():
+    plan = parse_structured(json.dumps(PLAN), OrchestratorPlan)
+    assert plan.plan[0].agent == "builder"
+    assert plan.plan[0].details == {}
+    with pytest.raises(ValueError):
+        parse_structured('{"plan": [{"step": "um"}]}', OrchestratorPlan)
+
+
+def test_valid_response_skips_repair():
+    async def repair(messages, num_predict):
+        raise AssertionError("correção não deveria ser chamada")
+
+    result = asyncio.run(parse_or_repair(json.dumps(PLAN), OrchestratorPlan, repair))
+    assert result.plan[0].step == 1
+
+
+def test_invalid_response_is_repaired_once():
+    calls = []
+    broken = '{"project_name": "app", "files": {"main.py": "entrada"}'
+
+    async def repair(messages, num_predict):
+        calls.append((messages, num_predict))
+        return broken + "}"
+
+    before = dict(get_structured_output_stats().counters.get("ProjectStructure", {}))
+    result = asyncio.run(parse_or_repair(broken, ProjectStructure, repair))
+    assert result.files == {"main.py": "entrada"}
+    assert len(calls) == 1
+    messages, num_predict = calls[0]
+    # O prompt de correção leva só esquema, erro e JSON (sem o prompt do agente)
+    assert messages[0]["role"] == "system"
+    assert "ESQUEMA:" in messages[1]["content"] and broken in messages[1]["content"]
+    assert num_predict > len(broken) // 3
+    counters = get_structured_output_stats().counters["ProjectStructure"]
+    assert counters["repairs"] == before.get("repairs", 0) + 1
+    assert counters["repair_failures"] == before.get("repair_failures", 0)
+
+
+def test_failed_repair_raises():
+    async def repair(messages, num_predict):
+        return "continua inválido"
+
+    with pytest.raises(StructuredOutputError):
+        asyncio.run(parse_or_repair("{", OrchestratorPlan, repair))
+    assert get_structured_output_stats().counters["OrchestratorPlan"]["repair_failures"] >= 1
@@ -0,0 +1,116 @@
+"""
+Classificador de tarefas: centroides, cache em disco, tráfego rotulado e orçamento de latência
+(embeddings simulados por saco de palavras, sem o RAG)
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+
+import pytest
+
+from tools import task_classifier
+from tools.task_classifier import TaskClassifier, example_labels
+
+DIMENSION = 256
+
+
+def bag_of_words(text):
+    vector = [0.0] * DIMENSION
+    for word in text.lower().split():
+        vector[hashlib.sha1(word.encode("utf-8")).digest()[0]] += 1.0
+    return vector
+
+
+class CountingEmbedder:
+    def __init__(self, fail=False, delay=0.0):
+        self.calls = 0
+        self.fail = fail
+        self.delay = delay
+
+    def __call__(self, text):
+        self.calls += 1
+        time.sleep(self.delay)
+        return None if self.fail else bag_of_words(text)
+
+
+@pytest.fixture(autouse=True)
+def paths(tmp_path, monkeypatch):
+    traffic = tmp_path / "labeled_traffic.jsonl"
+    load = task_classifier.load_labeled_traffic
+    monkeypatch.setattr(task_classifier, "CENTROIDS_PATH", tmp_path / "centroids.json")
+    monkeypatch.setattr(task_classifier, "LABELED_TRAFFIC_PATH", traffic)
+    monkeypatch.setattr(task_classifier, "load_labeled_traffic", lambda: load(traffic))
+    return traffic
+
+
+def built(embedder):
+    classifier = TaskClassifier(embed=embedder, model_name="bow", enabled=True)
+    asyncio.run(classifier.build())
+    return classifier
+
+
+def test_classifies_example_messages():
+    classifier = built(CountingEmbedder())
+    assert classifier.ready
+    assert classifier.get_stats()["centroids"]["task_type"]["coding"] == 6
+    result = asyncio.run(classifier.classify("Crie uma função Python para calcular fibonacci"))
+    assert result["task_type"]["label"] == "coding"
+    assert result["task_complexity"]["label"] == "simple"
+    assert 0 < result["task_type"]["confidence"] <= 1
+
+
+def test_centroids_are_loaded_from_cache():
+    first = CountingEmbedder()
+    built(first)
+    assert first.calls == len(example_labels())
+    second = CountingEmbedder()
+    classifier = built(second)
+    assert classifier.ready
+    assert second.calls == 0
+
+
+def test_added_label_updates_centroids_and_cache(paths):
+    classifier = built(CountingEmbedder())
+    assert asyncio.run(classifier.add_label("Otimize esta consulta SQL lenta", "analysis", "complex"))
+    assert json.loads(paths.read_text(encoding="utf-8").splitlines()[-1])["task_type"] == "analysis"
+    assert classifier.centroids["task_type"]["analysis"].count == 4
+    # O hash segue o arquivo: outra instância reaproveita o cache sem refazer embeddings
+    embedder = CountingEmbedder()
+    reloaded = built(embedder)
+    assert embedder.calls == 0
+    assert reloaded.centroids["task_type"]["analysis"].count == 4
+
+
+def test_label_without_embedding_stays_out_of_digest(paths):
+    classifier = built(CountingEmbedder())
+    digest = classifier.digest
+    classifier._embed = CountingEmbedder(fail=True)
+    assert not asyncio.run(classifier.add_label("Otimize esta consulta SQL lenta", "analysis"))
+    assert "Otimize" in paths.read_text(encoding="utf-8")
+    assert classifier.digest == digest
+    assert classifier.centroids["task_type"]["analysis"].count == 3
+    # O cache não bate mais com o arquivo: o próximo build embute todos os rótulos de novo
+    embedder = CountingEmbedder()
+    rebuilt = built(embedder)
+    assert embedder.calls == len(example_labels()) + 1
+    assert rebuilt.centroids["task_type"]["analysis"].count == 4
+
+
+def test_slow_embedding_falls_back_to_keywords():
+    classifier = built(CountingEmbedder())
+    classifier._embed = CountingEmbedder(delay=0.5)
+
+    async def scenario():
+        return await classifier.classify("Crie uma função Python")
+
+    assert asyncio.run(scenario()) is None
+    assert classifier.stats["timeouts"] == 1
+
+
+def test_disabled_classifier_does_not_embed():
+    embedder = CountingEmbedder()
+    classifier = TaskClassifier(embed=embedder, model_name="bow", enabled=False)
+    assert asyncio.run(classifier.classify("Crie uma função Python")) is None
+    assert embedder.calls == 0
@@ -0,0 +1,63 @@
+"""
+Contadores de tokens e tempo do Ollama agregados por modelo e por agente
+"""
+
+import asyncio
+
+from conftest import FAKE_OLLAMA_PORT
+from advanced_router import get_router
+from agents.base import SimpleAgent
+from tools.ollama_client import OllamaClient
+from tools.ollama_pool import NodePool
+from tools.usage_metrics import UsageAggregate, UsageMetrics
+
+USAGE = {
+    "prompt_eval_count": 200, "prompt_eval_duration": 1_000_000_000,
+    "eval_count": 50, "eval_duration": 2_000_000_000, "load_duration": 3_000_000_000,
+}
+
+
+def test_aggregate_rates_and_cold_loads():
+    aggregate = UsageAggregate()
+    aggregate.add(USAGE)
+    aggregate.add({**USAGE, "load_duration": 1_000_000})
+    stats = aggregate.get_stats()
+    assert stats["calls"] == 2
+    assert stats["total_tokens"] == 500
+    assert stats["prompt_tokens_per_second"] == 200.0
+    assert stats["generation_tokens_per_second"] == 25.0
+    assert stats["cold_loads"] == 1
+    assert stats["avg_load_time"] == 1.5
+
+
+def test_metrics_by_model_and_agent():
+    metrics = UsageMetrics()
+    metrics.record("phi3:3.8b", USAGE, "dev_fullstack")
+    metrics.record("phi3:3.8b", USAGE)
+    metrics.record("phi3:3.8b", {})
+    stats = metrics.get_stats()
+    assert stats["by_model"]["phi3:3.8b"]["calls"] == 2
+    # Chamadas sem agente (chat direto) têm o próprio agregado
+    assert {agent: counts["calls"] for agent, counts in stats["by_agent"].items()} == {"dev_fullstack": 1, "direct_chat": 1}
+
+
+def test_agent_calls_feed_router_metrics(fake_ollama):
+    router = get_router()
+    assert "contador_de_tokens" not in router.usage_metrics.by_agent
+
+    async def scenario():
+        agent = SimpleAgent("contador_de_tokens", "Você é um assistente.", model="phi3:3.8b")
+        agent.client = OllamaClient(NodePool([f"http://127.0.0.1:{FAKE_OLLAMA_PORT}"]))
+        try:
+            reply = await agent.call_ollama("phi3:3.8b", agent.build_messages("conte tokens", history=False))
+        finally:
+            await agent.client.close()
+        return reply, agent.usage
+
+    reply, usage = asyncio.run(scenario())
+    assert reply.startswith("[phi3:3.8b]")
+    assert usage["eval_count"] > 0 and usage["calls"] == 1
+    stats = router.usage_metrics.by_agent["contador_de_tokens"].get_stats()
+    assert stats["calls"] == 1
+    assert stats["generated_tokens"] == usage["eval_count"]
+    assert router.usage_metrics.for_model("phi3:3.8b").calls >= 1
@@ -0,0 +1,150 @@
+"""
+Micro-benchmark do casamento de palavras-chave
+Compara os laços antigos (`keyword in message.lower()` por lista) com o KeywordMatcher
+na análise do router (complexidade, tipo e indicadores técnicos) e no despacho dos
+agentes Reflexivo, DevFullstack, ArchitectFullstack e Ideator, em mensagens de ~10 KB.
+Também conta as decisões que mudam (os casamentos por substring que deixam de acontecer).
+
+Uso (no diretório api):
+    python -m tools.bench_keywords [--size 10240] [--messages 50] [--rounds 5]
+"""
+
+import random
+import argparse
+import time
+from typing import Dict, Any, List, Optional
+
+from advanced_router import AdvancedRouter, TaskComplexity, TaskType
+from agents.reflexivo import ReflexivoAgent
+from agents.dev_fullstack import DevFullstackAgent
+from agents.architect_fullstack import ArchitectFullstackAgent
+from agents.ideator_saas import IdeatorAgent
+from tools.keyword_matcher import KeywordMatcher, normalize
+
+AGENTS = (ReflexivoAgent, DevFullstackAgent, ArchitectFullstackAgent, IdeatorAgent)
+
+FILLER = (
+    "o sistema de pagamentos precisa de uma fila com retentativas e os outros serviços "
+    "devem ouvir os eventos porque a equipe quer entender como rapidez e consistência "
+    "afetam a experiência dos usuários; we also need to review the deployment pipeline, "
+    "the documentação of the api and the performance of the database under load."
+).split()
+
+
+def build_messages(size: int, count: int, seed: int = 42) -> List[str]:
+    """Mensagens de `size` caracteres com texto comum e algumas palavras-chave"""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        words: List[str] = []
+        length = 0
+        while length < size:
+            word = rng.choice(FILLER)
+            words.append(word)
+            length += len(word) + 1
+        messages.append(" ".join(words)[:size])
+    return messages
+
+
+# --- Implementação antiga (substring) ---
+
+def legacy_counts(categories: Dict[Any, List[str]], message_lower: str) -> Dict[Any, int]:
+    return {
+        category: sum(1 for keyword in keywords if keyword.rstrip("*") in message_lower)
+        for category, keywords in categories.items()
+    }
+
+
+def legacy_first(matcher: KeywordMatcher, categories: Dict[Any, List[str]], message: str) -> Optional[Any]:
+    message_lower = message.lower()
+    for category in matcher.categories:
+        if any(keyword.rstrip("*") in message_lower for keyword in categories[category]):
+            return category
+    return None
+
+
+def legacy_analyze(router: AdvancedRouter, message: str) -> tuple:
+    message_lower = message.lower()
+    complexity = {complexity: 0 for complexity in TaskComplexity}
+    complexity.update(legacy_counts(router.complexity_keywords, message_lower))
+    complexity[TaskComplexity.EXPERT] += sum(1 for indicator in router.technical_indicators if indicator in message_lower)
+    types = {task_type: 0 for task_type in TaskType}
+    types.update(legacy_counts(router.task_type_keywords, message_lower))
+    return max(complexity, key=complexity.get), max(types, key=types.get)
+
+
+def new_analyze(router: AdvancedRouter, message: str) -> tuple:
+    return router.analyze_task_complexity(message), router.analyze_task_type(message)
+
+
+def dispatch_keywords(agent_class) -> Dict[str, List[str]]:
+    """Listas originais do despacho do agente, reconstruídas a partir do matcher"""
+    matcher = agent_class.DISPATCH
+    categories: Dict[str, List[str]] = {category: [] for category in matcher.categories}
+    for table in (matcher.words, matcher.phrases):
+        for keyword, keyword_categories in table.items():
+            for category in keyword_categories:
+                categories[category].append(keyword)
+    for stem, keyword_categories in matcher.stems.items():
+        for category in keyword_categories:
+            categories[category].append(f"{stem}*")
+    return categories
+
+
+def timed(function, messages: List[str], rounds: int, clear_cache: bool = True) -> float:
+    """Microssegundos por mensagem (cache de normalização limpo a cada rodada)"""
+    best = float("inf")
+    for _ in range(rounds):
+        if clear_cache:
+            normalize.cache_clear()
+        start = time.perf_counter()
+        for message in messages:
+            function(message)
+        best = min(best, (time.perf_counter() - start) / len(messages))
+    return best * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do casamento de palavras-chave")
+    parser.add_argument("--size", type=int, default=10240, help="Tamanho de cada mensagem (caracteres)")
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    router = AdvancedRouter()
+    messages = build_messages(args.size, args.messages)
+    agents = [(agent_class.__name__, agent_class.DISPATCH, dispatch_keywords(agent_class)) for agent_class in AGENTS]
+
+    def legacy_request(message: str):
+        legacy_analyze(router, message)
+        for _, matcher, keywords in agents:
+            legacy_first(matcher, keywords, message)
+
+    def new_request(message: str):
+        new_analyze(router, message)
+        for _, matcher, _ in agents:
+            matcher.first(message)
+
+    print(f"{len(messages)} mensagens de {args.size} caracteres, melhor de {args.rounds} rodadas (µs por mensagem)")
+    rows = [
+        ("router (complexidade + tipo)", lambda m: legacy_analyze(router, m), lambda m: new_analyze(router, m)),
+        ("despacho dos 4 agentes", lambda m: [legacy_first(mt, kw, m) for _, mt, kw in agents],
+         lambda m: [mt.first(m) for _, mt, _ in agents]),
+        ("requisição completa", legacy_request, new_request),
+    ]
+    for label, legacy, new in rows:
+        legacy_us = timed(legacy, messages, args.rounds)
+        new_us = timed(new, messages, args.rounds)
+        print(f"  {label:<30} antigo {legacy_us:9.1f}   novo {new_us:9.1f}   {legacy_us / new_us:5.1f}x")
+
+    changed = {name: 0 for name, _, _ in agents}
+    for message in messages:
+        for name, matcher, keywords in agents:
+            if legacy_first(matcher, keywords, message) != matcher.first(message):
+                changed[name] += 1
+    routed = sum(1 for message in messages if legacy_analyze(router, message) != new_analyze(router, message))
+    print(f"Decisões diferentes (casamentos por substring eliminados): router {routed}, agentes {changed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Micro-benchmark do estado compartilhado entre workers
+Mede, pela API assíncrona, o custo por requisição das operações que o router e o
+escalonador fazem no SQLite WAL: contagem de leases (roteamento), obter e liberar o
+lease do modelo (execução) e registrar a requisição (métricas e falhas). A leitura
+completa das métricas dos outros workers é medida à parte (ela roda no máximo uma vez
+por ROUTER_SHARED_SYNC_INTERVAL). Em paralelo, um tick de 1 ms mede o atraso do event
+loop: é ele que mostra se a disputa pelo arquivo chega às outras requisições do worker.
+Roda com 1..N processos disputando o mesmo arquivo.
+
+Uso (no diretório api):
+    python -m tools.bench_shared_state [--requests 2000] [--workers 1,2,4,8] [--path /tmp/bench_shared.db]
+"""
+
+import os
+import time
+import random
+import asyncio
+import argparse
+import multiprocessing
+from pathlib import Path
+from typing import Dict, Any, List
+
+from tools.shared_state import SharedRouterState
+
+MODELS = ["phi3:3.8b", "qwen2.5:7b", "llama3.1:8b-instruct", "codegemma:7b"]
+# Limite alto: o benchmark mede o custo das operações, não a espera por vaga
+LEASE_LIMIT = 1000
+TICK = 0.001
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+async def measure_loop_lag(lags: List[float], stop: asyncio.Event):
+    """Atraso de um tick de 1 ms (tempo em que o event loop ficou parado)"""
+    while not stop.is_set():
+        begin = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, time.perf_counter() - begin - TICK))
+
+
+async def simulate(path: str, requests: int, seed: int) -> Dict[str, Any]:
+    state = SharedRouterState(Path(path), enabled=True)
+    rng = random.Random(seed)
+    per_request: List[float] = []
+    reads: List[float] = []
+    lags: List[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_loop_lag(lags, stop))
+    start = time.perf_counter()
+    for index in range(requests):
+        model = rng.choice(MODELS)
+        begin = time.perf_counter()
+        state.in_flight(model, max_age=0)
+        lease = await state.acquire_lease(model, LEASE_LIMIT)
+        state.release_lease(lease)
+        await state.record_request(model, rng.random() > 0.02, rng.uniform(0.5, 20.0))
+        per_request.append(time.perf_counter() - begin)
+        if index % 50 == 0:
+            begin = time.perf_counter()
+            await state.read()
+            reads.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+    await state.close()
+    return {"per_request": per_request, "reads": reads, "lags": lags, "elapsed": elapsed}
+
+
+def run_worker(path: str, requests: int, seed: int, results: "multiprocessing.Queue"):
+    results.put(asyncio.run(simulate(path, requests, seed)))
+
+
+def run(path: str, workers: int, requests: int) -> Dict[str, float]:
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    results: "multiprocessing.Queue" = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=run_worker, args=(path, requests, seed, results))
+                 for seed in range(workers)]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    per_request = [sample for result in collected for sample in result["per_request"]]
+    reads = [sample for result in collected for sample in result["reads"]]
+    lags = [sample for result in collected for sample in result["lags"]]
+    wall = max(result["elapsed"] for result in collected)
+    return {
+        "mean": sum(per_request) / len(per_request) * 1e6,
+        "p50": percentile(per_request, 0.5) * 1e6,
+        "p99": percentile(per_request, 0.99) * 1e6,
+        "read": sum(reads) / len(reads) * 1e6,
+        "lag_p99": percentile(lags, 0.99) * 1e6,
+        "lag_max": max(lags) * 1e6,
+        "throughput": len(per_request) / wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do estado compartilhado do router (SQLite WAL)")
+    parser.add_argument("--requests", type=int, default=2000, help="Requisições simuladas por processo")
+    parser.add_argument("--workers", default="1,2,4,8", help="Números de processos, separados por vírgula")
+    parser.add_argument("--path", default="/tmp/bench_shared_state.db")
+    args = parser.parse_args()
+
+    print(f"{args.requests} requisições por processo em {args.path} (µs por requisição)")
+    print(f"  {'workers':>7} {'média':>8} {'p50':>8} {'p99':>8} {'sync':>8} {'req/s':>9} "
+          f"{'loop p99':>9} {'loop máx':>9}")
+    for workers in (int(value) for value in args.workers.split(",")):
+        result = run(args.path, workers, args.requests)
+        print(f"  {workers:>7} {result['mean']:8.1f} {result['p50']:8.1f} {result['p99']:8.1f} "
+              f"{result['read']:8.1f} {result['throughput']:9.0f} {result['lag_p99']:9.1f} {result['lag_max']:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Cancelamento de requisições quando o cliente desconecta
+O trabalho do endpoint roda em uma task; se o cliente fecha a conexão, a task é
+cancelada, o que fecha as conexões com o Ollama (a geração para) e interrompe
+loops de vários passos como o do BuilderAgent.
+"""
+
+import os
+import asyncio
+import logging
+from collections import Counter
+from typing import Dict, Any, Optional, Awaitable, TypeVar
+
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+
+T = TypeVar("T")
+
+
+class ClientDisconnected(Exception):
+    """O cliente fechou a conexão antes da resposta"""
+
+
+class CancellationStats:
+    """Contadores de requisições abandonadas por endpoint e por agente"""
+
+    def __init__(self):
+        self.by_endpoint: Counter = Counter()
+        self.by_agent: Counter = Counter()
+
+    def record(self, endpoint: str, agent: Optional[str] = None):
+        self.by_endpoint[endpoint] += 1
+        if agent:
+            self.by_agent[agent] += 1
+        logger.info(f"Requisição cancelada por desconexão do cliente ({endpoint}, agente={agent})")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "total": sum(self.by_endpoint.values()),
+            "by_endpoint": dict(self.by_endpoint),
+            "by_agent": dict(self.by_agent),
+        }
+
+
+async def run_until_disconnect(request: Request, work: Awaitable[T], endpoint: str,
+                               agent: Optional[str] = None) -> T:
+    """
+    Executa `work` enquanto o cliente estiver conectado.
+    Em caso de desconexão, cancela o trabalho, registra nas métricas e levanta ClientDisconnected.
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                await asyncio.wait({task})
+                get_cancellation_stats().record(endpoint, agent)
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+# Singleton instance
+_stats_instance = None
+
+def get_cancellation_stats() -> CancellationStats:
+    """Obtém instância singleton das métricas de cancelamento"""
+    global _stats_instance
+    if _stats_instance is None:
+        _stats_instance = CancellationStats()
+    return _stats_instance
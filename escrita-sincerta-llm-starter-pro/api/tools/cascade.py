@@ -0,0 +1,151 @@
+"""
+Cascata de modelos: o menor modelo capaz responde primeiro
+A resposta só é refeita no modelo escolhido pelo router quando sinais baratos indicam
+que ela é ruim: falha do agente, resposta vazia, recusa, saída truncada ou baixa
+confiança autoavaliada (o JSON dos planos já é validado e corrigido em structured_output). As métricas estimam a computação economizada.
+"""
+
+import os
+import re
+import logging
+from collections import Counter
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
+
+from tools.prompt_builder import get_context_sizer
+
+if TYPE_CHECKING:
+    from tools.ollama_client import OllamaClient
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+# Opt-in: respostas escaladas custam as duas gerações
+CASCADE_ENABLED = os.getenv("ROUTER_CASCADE_ENABLED", "false").lower() == "true"
+CASCADE_MODEL = os.getenv("ROUTER_CASCADE_MODEL", "phi3:3.8b")
+# Tarefas acima desta complexidade vão direto ao modelo escolhido
+CASCADE_MAX_COMPLEXITY = os.getenv("ROUTER_CASCADE_MAX_COMPLEXITY", "complex")
+# Autoavaliação do modelo pequeno: uma chamada extra por resposta aceita
+CASCADE_RATE_CONFIDENCE = os.getenv("ROUTER_CASCADE_RATE_CONFIDENCE", "false").lower() == "true"
+CASCADE_MIN_CONFIDENCE = int(os.getenv("ROUTER_CASCADE_MIN_CONFIDENCE", "6"))
+# Agentes que geram e gravam vários arquivos: refazer com outro modelo duplicaria o trabalho
+CASCADE_EXCLUDED_AGENTS = {
+    agent.strip() for agent in os.getenv("ROUTER_CASCADE_EXCLUDED_AGENTS", "builder_web,editor").split(",")
+    if agent.strip()
+}
+
+# Início típico de recusas (verificado só no começo da resposta)
+REFUSAL_MARKERS = (
+    "não posso ajudar", "não consigo ajudar", "não posso fornecer", "não posso atender",
+    "não posso responder", "não sou capaz de", "como um modelo de linguagem", "como uma ia",
+    "i can't help", "i cannot help", "i can't assist", "i cannot assist", "i'm sorry, but",
+    "i am unable to", "i'm unable to", "as an ai",
+)
+REFUSAL_WINDOW = 300
+
+CONFIDENCE_QUESTION = (
+    "De 0 a 10, qual a sua confiança de que a resposta anterior está correta e completa? "
+    "Responda apenas com o número."
+)
+
+
+def model_size(model: str) -> float:
+    """Bilhões de parâmetros a partir do nome (phi3:3.8b -> 3.8); 1.0 se não houver"""
+    match = re.search(r"(\d+(?:\.\d+)?)b\b", model.lower())
+    return float(match.group(1)) if match else 1.0
+
+
+def usage_tokens(usage: Dict[str, int]) -> int:
+    return usage.get("prompt_eval_count", 0) + usage.get("eval_count", 0)
+
+
+def is_refusal(text: str) -> bool:
+    head = text[:REFUSAL_WINDOW].lower()
+    return any(marker in head for marker in REFUSAL_MARKERS)
+
+
+def escalation_reason(reply: str, done_reason: Optional[str] = None) -> Optional[str]:
+    """Motivo para refazer a resposta no modelo maior (None = resposta aceita)"""
+    if not reply or not reply.strip():
+        return "empty"
+    if done_reason == "length":
+        return "truncated"
+    if is_refusal(reply):
+        return "refusal"
+    return None
+
+
+async def rate_confidence(client: "OllamaClient", model: str, messages: List[Dict[str, str]],
+                          reply: str) -> Optional[int]:
+    """
+    Pede ao próprio modelo uma nota de 0 a 10 para a resposta.
+    A conversa é a mesma da resposta, então o prefixo já está no KV cache do Ollama.
+    """
+    rating_messages = messages + [
+        {"role": "assistant", "content": reply},
+        {"role": "user", "content": CONFIDENCE_QUESTION},
+    ]
+    try:
+        data = await client.chat(
+            model=model,
+            messages=rating_messages,
+            options={
+                "temperature": 0,
+                "num_predict": 4,
+                "num_ctx": get_context_sizer().select_for_messages(model, rating_messages, 4),
+            },
+            timeout=30,
+        )
+    except Exception as e:
+        logger.debug(f"Falha ao obter autoavaliação de {model}: {e}")
+        return None
+    match = re.search(r"\d+", data.get("message", {}).get("content", ""))
+    return min(int(match.group()), 10) if match else None
+
+
+class CascadeStats:
+    """
+    Métricas da cascata
+
+    A computação é estimada em bilhões de parâmetros x tokens: sem a cascata, cada
+    requisição teria rodado só no modelo maior com os mesmos tokens.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.accepted = 0
+        self.escalations: Counter = Counter()
+        self.by_agent: Dict[str, Counter] = {}
+        self.baseline_compute = 0.0
+        self.actual_compute = 0.0
+
+    def record(self, agent: Optional[str], small_model: str, large_model: str, reason: Optional[str],
+               small_tokens: int, large_tokens: Optional[int] = None):
+        self.requests += 1
+        agent_stats = self.by_agent.setdefault(agent or "direct_chat", Counter())
+        small_cost = model_size(small_model) * small_tokens
+        if reason is None:
+            self.accepted += 1
+            agent_stats["accepted"] += 1
+            self.baseline_compute += model_size(large_model) * small_tokens
+            self.actual_compute += small_cost
+        else:
+            self.escalations[reason] += 1
+            agent_stats["escalated"] += 1
+            large_cost = model_size(large_model) * (large_tokens or small_tokens)
+            self.baseline_compute += large_cost
+            self.actual_compute += small_cost + large_cost
+            logger.info(f"Cascata: {small_model} -> {large_model} ({reason})")
+
+    def get_stats(self) -> Dict[str, Any]:
+        saved = self.baseline_compute - self.actual_compute
+        return {
+            "enabled": CASCADE_ENABLED,
+            "model": CASCADE_MODEL,
+            "requests": self.requests,
+            "accepted": self.accepted,
+            "acceptance_rate": round(self.accepted / self.requests, 3) if self.requests else None,
+            "escalations": dict(self.escalations),
+            "by_agent": {agent: dict(counts) for agent, counts in self.by_agent.items()},
+            "compute_saved": round(saved, 1),
+            "compute_saved_ratio": round(saved / self.baseline_compute, 3) if self.baseline_compute else None,
+        }
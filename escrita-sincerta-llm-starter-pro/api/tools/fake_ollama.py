@@ -0,0 +1,465 @@
+"""
+Servidor Ollama simulado para testes de carga e latência
+Implementa /api/chat (com e sem streaming), /api/generate, /api/tags, /api/ps,
+/api/embeddings e /api/embed com tempo de carga, TTFT, tokens/s, taxa de erro e
+slots paralelos configuráveis por modelo, e respostas determinísticas (incluindo
+planos JSON válidos para o OrchestratorAgent e o BuilderAgent).
+
+Uso (no diretório api):
+    python -m tools.fake_ollama --port 11434 [--config perfis.json] [--speed 10]
+
+perfis.json sobrescreve os perfis por modelo, ex.:
+    {"qwen2.5:7b": {"load_time": 8, "ttft": 0.4, "tokens_per_second": 12, "error_rate": 0.05, "parallel": 2}}
+json_error_rate (0-1) faz o modelo devolver JSON sem o fechamento, para testar a correção.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import argparse
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+FAKE_OLLAMA_CONFIG = os.getenv("FAKE_OLLAMA_CONFIG")
+FAKE_OLLAMA_SPEED = float(os.getenv("FAKE_OLLAMA_SPEED", "1"))  # divide todos os tempos simulados
+FAKE_OLLAMA_SEED = int(os.getenv("FAKE_OLLAMA_SEED", "42"))
+DEFAULT_KEEP_ALIVE = 300
+DEFAULT_NUM_PREDICT = 128
+CHARS_PER_TOKEN = 4
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "1024"))
+
+# Perfis aproximados de CPU para os modelos usados pelo router
+DEFAULT_PROFILES: Dict[str, Dict[str, Any]] = {
+    "phi3:3.8b": {"load_time": 2.0, "ttft": 0.2, "prompt_tokens_per_second": 400, "tokens_per_second": 25,
+                  "error_rate": 0.0, "parallel": 2, "size": 2_300_000_000},
+    "qwen2.5:7b": {"load_time": 4.0, "ttft": 0.4, "prompt_tokens_per_second": 200, "tokens_per_second": 12,
+                   "error_rate": 0.0, "parallel": 1, "size": 4_700_000_000},
+    "llama3.1:8b-instruct": {"load_time": 5.0, "ttft": 0.5, "prompt_tokens_per_second": 180, "tokens_per_second": 10,
+                             "error_rate": 0.0, "parallel": 1, "size": 4_900_000_000},
+    "codegemma:7b": {"load_time": 4.0, "ttft": 0.4, "prompt_tokens_per_second": 200, "tokens_per_second": 12,
+                     "error_rate": 0.0, "parallel": 1, "size": 5_000_000_000},
+    "bge-m3": {"load_time": 1.0, "ttft": 0.05, "prompt_tokens_per_second": 2000, "tokens_per_second": 0,
+               "error_rate": 0.0, "parallel": 4, "size": 1_200_000_000, "embedding": True},
+}
+
+ORCHESTRATOR_PLAN = {
+    "plan": [
+        {
+            "step": 1,
+            "agent": "builder_web",
+            "action": "Criar a estrutura inicial do projeto.",
+            "details": {"prompt": "Crie um app web simples chamado 'projeto-demo' com HTML, CSS e JavaScript"},
+        },
+        {
+            "step": 2,
+            "agent": "editor",
+            "action": "Adicionar um botão ao componente principal.",
+            "details": {"prompt": "No projeto 'projeto-demo', modifique 'index.html' para adicionar um botão azul."},
+        },
+    ]
+}
+
+BUILDER_PLAN = {
+    "project_name": "projeto-demo",
+    "files": {
+        "index.html": "Página principal da aplicação.",
+        "style.css": "Estilos globais.",
+        "app.js": "Lógica da aplicação.",
+    },
+}
+
+FILE_TEMPLATES = {
+    ".html": "<!DOCTYPE html>\n<html lang=\"pt-BR\">\n<head>\n  <meta charset=\"utf-8\">\n  <title>Projeto Demo</title>\n  <link rel=\"stylesheet\" href=\"style.css\">\n</head>\n<body>\n  <main id=\"app\"></main>\n  <script src=\"app.js\"></script>\n</body>\n</html>\n",
+    ".css": "body {\n  font-family: sans-serif;\n  margin: 0;\n}\n",
+    ".js": "document.getElementById('app').textContent = 'Olá, mundo!';\n",
+    ".py": "def main() -> None:\n    print(\"Olá, mundo!\")\n\n\nif __name__ == \"__main__\":\n    main()\n",
+    ".json": "{\n  \"name\": \"projeto-demo\",\n  \"version\": \"0.1.0\"\n}\n",
+}
+
+WORDS = (
+    "contexto solução exemplo código checklist análise arquitetura modelo dados serviço api "
+    "teste deploy cache fila latência desempenho requisito validação estrutura componente"
+).split()
+
+
+def _parse_keep_alive(value: Any) -> Optional[float]:
+    """Segundos de residência (None = para sempre, 0 = descarregar)"""
+    if value is None:
+        return DEFAULT_KEEP_ALIVE
+    if isinstance(value, (int, float)):
+        return None if value < 0 else float(value)
+    match = re.fullmatch(r"(-?\d+(?:\.\d+)?)(ms|s|m|h)?", str(value).strip())
+    if not match:
+        return DEFAULT_KEEP_ALIVE
+    amount = float(match.group(1))
+    if amount < 0:
+        return None
+    return amount * {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}[match.group(2)]
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN) if text else 0
+
+
+def _close_brackets(text: str) -> str:
+    """Fecha chaves e colchetes abertos (a "correção" do servidor simulado)"""
+    closing = {"{": "}", "[": "]"}
+    stack: List[str] = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in closing:
+            stack.append(closing[char])
+        elif char in "}]" and stack:
+            stack.pop()
+    return text + "".join(reversed(stack))
+
+
+class FakeOllama:
+    """Estado do servidor simulado: perfis, modelos carregados, slots e estatísticas"""
+
+    def __init__(self, profiles: Optional[Dict[str, Dict[str, Any]]] = None, speed: float = FAKE_OLLAMA_SPEED,
+                 seed: int = FAKE_OLLAMA_SEED):
+        self.profiles = {name: dict(profile) for name, profile in DEFAULT_PROFILES.items()}
+        for name, overrides in (profiles or {}).items():
+            self.profiles.setdefault(name, dict(DEFAULT_PROFILES["qwen2.5:7b"])).update(overrides)
+        self.speed = max(speed, 1e-6)
+        self.random = random.Random(seed)
+        self.slots = {name: asyncio.Semaphore(int(profile.get("parallel", 1))) for name, profile in self.profiles.items()}
+        self.loaded: Dict[str, Dict[str, Any]] = {}  # modelo -> {expires_at, num_ctx}
+        self.load_locks = {name: asyncio.Lock() for name in self.profiles}
+        self.last_prompt: Dict[str, str] = {}  # simula o KV cache de prefixo por modelo
+        self.stats = {"requests": 0, "streams": 0, "errors": 0, "loads": 0, "cancelled": 0, "embeddings": 0}
+
+    async def sleep(self, seconds: float):
+        if seconds > 0:
+            await asyncio.sleep(seconds / self.speed)
+
+    def profile(self, model: str) -> Optional[Dict[str, Any]]:
+        return self.profiles.get(model)
+
+    def is_loaded(self, model: str) -> bool:
+        info = self.loaded.get(model)
+        if info is None:
+            return False
+        if info["expires_at"] is not None and info["expires_at"] <= time.time():
+            del self.loaded[model]
+            self.last_prompt.pop(model, None)
+            return False
+        return True
+
+    async def ensure_loaded(self, model: str, keep_alive: Any, num_ctx: Optional[int]) -> float:
+        """Carrega o modelo se preciso (mudança de num_ctx também recarrega); retorna load_duration"""
+        async with self.load_locks.setdefault(model, asyncio.Lock()):
+            start = time.monotonic()
+            info = self.loaded.get(model) if self.is_loaded(model) else None
+            if info is None or (num_ctx is not None and info.get("num_ctx") not in (None, num_ctx)):
+                await self.sleep(self.profiles[model]["load_time"])
+                self.stats["loads"] += 1
+                self.last_prompt.pop(model, None)
+                info = {"num_ctx": num_ctx}
+            keep = _parse_keep_alive(keep_alive)
+            if keep == 0:
+                self.loaded.pop(model, None)
+            else:
+                info["expires_at"] = None if keep is None else time.time() + keep
+                info["num_ctx"] = num_ctx if num_ctx is not None else info.get("num_ctx")
+                self.loaded[model] = info
+            return time.monotonic() - start
+
+    def should_fail(self, model: str) -> bool:
+        return self.random.random() < float(self.profiles[model].get("error_rate", 0))
+
+    def prompt_eval_count(self, model: str, prompt: str) -> int:
+        """Tokens avaliados: só o que vem depois do prefixo em comum com o prompt anterior"""
+        previous = self.last_prompt.get(model, "")
+        common = 0
+        for a, b in zip(previous, prompt):
+            if a != b:
+                break
+            common += 1
+        self.last_prompt[model] = prompt
+        return max(1, _tokens(prompt) - _tokens(prompt[:common]))
+
+    # --- Respostas determinísticas ---
+
+    def reply_for(self, model: str, messages: List[Dict[str, str]], options: Dict[str, Any],
+                  response_format: Any = None) -> Tuple[str, str]:
+        """Texto da resposta e done_reason"""
+        system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+        user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+
+        if "JSON A CORRIGIR:" in user:
+            text = _close_brackets(user.split("JSON A CORRIGIR:", 1)[1].strip())
+        elif "Crie um plano de ação em JSON" in user or '"Maestro"' in system:
+            text = json.dumps(ORCHESTRATOR_PLAN, ensure_ascii=False, indent=2)
+        elif "plano de estrutura de arquivos" in user:
+            text = json.dumps(BUILDER_PLAN, ensure_ascii=False, indent=2)
+        elif "Caminho do Arquivo:" in user:
+            path = re.search(r"Caminho do Arquivo:\*\*\s*`([^`]+)`", user)
+            extension = os.path.splitext(path.group(1))[1] if path else ".txt"
+            text = FILE_TEMPLATES.get(extension, "conteúdo gerado\n")
+        elif "CONTEÚDO ORIGINAL DO ARQUIVO" in user:
+            original = re.search(r"```\n(.*?)\n```", user, re.S)
+            text = (original.group(1) if original else "") + "\n<!-- modificado -->\n"
+        elif "Query de Busca" in user:
+            text = "melhores práticas " + " ".join(user.split()[-4:-2]).strip('"')
+        elif "De 0 a 10" in user and "confiança" in user:
+            # Autoavaliação da cascata: nota determinística entre 4 e 9
+            answer = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "assistant"), "")
+            text = str(4 + hashlib.sha256(answer.encode("utf-8")).digest()[0] % 6)
+        elif response_format is not None:
+            text = json.dumps({"ok": True})
+        else:
+            digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).digest()
+            length = min(int(options.get("num_predict") or DEFAULT_NUM_PREDICT), DEFAULT_NUM_PREDICT)
+            words = [WORDS[digest[i % len(digest)] % len(WORDS)] for i in range(max(length, 1))]
+            text = f"[{model}] " + " ".join(words)
+
+        # JSON malformado (falta o fechamento), para exercitar a validação e a correção
+        if text.startswith("{") and self.random.random() < float(self.profiles[model].get("json_error_rate", 0)):
+            text = text.rstrip().rstrip("}")
+        done_reason = "stop"
+        for stop in options.get("stop") or []:
+            if stop and stop in text:
+                text = text[:text.index(stop)]
+        num_predict = options.get("num_predict")
+        if num_predict is not None and num_predict >= 0 and _tokens(text) > num_predict:
+            text = text[:num_predict * CHARS_PER_TOKEN]
+            done_reason = "length"
+        return text, done_reason
+
+    @staticmethod
+    def split_tokens(text: str) -> List[str]:
+        return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)] or [""]
+
+
+def _error(status: int, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status, content={"error": message})
+
+
+def _timestamp() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _embedding(model: str, text: str) -> List[float]:
+    """Vetor determinístico e normalizado a partir do hash do texto"""
+    rng = random.Random(hashlib.sha256(f"{model}:{text}".encode("utf-8")).digest())
+    vector = [rng.uniform(-1, 1) for _ in range(EMBEDDING_DIMENSION)]
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+def create_app(profiles: Optional[Dict[str, Dict[str, Any]]] = None, speed: float = FAKE_OLLAMA_SPEED,
+               seed: int = FAKE_OLLAMA_SEED) -> FastAPI:
+    """Cria a aplicação do Ollama simulado"""
+    app = FastAPI(title="Fake Ollama", description="Ollama simulado para testes de carga e latência")
+    fake = FakeOllama(profiles, speed, seed)
+    app.state.fake = fake
+
+    async def generation(body: Dict[str, Any], messages: List[Dict[str, str]], chat: bool):
+        model = body.get("model", "")
+        profile = fake.profile(model)
+        if profile is None:
+            return _error(404, f"model '{model}' not found, try pulling it first")
+        options = body.get("options") or {}
+        fake.stats["requests"] += 1
+        start = time.monotonic()
+
+        # Sem prompt/mensagens: apenas carrega (ou descarrega com keep_alive 0)
+        if not messages or not any(m.get("content") for m in messages):
+            load_duration = await fake.ensure_loaded(model, body.get("keep_alive"), options.get("num_ctx"))
+            return JSONResponse({"model": model, "created_at": _timestamp(), "response": "", "done": True,
+                                 "done_reason": "load", "load_duration": int(load_duration * 1e9)})
+
+        if fake.should_fail(model):
+            fake.stats["errors"] += 1
+            return _error(500, f"simulated failure for model '{model}'")
+
+        text, done_reason = fake.reply_for(model, messages, options, body.get("format"))
+        pieces = fake.split_tokens(text)
+        token_time = 1 / profile["tokens_per_second"] if profile["tokens_per_second"] else 0
+
+        def content(piece: str) -> Dict[str, Any]:
+            if chat:
+                return {"message": {"role": "assistant", "content": piece}}
+            return {"response": piece}
+
+        async def evaluate_prompt() -> Dict[str, Any]:
+            """Carga (se preciso) e avaliação do prompt; chamado com o slot do modelo ocupado"""
+            load_duration = await fake.ensure_loaded(model, body.get("keep_alive"), options.get("num_ctx"))
+            prompt_eval_count = fake.prompt_eval_count(model, "".join(m.get("content", "") for m in messages))
+            prompt_time = profile["ttft"] + prompt_eval_count / profile["prompt_tokens_per_second"]
+            await fake.sleep(prompt_time)
+            return {
+                "load_duration": int(load_duration * 1e9),
+                "prompt_eval_count": prompt_eval_count,
+                "prompt_eval_duration": int(prompt_time / fake.speed * 1e9),
+            }
+
+        def final(counters: Dict[str, Any], eval_start: float) -> Dict[str, Any]:
+            return {
+                "model": model,
+                "created_at": _timestamp(),
+                "done": True,
+                "done_reason": done_reason,
+                "total_duration": int((time.monotonic() - start) * 1e9),
+                **counters,
+                "eval_count": len(pieces),
+                "eval_duration": int((time.monotonic() - eval_start) * 1e9),
+            }
+
+        if not body.get("stream", True):
+            async with fake.slots[model]:
+                counters = await evaluate_prompt()
+                eval_start = time.monotonic()
+                await fake.sleep(token_time * len(pieces))
+            return JSONResponse({**content(text), **final(counters, eval_start)})
+
+        # Streaming: o slot fica ocupado até o fim ou até o cliente desconectar
+        fake.stats["streams"] += 1
+
+        async def ndjson():
+            try:
+                async with fake.slots[model]:
+                    counters = await evaluate_prompt()
+                    eval_start = time.monotonic()
+                    for piece in pieces:
+                        yield json.dumps({"model": model, "created_at": _timestamp(), **content(piece), "done": False},
+                                         ensure_ascii=False) + "\n"
+                        await fake.sleep(token_time)
+                    yield json.dumps({**content(""), **final(counters, eval_start)}, ensure_ascii=False) + "\n"
+            except asyncio.CancelledError:
+                fake.stats["cancelled"] += 1
+                raise
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        return await generation(body, body.get("messages") or [], chat=True)
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        messages = []
+        if body.get("system"):
+            messages.append({"role": "system", "content": body["system"]})
+        if body.get("prompt"):
+            messages.append({"role": "user", "content": body["prompt"]})
+        return await generation(body, messages, chat=False)
+
+    @app.get("/api/tags")
+    async def tags():
+        return {
+            "models": [
+                {
+                    "name": name,
+                    "model": name,
+                    "modified_at": "2024-01-01T00:00:00Z",
+                    "size": profile.get("size", 0),
+                    "digest": hashlib.sha256(name.encode("utf-8")).hexdigest(),
+                    "details": {"family": name.split(":")[0], "format": "gguf"},
+                }
+                for name, profile in fake.profiles.items()
+            ]
+        }
+
+    @app.get("/api/ps")
+    async def ps():
+        models = []
+        for name in list(fake.loaded):
+            if not fake.is_loaded(name):
+                continue
+            expires_at = fake.loaded[name]["expires_at"]
+            models.append({
+                "name": name,
+                "model": name,
+                "size": fake.profiles[name].get("size", 0),
+                "size_vram": 0,
+                "digest": hashlib.sha256(name.encode("utf-8")).hexdigest(),
+                "expires_at": (datetime.fromtimestamp(expires_at, timezone.utc) if expires_at
+                               else datetime.now(timezone.utc) + timedelta(days=3650)).isoformat(),
+            })
+        return {"models": models}
+
+    async def embed_texts(model: str, texts: List[str], keep_alive: Any) -> Tuple[List[List[float]], float]:
+        async with fake.slots[model]:
+            load_duration = await fake.ensure_loaded(model, keep_alive, None)
+            profile = fake.profiles[model]
+            await fake.sleep(profile["ttft"] + sum(_tokens(t) for t in texts) / profile["prompt_tokens_per_second"])
+        fake.stats["embeddings"] += len(texts)
+        return [_embedding(model, text) for text in texts], load_duration
+
+    @app.post("/api/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        if fake.profile(model) is None:
+            return _error(404, f"model '{model}' not found, try pulling it first")
+        vectors, _ = await embed_texts(model, [body.get("prompt", "")], body.get("keep_alive"))
+        return {"embedding": vectors[0]}
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        if fake.profile(model) is None:
+            return _error(404, f"model '{model}' not found, try pulling it first")
+        texts = body.get("input", "")
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        vectors, load_duration = await embed_texts(model, texts, body.get("keep_alive"))
+        return {"model": model, "embeddings": vectors, "load_duration": int(load_duration * 1e9),
+                "prompt_eval_count": sum(_tokens(t) for t in texts)}
+
+    @app.get("/api/version")
+    async def version():
+        return {"version": "0.0.0-fake"}
+
+    @app.get("/fake/stats")
+    async def fake_stats():
+        """Contadores do simulador (fora da API do Ollama)"""
+        return {**fake.stats, "loaded": sorted(name for name in fake.loaded if fake.is_loaded(name))}
+
+    return app
+
+
+def load_profiles(path: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Ollama simulado para testes de carga e latência")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--config", default=FAKE_OLLAMA_CONFIG, help="JSON com perfis por modelo")
+    parser.add_argument("--speed", type=float, default=FAKE_OLLAMA_SPEED, help="Acelera todos os tempos simulados")
+    parser.add_argument("--seed", type=int, default=FAKE_OLLAMA_SEED)
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(load_profiles(args.config), args.speed, args.seed), host=args.host, port=args.port)
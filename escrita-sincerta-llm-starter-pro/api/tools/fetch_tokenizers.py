@@ -0,0 +1,72 @@
+"""
+Download dos tokenizers usados na contagem de tokens do prompt
+Baixa o tokenizer.json de cada família de modelo (MODEL_FAMILIES) do Hugging Face para
+TOKENIZER_CACHE_DIR. Sem esses arquivos (ou sem o pacote `tokenizers`) a API usa a
+estimativa por caracteres e /routing/stats mostra token_counter "heuristic".
+Repositórios com acesso restrito (llama3.1, codegemma) exigem HF_TOKEN de uma conta
+que aceitou a licença do modelo. A API carrega os arquivos no startup: reinicie-a depois.
+
+Uso (no diretório api):
+    python -m tools.fetch_tokenizers [--family qwen2.5] [--force]
+"""
+
+import os
+import argparse
+import urllib.request
+from pathlib import Path
+from typing import List, Optional
+
+from tools.prompt_builder import MODEL_FAMILIES, TOKENIZER_CACHE_DIR
+
+HF_ENDPOINT = os.getenv("HF_ENDPOINT", "https://huggingface.co").rstrip("/")
+HF_TOKEN = os.getenv("HF_TOKEN")
+DOWNLOAD_TIMEOUT = 60
+
+
+def tokenizer_url(repo: str) -> str:
+    return f"{HF_ENDPOINT}/{repo}/resolve/main/tokenizer.json"
+
+
+def fetch(family: str, cache_dir: Path = TOKENIZER_CACHE_DIR, force: bool = False) -> Optional[Path]:
+    """Baixa o tokenizer da família (None se falhar); arquivos já em cache são mantidos"""
+    config = MODEL_FAMILIES[family]
+    path = cache_dir / config["tokenizer"]
+    if path.exists() and not force:
+        print(f"  {family}: já em cache ({path})")
+        return path
+    request = urllib.request.Request(tokenizer_url(config["hf_repo"]))
+    if HF_TOKEN:
+        request.add_header("Authorization", f"Bearer {HF_TOKEN}")
+    try:
+        with urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT) as response:
+            data = response.read()
+    except OSError as e:
+        hint = " (repositório restrito: defina HF_TOKEN)" if getattr(e, "code", None) in (401, 403) else ""
+        print(f"  {family}: falha ao baixar de {config['hf_repo']}: {e}{hint}")
+        return None
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Temporário + os.replace: a API nunca lê um tokenizer pela metade
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+    print(f"  {family}: {len(data) / 1024:.0f} KB em {path}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Baixa os tokenizers das famílias de modelo para TOKENIZER_CACHE_DIR")
+    parser.add_argument("--family", action="append", choices=sorted(MODEL_FAMILIES),
+                        help="Família a baixar (repetível; padrão: todas)")
+    parser.add_argument("--force", action="store_true", help="Baixa de novo mesmo se já estiver em cache")
+    args = parser.parse_args()
+
+    families: List[str] = args.family or list(MODEL_FAMILIES)
+    print(f"Tokenizers em {TOKENIZER_CACHE_DIR}")
+    fetched = [family for family in families if fetch(family, force=args.force) is not None]
+    print(f"{len(fetched)}/{len(families)} famílias com tokenizer local")
+    if len(fetched) < len(families):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
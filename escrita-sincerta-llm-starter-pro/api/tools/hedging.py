@@ -0,0 +1,214 @@
+"""
+Requisições com hedge entre modelos
+Se o primeiro token não chega dentro do prazo (percentil do TTFT medido do modelo),
+a mesma requisição é enviada ao próximo melhor modelo do router; o primeiro stream
+a produzir tokens vence e o outro é cancelado (a conexão fecha e o Ollama para de decodificar).
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any, List, Optional, Deque, Callable, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+# Opt-in: em CPU, o segundo modelo disputa memória e núcleos com o primeiro
+HEDGING_ENABLED = os.getenv("OLLAMA_HEDGING_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("OLLAMA_HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_DEADLINE = float(os.getenv("OLLAMA_HEDGE_MIN_DEADLINE", "2"))
+HEDGE_DEFAULT_DEADLINE = float(os.getenv("OLLAMA_HEDGE_DEFAULT_DEADLINE", "20"))
+HEDGE_MIN_SAMPLES = int(os.getenv("OLLAMA_HEDGE_MIN_SAMPLES", "10"))
+# Orçamento global: fração das requisições que pode gerar hedge e hedges simultâneos
+HEDGE_BUDGET_RATIO = float(os.getenv("OLLAMA_HEDGE_BUDGET_RATIO", "0.1"))
+HEDGE_MAX_CONCURRENT = int(os.getenv("OLLAMA_HEDGE_MAX_CONCURRENT", "2"))
+HEDGE_BUDGET_WINDOW = 300
+TTFT_SAMPLES = 200
+
+
+class TTFTTracker:
+    """Amostras recentes de tempo até o primeiro token por modelo"""
+
+    def __init__(self, max_samples: int = TTFT_SAMPLES):
+        self.samples: Dict[str, Deque[float]] = {}
+        self.max_samples = max_samples
+
+    def record(self, model: str, ttft: float):
+        self.samples.setdefault(model, deque(maxlen=self.max_samples)).append(ttft)
+
+    def percentile(self, model: str, q: float) -> Optional[float]:
+        samples = sorted(self.samples.get(model) or ())
+        if not samples:
+            return None
+        return samples[int(q * (len(samples) - 1))]
+
+    def deadline(self, model: str) -> float:
+        """Prazo para o primeiro token antes de disparar o hedge"""
+        if len(self.samples.get(model) or ()) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DEADLINE
+        return max(self.percentile(model, HEDGE_PERCENTILE), HEDGE_MIN_DEADLINE)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            model: {
+                "samples": len(samples),
+                "p50": self.percentile(model, 0.5),
+                "p95": self.percentile(model, 0.95),
+                "deadline": self.deadline(model),
+            }
+            for model, samples in self.samples.items()
+        }
+
+
+class HedgeBudget:
+    """Limita hedges a uma fração das requisições recentes e a um máximo simultâneo"""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET_RATIO, max_concurrent: int = HEDGE_MAX_CONCURRENT,
+                 window: float = HEDGE_BUDGET_WINDOW):
+        self.ratio = ratio
+        self.max_concurrent = max_concurrent
+        self.window = window
+        self.requests: Deque[float] = deque()
+        self.hedges: Deque[float] = deque()
+        self.active = 0
+
+    def _trim(self, now: float):
+        cutoff = now - self.window
+        for samples in (self.requests, self.hedges):
+            while samples and samples[0] < cutoff:
+                samples.popleft()
+
+    def note_request(self):
+        self.requests.append(time.monotonic())
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        self._trim(now)
+        # +1 permite o primeiro hedge mesmo com pouco tráfego
+        if self.active >= self.max_concurrent or len(self.hedges) + 1 > self.ratio * len(self.requests) + 1:
+            return False
+        self.hedges.append(now)
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active = max(0, self.active - 1)
+
+
+class _Leg:
+    """Um dos streams concorrentes; guarda os chunks lidos até o primeiro token"""
+
+    def __init__(self, model: str, iterator: AsyncIterator[Dict[str, Any]]):
+        self.model = model
+        self.iterator = iterator
+        self.buffer: List[Dict[str, Any]] = []
+        self.task: Optional[asyncio.Task] = None
+
+    async def first_token(self) -> "_Leg":
+        async for chunk in self.iterator:
+            self.buffer.append(chunk)
+            if chunk.get("message", {}).get("content") or chunk.get("done"):
+                return self
+        return self
+
+    def start(self) -> asyncio.Task:
+        self.task = asyncio.ensure_future(self.first_token())
+        return self.task
+
+    async def close(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            # wait() não propaga o cancelamento da task da perna para quem está fechando
+            await asyncio.wait({self.task})
+        try:
+            await self.iterator.aclose()
+        except Exception:
+            pass
+
+
+class Hedger:
+    """
+    Coordenação de hedge entre o modelo escolhido e o de reserva
+
+    - Prazo por modelo a partir do percentil do TTFT medido
+    - Falha rápida do primário também aciona o reserva (failover)
+    - Orçamento global para não amplificar a carga
+    """
+
+    def __init__(self, enabled: bool = HEDGING_ENABLED):
+        self.enabled = enabled
+        self.ttft = TTFTTracker()
+        self.budget = HedgeBudget()
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "failovers": 0, "budget_denied": 0}
+
+    async def stream(self, model: str, backup: str,
+                     open_stream: Callable[[str], AsyncIterator[Dict[str, Any]]]) -> AsyncIterator[Dict[str, Any]]:
+        """Produz os chunks do stream vencedor (o campo "model" dos chunks indica qual foi)"""
+        self.stats["requests"] += 1
+        self.budget.note_request()
+        primary = _Leg(model, open_stream(model))
+        legs = [primary]
+        pending = {primary.start()}
+        hedge_acquired = False
+        winner: Optional[_Leg] = None
+        last_error: Optional[BaseException] = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.ttft.deadline(model))
+            while winner is None:
+                for task in done:
+                    if task.exception() is None:
+                        winner = task.result()
+                        break
+                    last_error = task.exception()
+                if winner is not None:
+                    break
+
+                # Sem token no prazo (ou falha do primário): dispara o modelo de reserva uma vez
+                if len(legs) == 1:
+                    start_backup = False
+                    if last_error is not None:
+                        start_backup = True
+                        self.stats["failovers"] += 1
+                        logger.warning(f"Falha em {model} antes do primeiro token, usando {backup}: {last_error}")
+                    elif self.budget.try_acquire():
+                        start_backup = hedge_acquired = True
+                        self.stats["hedged"] += 1
+                        logger.info(f"Sem primeiro token de {model} no prazo, enviando hedge para {backup}")
+                    else:
+                        self.stats["budget_denied"] += 1
+                    if start_backup:
+                        backup_leg = _Leg(backup, open_stream(backup))
+                        legs.append(backup_leg)
+                        pending.add(backup_leg.start())
+
+                if not pending:
+                    raise last_error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+            if winner is not primary:
+                self.stats["hedge_wins"] += 1
+            for leg in legs:
+                if leg is not winner:
+                    await leg.close()
+
+            for chunk in winner.buffer:
+                yield chunk
+            if not (winner.buffer and winner.buffer[-1].get("done")):
+                async for chunk in winner.iterator:
+                    yield chunk
+        finally:
+            for leg in legs:
+                await leg.close()
+            if hedge_acquired:
+                self.budget.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            **self.stats,
+            "active_hedges": self.budget.active,
+            "budget_ratio": self.budget.ratio,
+            "ttft": self.ttft.get_stats(),
+        }
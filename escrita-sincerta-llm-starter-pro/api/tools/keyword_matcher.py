@@ -0,0 +1,120 @@
+"""
+Casamento de palavras-chave por palavra inteira, em uma única passada
+O texto é normalizado uma vez (minúsculas, sem pontuação) em um conjunto de palavras;
+cada palavra-chave vira uma consulta a esse conjunto. Sem casamento por substring,
+"ou" não casa mais com "outro" nem "api" com "rapidez".
+
+Formas aceitas nas listas:
+- palavra: casa a palavra e o plural simples ("bug" casa "bugs", "erro" casa "erros")
+- frase com espaço ou pontuação: casa a sequência de palavras ("não funciona", "ci/cd"),
+  com qualquer pontuação ou espaço entre elas
+- radical terminado em "*": casa qualquer palavra que comece com ele ("documenta*")
+"""
+
+import re
+import string
+from functools import lru_cache
+from typing import Dict, List, Hashable, Iterable, Mapping, NamedTuple, Optional, FrozenSet, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+# Pontuação ASCII e tipográfica comum em mensagens
+PUNCTUATION = string.punctuation + "“”‘’«»—–…·"
+_WORD = re.compile(r"\w+")
+
+
+class NormalizedText(NamedTuple):
+    words: FrozenSet[str]  # palavras do texto e suas formas sem o plural
+    lowered: str  # texto em minúsculas (verificação das frases)
+
+
+@lru_cache(maxsize=64)
+def normalize(text: str) -> NormalizedText:
+    """
+    Normalização compartilhada por todos os matchers (em cache para a mesma mensagem).
+    O split em C vem primeiro; o trabalho em Python é só sobre as palavras distintas.
+    """
+    lowered = text.lower()
+    words = set()
+    for token in set(lowered.split()):
+        if not token.isalnum():
+            token = token.strip(PUNCTUATION)
+            if not token.isalnum():
+                # Pontuação no meio ("ci/cd", "e-commerce"): cada parte é uma palavra
+                words.update(_WORD.findall(token))
+                continue
+        words.add(token)
+    for word in list(words):
+        if len(word) > 3 and word.endswith("s"):
+            words.add(word[:-1])
+            if word.endswith("es"):
+                words.add(word[:-2])
+    return NormalizedText(frozenset(words), lowered)
+
+
+def _keyword_words(keyword: str) -> List[str]:
+    return _WORD.findall(keyword.lower())
+
+
+def _phrase_pattern(words: List[str]) -> "re.Pattern":
+    return re.compile(r"(?<!\w)" + r"\W+".join(map(re.escape, words)) + r"(?!\w)")
+
+
+class KeywordMatcher:
+    """
+    Listas de palavras-chave por categoria, montadas uma vez
+
+    `counts` devolve quantas palavras-chave distintas de cada categoria aparecem no texto;
+    `first` devolve a primeira categoria (na ordem de declaração) com alguma ocorrência.
+    """
+
+    def __init__(self, categories: Mapping[K, Iterable[str]]):
+        self.categories: List[K] = list(categories)
+        self.words: Dict[str, List[K]] = {}
+        self.phrases: Dict[str, List[K]] = {}
+        self.stems: Dict[str, List[K]] = {}
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                parts = _keyword_words(keyword)
+                if not parts:
+                    continue
+                if keyword.endswith("*"):
+                    target, key = self.stems, parts[0]
+                elif len(parts) > 1:
+                    target, key = self.phrases, " ".join(parts)
+                else:
+                    target, key = self.words, parts[0]
+                if category not in target.setdefault(key, []):
+                    target[key].append(category)
+        self._stem_prefixes = tuple(self.stems)
+        # Frase: todas as palavras no conjunto e depois a sequência confirmada no texto
+        self._phrase_checks = [(phrase, phrase.split(), _phrase_pattern(phrase.split())) for phrase in self.phrases]
+
+    def find(self, text: str) -> Dict[str, List[K]]:
+        """Palavras-chave encontradas no texto -> categorias de cada uma"""
+        normalized = normalize(text)
+        words = normalized.words
+        found = {keyword: categories for keyword, categories in self.words.items() if keyword in words}
+        for phrase, parts, pattern in self._phrase_checks:
+            if all(part in words for part in parts) and pattern.search(normalized.lowered):
+                found[phrase] = self.phrases[phrase]
+        if self._stem_prefixes:
+            for word in words:
+                if word.startswith(self._stem_prefixes):
+                    for stem in self._stem_prefixes:
+                        if word.startswith(stem):
+                            found[f"{stem}*"] = self.stems[stem]
+        return found
+
+    def counts(self, text: str) -> Dict[K, int]:
+        """Palavras-chave distintas encontradas por categoria (todas as categorias presentes)"""
+        counts = {category: 0 for category in self.categories}
+        for categories in self.find(text).values():
+            for category in categories:
+                counts[category] += 1
+        return counts
+
+    def first(self, text: str) -> Optional[K]:
+        """Primeira categoria declarada com alguma palavra-chave no texto"""
+        matched = {category for categories in self.find(text).values() for category in categories}
+        return next((category for category in self.categories if category in matched), None)
@@ -0,0 +1,252 @@
+"""
+Sketches de latência com decaimento por modelo
+Histogramas com buckets em escala logarítmica (erro relativo de ~4%, como um HDR)
+cujos pesos caem pela metade a cada ROUTER_LATENCY_HALF_LIFE segundos: o router
+enxerga o comportamento recente dos modelos, não a média desde o startup.
+Com eles, o tempo de conclusão de uma requisição é previsto a partir dos tokens do
+prompt e do tamanho esperado da resposta do agente.
+"""
+
+import os
+import math
+import time
+from typing import Dict, Any, List, Optional
+
+from tools.usage_metrics import COLD_LOAD_THRESHOLD, NS
+
+# Configurações
+LATENCY_HALF_LIFE = float(os.getenv("ROUTER_LATENCY_HALF_LIFE", "600"))
+# SLO padrão de latência total em segundos (0 = só quando a requisição pede `latency_slo`)
+LATENCY_SLO = float(os.getenv("ROUTER_LATENCY_SLO", "0"))
+# Quantil usado nas previsões (tempos no quantil, vazões no quantil complementar)
+SLO_QUANTILE = float(os.getenv("ROUTER_SLO_QUANTILE", "0.9"))
+DEFAULT_OUTPUT_TOKENS = int(os.getenv("ROUTER_SLO_DEFAULT_OUTPUT_TOKENS", "512"))
+# Carga do disco assumida para um modelo fora da memória sem medições de carga
+DEFAULT_LOAD_TIME = float(os.getenv("ROUTER_SLO_DEFAULT_LOAD_TIME", "10"))
+# Peso mínimo (amostras já decaídas) para usar um sketch nas previsões
+MIN_WEIGHT = 3.0
+BUCKET_GROWTH = 1.08
+# Decaimento aplicado no máximo uma vez por este intervalo (s)
+DECAY_INTERVAL = 1.0
+
+
+class DecayingHistogram:
+    """Histograma log-linear com pesos que decaem exponencialmente no tempo"""
+
+    def __init__(self, min_value: float, max_value: float, half_life: float = LATENCY_HALF_LIFE,
+                 growth: float = BUCKET_GROWTH):
+        self.min_value = min_value
+        self.max_value = max_value
+        self.half_life = half_life
+        self.log_growth = math.log(growth)
+        self.buckets: List[float] = [0.0] * (self._index(max_value) + 1)
+        self.weight = 0.0
+        self.weighted_sum = 0.0
+        self.last_decay = time.time()
+
+    def _index(self, value: float) -> int:
+        value = min(max(value, self.min_value), self.max_value)
+        return int(math.log(value / self.min_value) / self.log_growth)
+
+    def _value(self, index: int) -> float:
+        # Média geométrica das bordas do bucket
+        return self.min_value * math.exp((index + 0.5) * self.log_growth)
+
+    def _decay(self, now: float):
+        elapsed = now - self.last_decay
+        if elapsed < DECAY_INTERVAL:
+            return
+        factor = 0.5 ** (elapsed / self.half_life)
+        self.buckets = [count * factor for count in self.buckets]
+        self.weight *= factor
+        self.weighted_sum *= factor
+        self.last_decay = now
+
+    def record(self, value: float):
+        if value is None or value < 0 or math.isnan(value):
+            return
+        self._decay(time.time())
+        self.buckets[self._index(value)] += 1.0
+        self.weight += 1.0
+        self.weighted_sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        self._decay(time.time())
+        if self.weight <= 0:
+            return None
+        target = q * self.weight
+        cumulative = 0.0
+        for index, count in enumerate(self.buckets):
+            cumulative += count
+            if count and cumulative >= target:
+                return self._value(index)
+        return self._value(len(self.buckets) - 1)
+
+    def mean(self) -> Optional[float]:
+        return self.weighted_sum / self.weight if self.weight > 0 else None
+
+    @property
+    def reliable(self) -> bool:
+        self._decay(time.time())
+        return self.weight >= MIN_WEIGHT
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Estado serializável (buckets esparsos); o decaimento continua a partir de last_decay"""
+        return {
+            "buckets": {str(index): count for index, count in enumerate(self.buckets) if count},
+            "weight": self.weight,
+            "weighted_sum": self.weighted_sum,
+            "last_decay": self.last_decay,
+        }
+
+    def load(self, data: Dict[str, Any]):
+        """Restaura um estado de `to_dict` (as amostras envelhecem pelo tempo desde last_decay)"""
+        self.buckets = [0.0] * len(self.buckets)
+        for index, count in data.get("buckets", {}).items():
+            if 0 <= int(index) < len(self.buckets):
+                self.buckets[int(index)] = float(count)
+        self.weight = float(data.get("weight", 0.0))
+        self.weighted_sum = float(data.get("weighted_sum", 0.0))
+        self.last_decay = min(float(data.get("last_decay", time.time())), time.time())
+
+    def get_stats(self) -> Dict[str, Any]:
+        def rounded(value: Optional[float]) -> Optional[float]:
+            return round(value, 3) if value is not None else None
+        return {
+            "weight": round(self.weight, 2),
+            "mean": rounded(self.mean()),
+            "p50": rounded(self.quantile(0.5)),
+            "p90": rounded(self.quantile(0.9)),
+            "p99": rounded(self.quantile(0.99)),
+        }
+
+
+def seconds_histogram() -> DecayingHistogram:
+    return DecayingHistogram(0.001, 3600)
+
+
+def rate_histogram() -> DecayingHistogram:
+    return DecayingHistogram(0.1, 100000)
+
+
+class ModelLatencyProfile:
+    """Sketches de um modelo: TTFT, carga a frio, vazões de prompt e de geração e tempo total"""
+
+    def __init__(self):
+        self.ttft = seconds_histogram()
+        self.cold_load = seconds_histogram()
+        self.prompt_tps = rate_histogram()
+        self.generation_tps = rate_histogram()
+        self.response_time = seconds_histogram()
+
+    def record(self, response_time: float, usage: Dict[str, int]):
+        self.response_time.record(response_time)
+        load = usage.get("load_duration", 0) / NS
+        prompt_seconds = usage.get("prompt_eval_duration", 0) / NS
+        if "prompt_eval_duration" in usage or "load_duration" in usage:
+            self.ttft.record(load + prompt_seconds)
+        if load > COLD_LOAD_THRESHOLD:
+            self.cold_load.record(load)
+        if usage.get("prompt_eval_count") and prompt_seconds > 0:
+            self.prompt_tps.record(usage["prompt_eval_count"] / prompt_seconds)
+        generation_seconds = usage.get("eval_duration", 0) / NS
+        if usage.get("eval_count") and generation_seconds > 0:
+            self.generation_tps.record(usage["eval_count"] / generation_seconds)
+
+    def sketches(self) -> Dict[str, DecayingHistogram]:
+        return {
+            "ttft": self.ttft,
+            "cold_load": self.cold_load,
+            "prompt_tps": self.prompt_tps,
+            "generation_tps": self.generation_tps,
+            "response_time": self.response_time,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "ttft": self.ttft.get_stats(),
+            "cold_load": self.cold_load.get_stats(),
+            "prompt_tokens_per_second": self.prompt_tps.get_stats(),
+            "generation_tokens_per_second": self.generation_tps.get_stats(),
+            "response_time": self.response_time.get_stats(),
+        }
+
+
+class LatencyTracker:
+    """Perfis de latência por modelo e tamanho das respostas por agente"""
+
+    def __init__(self, quantile: float = SLO_QUANTILE):
+        self.quantile = quantile
+        self.profiles: Dict[str, ModelLatencyProfile] = {}
+        self.output_tokens: Dict[str, DecayingHistogram] = {}
+
+    def profile(self, model: str) -> ModelLatencyProfile:
+        return self.profiles.setdefault(model, ModelLatencyProfile())
+
+    def output_histogram(self, agent: Optional[str] = None) -> DecayingHistogram:
+        return self.output_tokens.setdefault(agent or "direct_chat", DecayingHistogram(1, 100000))
+
+    def record(self, model: str, response_time: float, usage: Dict[str, int], agent: Optional[str] = None):
+        self.profile(model).record(response_time, usage)
+        if usage.get("eval_count"):
+            self.output_histogram(agent).record(usage["eval_count"])
+
+    def service_time(self, model: str) -> Optional[float]:
+        """Tempo médio recente de resposta do modelo (None sem medições)"""
+        profile = self.profiles.get(model)
+        return profile.response_time.mean() if profile else None
+
+    def expected_output_tokens(self, agent: Optional[str] = None) -> int:
+        """Tamanho da resposta do agente no quantil das previsões"""
+        histogram = self.output_tokens.get(agent or "direct_chat")
+        if histogram is None or not histogram.reliable:
+            return DEFAULT_OUTPUT_TOKENS
+        return int(histogram.quantile(self.quantile))
+
+    def predict(self, model: str, prompt_tokens: int, output_tokens: int,
+                resident: bool = True) -> Optional[Dict[str, float]]:
+        """
+        Tempo previsto até o primeiro token e até o fim da resposta (None sem medições suficientes).
+        Pessimista no quantil configurado: tempos no quantil, vazões no quantil complementar.
+        """
+        profile = self.profiles.get(model)
+        if profile is None or not (profile.prompt_tps.reliable and profile.generation_tps.reliable):
+            return None
+        low = 1.0 - self.quantile
+        load = 0.0
+        if not resident:
+            load = profile.cold_load.quantile(self.quantile) if profile.cold_load.reliable else DEFAULT_LOAD_TIME
+        prefill = prompt_tokens / profile.prompt_tps.quantile(low)
+        decode = output_tokens / profile.generation_tps.quantile(low)
+        return {
+            "load": round(load, 3),
+            "ttft": round(load + prefill, 3),
+            "total": round(load + prefill + decode, 3),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "models": {
+                model: {name: sketch.to_dict() for name, sketch in profile.sketches().items()}
+                for model, profile in self.profiles.items()
+            },
+            "output_tokens": {agent: histogram.to_dict() for agent, histogram in self.output_tokens.items()},
+        }
+
+    def load(self, data: Dict[str, Any]):
+        """Restaura os sketches de `to_dict` (nomes desconhecidos são ignorados)"""
+        for model, sketches in data.get("models", {}).items():
+            profile_sketches = self.profile(model).sketches()
+            for name, sketch in sketches.items():
+                if name in profile_sketches:
+                    profile_sketches[name].load(sketch)
+        for agent, histogram in data.get("output_tokens", {}).items():
+            self.output_histogram(agent).load(histogram)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "half_life": LATENCY_HALF_LIFE,
+            "quantile": self.quantile,
+            "models": {model: profile.get_stats() for model, profile in self.profiles.items()},
+            "expected_output_tokens": {agent: self.expected_output_tokens(agent) for agent in self.output_tokens},
+        }
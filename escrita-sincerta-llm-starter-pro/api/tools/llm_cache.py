@@ -0,0 +1,182 @@
+"""
+Cache persistente de respostas do LLM
+Armazena em SQLite as respostas de chamadas determinísticas (temperature 0 ou seed fixa),
+com expiração por TTL, despejo LRU e limites de entradas e de tamanho em disco.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from tools.single_flight import request_key
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/cache/llm_responses.sqlite")
+CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_MB", "100")) * 1024 * 1024
+
+
+class LLMResponseCache:
+    """
+    Cache em disco para respostas do Ollama
+
+    - Opt-in (LLM_CACHE_ENABLED) e só para chamadas determinísticas
+    - Chave: modelo, mensagens, opções (incluindo seed) e formato
+    - LRU por último acesso, TTL por entrada, limites de entradas e bytes
+    """
+
+    def __init__(self, path: str = CACHE_PATH, ttl: int = CACHE_TTL,
+                 max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES,
+                 enabled: bool = CACHE_ENABLED):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0, "errors": 0}
+        # Tamanho atual, mantido pelas operações na thread (get_stats não consulta o SQLite no event loop)
+        self.entries = 0
+        self.total_bytes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+            self._conn.commit()
+            self.entries, self.total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return self._conn
+
+    @staticmethod
+    def is_cacheable(payload: Dict[str, Any]) -> bool:
+        """Apenas gerações determinísticas: temperature 0 ou seed fixa"""
+        if payload.get("stream"):
+            return False
+        options = payload.get("options") or {}
+        return options.get("temperature") == 0 or options.get("seed") is not None
+
+    @staticmethod
+    def cache_key(payload: Dict[str, Any]) -> str:
+        return request_key({
+            "model": payload.get("model"),
+            "messages": payload.get("messages"),
+            "options": payload.get("options") or {},
+            "format": payload.get("format"),
+        })
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT response, expires_at, size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                self.entries -= 1
+                self.total_bytes -= row[2]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.stats["hits"] += 1
+            return json.loads(row[0])
+
+    def _put(self, key: str, model: str, data: Dict[str, Any]):
+        encoded = json.dumps(data, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, encoded, len(encoded.encode("utf-8")), now, now, now + self.ttl)
+            )
+            self.stats["stores"] += 1
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Remove expirados e, se preciso, os menos usados recentemente até caber nos limites"""
+        expired = conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,)).rowcount
+        self.stats["expired"] += max(expired, 0)
+
+        count, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        while count > self.max_entries or total_bytes > self.max_bytes:
+            row = conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC LIMIT 1").fetchone()
+            if row is None:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            count -= 1
+            total_bytes -= row[1]
+            self.stats["evictions"] += 1
+        self.entries, self.total_bytes = count, total_bytes
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Busca uma resposta (None em miss ou erro)"""
+        try:
+            return await asyncio.to_thread(self._get, key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Erro ao ler cache de respostas: {e}")
+            return None
+
+    async def put(self, key: str, model: str, data: Dict[str, Any]):
+        """Armazena uma resposta (erros são apenas registrados)"""
+        try:
+            await asyncio.to_thread(self._put, key, model, data)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Erro ao gravar cache de respostas: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estatísticas de uso do cache"""
+        stats = {"enabled": self.enabled, **self.stats}
+        lookups = self.stats["hits"] + self.stats["misses"]
+        stats["hit_rate"] = self.stats["hits"] / lookups if lookups else 0.0
+        if self.enabled and self._conn is not None:
+            stats.update({"entries": self.entries, "bytes": self.total_bytes})
+        stats.update({"max_entries": self.max_entries, "max_bytes": self.max_bytes, "ttl": self.ttl})
+        return stats
+
+
+# Singleton instance
+_cache_instance = None
+
+def get_llm_cache() -> LLMResponseCache:
+    """Obtém instância singleton do cache de respostas"""
+    global _cache_instance
+    if _cache_instance is None:
+        _cache_instance = LLMResponseCache()
+    return _cache_instance
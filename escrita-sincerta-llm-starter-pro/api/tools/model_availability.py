@@ -0,0 +1,196 @@
+"""
+Registro de disponibilidade de modelos
+Uma tarefa em background atualiza o inventário dos nós (/api/tags e /api/ps) a cada
+OLLAMA_AVAILABILITY_TTL segundos; falhas reais de requisição tiram o modelo de rotação
+por um tempo. O router só lê o registro, sem nenhuma chamada ao Ollama no caminho da requisição.
+Inventário vencido é servido enquanto um único refresh roda em background (stale-while-revalidate).
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Set
+
+from tools.ollama_pool import NodePool, get_node_pool
+from tools.ollama_client import OllamaClient, get_ollama_client
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+AVAILABILITY_TTL = float(os.getenv("OLLAMA_AVAILABILITY_TTL", "10"))
+# Inventário mais antigo que isso (refresh falhando) deixa de excluir modelos
+AVAILABILITY_STALE_AFTER = AVAILABILITY_TTL * 3
+# Falhas seguidas de requisições reais que tiram o modelo de rotação
+AVAILABILITY_MAX_FAILURES = int(os.getenv("OLLAMA_AVAILABILITY_MAX_FAILURES", "3"))
+AVAILABILITY_COOLDOWN = float(os.getenv("OLLAMA_AVAILABILITY_COOLDOWN", "30"))
+
+
+class AvailabilityRegistry:
+    """
+    Disponibilidade dos modelos a partir do inventário do pool e das falhas observadas
+
+    - Instalado em algum nó saudável (/api/tags) e residente (/api/ps)
+    - Modelo com falhas seguidas fica fora de rotação até o fim do cooldown
+    - `version` muda sempre que o conjunto de modelos disponíveis muda
+    """
+
+    def __init__(self, pool: Optional[NodePool] = None):
+        self.pool = pool or get_node_pool()
+        self.installed: Optional[Set[str]] = None  # None = inventário ainda desconhecido
+        self.resident: Set[str] = set()
+        self.last_refresh: Optional[float] = None
+        self.refresh_error: Optional[str] = None
+        self.consecutive_failures: Dict[str, int] = {}
+        self.down_until: Dict[str, float] = {}
+        self.version = 0
+        self._task: Optional[asyncio.Task] = None
+        self._revalidation: Optional[asyncio.Task] = None
+        self.stats = {
+            "refreshes": 0, "refresh_errors": 0, "lookups": 0, "marked_down": 0,
+            "inventory_fresh": 0, "inventory_stale": 0, "inventory_blocking": 0,
+        }
+
+    # --- Leitura (caminho da requisição) ---
+
+    def is_available(self, model: str) -> bool:
+        """Leitura em memória: instalado e fora de cooldown"""
+        self.stats["lookups"] += 1
+        down_until = self.down_until.get(model)
+        if down_until is not None:
+            if down_until > time.time():
+                return False
+            # Cooldown acabou: volta à rotação e uma nova falha recomeça a contagem
+            del self.down_until[model]
+            self.consecutive_failures.pop(model, None)
+            self.version += 1
+        if self.installed is None or self.is_stale():
+            return True
+        return model in self.installed
+
+    def is_resident(self, model: str) -> bool:
+        return model in self.resident
+
+    def is_stale(self) -> bool:
+        return self.last_refresh is None or time.time() - self.last_refresh > AVAILABILITY_STALE_AFTER
+
+    def is_fresh(self) -> bool:
+        return self.last_refresh is not None and time.time() - self.last_refresh <= AVAILABILITY_TTL
+
+    async def inventory(self) -> Optional[Set[str]]:
+        """
+        Modelos instalados nos nós saudáveis (None = nenhum nó respondeu ainda).
+        Dentro do TTL não há chamada ao Ollama; vencido, devolve o valor antigo e
+        dispara um refresh em background. Só a primeira consulta espera o Ollama.
+        """
+        if self.installed is not None:
+            if self.is_fresh():
+                self.stats["inventory_fresh"] += 1
+            else:
+                self.stats["inventory_stale"] += 1
+                self._revalidate()
+            return self.installed
+        self.stats["inventory_blocking"] += 1
+        await self._revalidate()
+        return self.installed
+
+    def _revalidate(self) -> asyncio.Task:
+        """Um único refresh em andamento, compartilhado por todas as consultas"""
+        if self._revalidation is None or self._revalidation.done():
+            self._revalidation = asyncio.create_task(self._safe_refresh(get_ollama_client()))
+        return self._revalidation
+
+    # --- Falhas reais ---
+
+    def record_success(self, model: str):
+        self.consecutive_failures.pop(model, None)
+
+    def record_failure(self, model: str):
+        failures = self.consecutive_failures.get(model, 0) + 1
+        self.consecutive_failures[model] = failures
+        if failures >= AVAILABILITY_MAX_FAILURES and model not in self.down_until:
+            self.down_until[model] = time.time() + AVAILABILITY_COOLDOWN
+            self.stats["marked_down"] += 1
+            self.version += 1
+            logger.warning(f"Modelo {model} fora de rotação por {AVAILABILITY_COOLDOWN:.0f}s após {failures} falhas")
+
+    def mark_down(self, model: str, until: float):
+        """Cooldown decidido fora deste processo (falhas contadas por outros workers)"""
+        if until <= time.time() or self.down_until.get(model, 0) >= until:
+            return
+        if model not in self.down_until:
+            self.stats["marked_down"] += 1
+            self.version += 1
+        self.down_until[model] = until
+
+    # --- Refresh em background ---
+
+    async def refresh(self, client: OllamaClient):
+        """Atualiza o inventário dos nós e recalcula os modelos instalados e residentes"""
+        await self.pool.check_all(client)
+        nodes = [node for node in self.pool.nodes if node.healthy and node.installed is not None]
+        if not nodes:
+            self.stats["refresh_errors"] += 1
+            self.refresh_error = "nenhum nó respondeu"
+            return
+        installed = set().union(*(node.installed for node in nodes))
+        resident = {model for node in nodes for model in node.resident if node.is_resident(model)}
+        if installed != self.installed:
+            self.version += 1
+        self.installed = installed
+        self.resident = resident
+        self.last_refresh = time.time()
+        self.refresh_error = None
+        self.stats["refreshes"] += 1
+
+    async def _safe_refresh(self, client: OllamaClient):
+        try:
+            await self.refresh(client)
+        except Exception as e:
+            self.stats["refresh_errors"] += 1
+            self.refresh_error = str(e)
+            logger.warning(f"Falha ao atualizar disponibilidade dos modelos: {e}")
+
+    async def _run(self, client: OllamaClient):
+        while True:
+            await self._safe_refresh(client)
+            await asyncio.sleep(AVAILABILITY_TTL)
+
+    def start(self, client: OllamaClient):
+        """Inicia o refresh em background (também é o health check dos nós)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(client))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            **self.stats,
+            "version": self.version,
+            "ttl": AVAILABILITY_TTL,
+            "age": round(now - self.last_refresh, 1) if self.last_refresh else None,
+            "stale": self.is_stale(),
+            "refresh_error": self.refresh_error,
+            "installed": sorted(self.installed) if self.installed is not None else None,
+            "resident": sorted(self.resident),
+            "down": {model: round(until - now, 1) for model, until in self.down_until.items() if until > now},
+        }
+
+
+# Singleton instance
+_registry_instance = None
+
+def get_availability_registry() -> AvailabilityRegistry:
+    """Obtém instância singleton do registro de disponibilidade"""
+    global _registry_instance
+    if _registry_instance is None:
+        _registry_instance = AvailabilityRegistry()
+    return _registry_instance
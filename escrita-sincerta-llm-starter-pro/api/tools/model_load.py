@@ -0,0 +1,37 @@
+"""
+Penalidade de carga no roteamento
+Os contadores vêm do cliente Ollama (slots do escalonador e requisições em andamento
+por nó). A espera prevista de uma nova requisição é o número de requisições à frente
+dela dividido pelos slots do modelo, vezes o tempo típico de uma resposta: o router
+distribui o trabalho entre os modelos em vez de empilhá-lo em um só.
+"""
+
+import os
+from typing import Dict, Any, Optional
+
+# Configurações
+# Pontos de score descontados por segundo de espera prevista na fila
+LOAD_WAIT_WEIGHT = float(os.getenv("ROUTER_LOAD_WAIT_WEIGHT", "0.5"))
+# Pontos descontados com todos os slots ocupados (proporcional à ocupação)
+LOAD_IN_FLIGHT_WEIGHT = float(os.getenv("ROUTER_LOAD_IN_FLIGHT_WEIGHT", "1.0"))
+# Tempo de resposta assumido para modelos ainda sem medições (s)
+DEFAULT_SERVICE_TIME = float(os.getenv("ROUTER_LOAD_DEFAULT_SERVICE_TIME", "10"))
+
+
+def requests_ahead(load: Dict[str, Any]) -> int:
+    """Requisições que uma nova requisição teria de esperar terminar"""
+    return max(0, load["in_flight"] + load["queued"] - load["capacity"] + 1)
+
+
+def expected_wait(load: Dict[str, Any], service_time: Optional[float] = None) -> float:
+    """Espera prevista na fila do modelo (s)"""
+    ahead = requests_ahead(load)
+    if not ahead:
+        return 0.0
+    return ahead / max(1, load["capacity"]) * (service_time or DEFAULT_SERVICE_TIME)
+
+
+def load_penalty(load: Dict[str, Any], service_time: Optional[float] = None) -> float:
+    """Desconto no score do modelo pela carga atual"""
+    occupancy = min(1.0, load["in_flight"] / max(1, load["capacity"]))
+    return LOAD_WAIT_WEIGHT * expected_wait(load, service_time) + LOAD_IN_FLIGHT_WEIGHT * occupancy
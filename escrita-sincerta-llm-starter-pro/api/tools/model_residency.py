@@ -0,0 +1,228 @@
+"""
+Gerenciador de residência de modelos no Ollama
+Pré-carrega modelos na inicialização, define o keep_alive de cada requisição e
+aprende quais modelos cada agente usa para aquecê-los antes da demanda. O que está
+residente vem do inventário dos nós (/api/ps), atualizado pelo registro de disponibilidade.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque, Counter
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Set, Tuple, Deque, TYPE_CHECKING
+
+from tools.request_context import current_agent
+from tools.prompt_builder import get_context_sizer
+
+if TYPE_CHECKING:
+    from tools.ollama_client import OllamaClient
+    from tools.ollama_pool import OllamaNode
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+KEEP_ALIVE_DEFAULT = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+KEEP_ALIVE_HOT = os.getenv("OLLAMA_KEEP_ALIVE_HOT", "2h")
+# Opt-in: carregar modelos que ninguém pediu pode despejar os que estão em uso (hosts só com CPU)
+PRELOAD_ON_STARTUP = os.getenv("OLLAMA_PRELOAD_MODELS", "false").lower() == "true"
+# Intervalo entre verificações dos modelos quentes que estão saindo da memória (s)
+REFRESH_INTERVAL = float(os.getenv("OLLAMA_PS_REFRESH_INTERVAL", "30"))
+HOT_WINDOW = float(os.getenv("OLLAMA_HOT_WINDOW", "3600"))
+HOT_MIN_USES = int(os.getenv("OLLAMA_HOT_MIN_USES", "3"))
+PRELOAD_TIMEOUT = 300
+
+
+def _parse_expires_at(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class ModelResidencyManager:
+    """
+    Residência de modelos em memória
+
+    - Estado real lido do inventário dos nós do pool (sem consultas próprias ao Ollama)
+    - keep_alive maior para modelos "quentes" (usados com frequência)
+    - Histórico agente -> modelo para aquecimento preditivo
+    - Pré-carga em background, sem bloquear requisições, em cada nó que tem o modelo
+    """
+
+    def __init__(self, client: "OllamaClient"):
+        self.client = client
+        self.model_uses: Dict[str, Deque[float]] = {}
+        self.agent_models: Dict[str, Counter] = {}
+        self._warming: Set[Tuple[str, str]] = set()  # (modelo, url do nó)
+        self._warm_tasks: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"preloads": 0, "preload_failures": 0, "predictive_warmups": 0}
+
+    # --- Política de keep_alive ---
+
+    def is_hot(self, model: str) -> bool:
+        uses = self.model_uses.get(model)
+        if not uses:
+            return False
+        cutoff = time.time() - HOT_WINDOW
+        return sum(1 for ts in uses if ts >= cutoff) >= HOT_MIN_USES
+
+    def keep_alive_for(self, model: str) -> str:
+        """keep_alive enviado com cada requisição ao modelo"""
+        return KEEP_ALIVE_HOT if self.is_hot(model) else KEEP_ALIVE_DEFAULT
+
+    # --- Aprendizado de uso ---
+
+    def record_use(self, model: str, agent: Optional[str] = None):
+        """Registra o uso de um modelo (e por qual agente)"""
+        agent = agent or current_agent.get()
+        self.model_uses.setdefault(model, deque(maxlen=256)).append(time.time())
+        if agent:
+            self.agent_models.setdefault(agent, Counter())[model] += 1
+
+    def predicted_models(self, agent: str, limit: int = 1) -> List[str]:
+        """Modelos mais usados historicamente pelo agente"""
+        usage = self.agent_models.get(agent)
+        if not usage:
+            return []
+        return [model for model, _ in usage.most_common(limit)]
+
+    # --- Estado a partir do inventário dos nós ---
+
+    def resident_nodes(self, model: str) -> List["OllamaNode"]:
+        return [node for node in self.client.pool.healthy_nodes() if node.is_resident(model)]
+
+    def is_resident(self, model: str) -> bool:
+        return bool(self.resident_nodes(model))
+
+    def expires_at(self, model: str) -> Optional[float]:
+        """Quando o modelo sai da memória do último nó que o mantém (None = sem prazo conhecido)"""
+        expirations = [node.resident[model] for node in self.resident_nodes(model)]
+        if not expirations or None in expirations:
+            return None
+        return max(expirations)
+
+    # --- Pré-carga ---
+
+    def preload_nodes(self, model: str) -> List["OllamaNode"]:
+        """Nós saudáveis com o modelo instalado que ainda não o têm em memória"""
+        return [node for node in self.client.pool.healthy_nodes()
+                if node.has_model(model) and not node.is_resident(model)]
+
+    def is_warming(self, model: str) -> bool:
+        return (any(warming == model for warming, _ in self._warming)
+                or any(task.get_name() == f"warm:{model}" for task in self._warm_tasks))
+
+    async def preload(self, model: str, keep_alive: Optional[str] = None) -> bool:
+        """Carrega o modelo na memória de cada nó que deve mantê-lo (generate sem prompt)"""
+        nodes = [node for node in self.preload_nodes(model) if (model, node.url) not in self._warming]
+        if not nodes:
+            return False
+        results = await asyncio.gather(*(self._preload_node(model, node, keep_alive) for node in nodes))
+        return any(results)
+
+    async def _preload_node(self, model: str, node: "OllamaNode", keep_alive: Optional[str]) -> bool:
+        key = (model, node.url)
+        self._warming.add(key)
+        try:
+            start = time.time()
+            await self.client.post_json(
+                "/api/generate",
+                {
+                    "model": model,
+                    "keep_alive": keep_alive or self.keep_alive_for(model),
+                    # Mesmo num_ctx das próximas requisições, senão o Ollama recarrega o modelo
+                    "options": {"num_ctx": get_context_sizer().num_ctx_for(model)},
+                },
+                timeout=PRELOAD_TIMEOUT,
+                node=node
+            )
+            self.stats["preloads"] += 1
+            logger.info(f"Modelo {model} pré-carregado em {node.url} em {time.time() - start:.1f}s")
+            return True
+        except Exception as e:
+            self.stats["preload_failures"] += 1
+            logger.warning(f"Falha ao pré-carregar {model} em {node.url}: {e}")
+            return False
+        finally:
+            self._warming.discard(key)
+
+    def warm(self, model: str):
+        """Agenda a pré-carga em background se o modelo não estiver residente"""
+        if self.is_resident(model) or self.is_warming(model):
+            return
+        self.stats["predictive_warmups"] += 1
+        # Referência mantida até o fim: o event loop só guarda referências fracas das tarefas
+        task = asyncio.create_task(self.preload(model), name=f"warm:{model}")
+        self._warm_tasks.add(task)
+        task.add_done_callback(self._warm_tasks.discard)
+
+    def warm_for_agent(self, agent: str):
+        """Aquece os modelos que o agente costuma usar"""
+        for model in self.predicted_models(agent):
+            self.warm(model)
+
+    async def preload_models(self, models: List[str]):
+        """Pré-carrega, em sequência, os modelos instalados dentre os informados"""
+        # Import tardio: o registro depende do cliente, que cria este gerenciador
+        from tools.model_availability import get_availability_registry
+        installed = await get_availability_registry().inventory()
+        if installed is None:
+            logger.warning("Nenhum nó Ollama respondeu; pré-carga ignorada")
+            return
+        for model in models:
+            if model in installed:
+                await self.preload(model)
+
+    async def _run(self, preload: List[str]):
+        if PRELOAD_ON_STARTUP and preload:
+            await self.preload_models(preload)
+        while True:
+            # Renova modelos quentes que saíram (ou estão saindo) da memória
+            horizon = time.time() + 2 * REFRESH_INTERVAL
+            for model in list(self.model_uses):
+                if not self.is_hot(model):
+                    continue
+                expires_at = self.expires_at(model)
+                if not self.is_resident(model) or (expires_at is not None and expires_at < horizon):
+                    self.warm(model)
+            await asyncio.sleep(REFRESH_INTERVAL)
+
+    def start(self, preload: Optional[List[str]] = None):
+        """Inicia a tarefa de background (pré-carga + renovação dos modelos quentes)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(preload or []))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._warm_tasks):
+            task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado de residência e aprendizado por agente"""
+        now = time.time()
+        return {
+            **self.stats,
+            "resident": {
+                model: {
+                    "nodes": [node.url for node in self.resident_nodes(model)],
+                    "expires_in": round(self.expires_at(model) - now, 1) if self.expires_at(model) else None,
+                }
+                for model in sorted({model for node in self.client.pool.healthy_nodes() for model in node.resident})
+                if self.is_resident(model)
+            },
+            "hot_models": [model for model in self.model_uses if self.is_hot(model)],
+            "keep_alive": {"default": KEEP_ALIVE_DEFAULT, "hot": KEEP_ALIVE_HOT},
+            "agent_models": {agent: dict(counter) for agent, counter in self.agent_models.items()},
+            "warming": sorted(f"{model}@{url}" for model, url in self._warming),
+        }
@@ -0,0 +1,359 @@
+"""
+Cliente assíncrono do Ollama compartilhado por toda a API
+Mantém uma única sessão HTTP com pool de conexões keep-alive, para que as
+gerações não bloqueiem o event loop do uvicorn e chats concorrentes se sobreponham.
+"""
+
+import os
+import json
+import logging
+import time
+import asyncio
+from typing import Dict, Any, List, Optional, AsyncIterator
+
+import aiohttp
+
+from tools.single_flight import SingleFlight, request_key
+from tools.llm_cache import get_llm_cache
+from tools.scheduler import get_scheduler
+from tools.model_residency import ModelResidencyManager
+from tools.prompt_builder import get_prompt_cache_monitor
+from tools.hedging import Hedger
+from tools.request_context import current_backup_model, current_priority, Priority
+from tools.ollama_pool import NodePool, OllamaNode, get_node_pool
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "32"))
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("OLLAMA_MAX_CONNECTIONS_PER_HOST", "8"))
+KEEPALIVE_TIMEOUT = float(os.getenv("OLLAMA_KEEPALIVE_TIMEOUT", "60"))
+CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+REQUEST_TIMEOUT = float(os.getenv("OLLAMA_REQUEST_TIMEOUT", "120"))
+READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "120"))
+COALESCE_REQUESTS = os.getenv("OLLAMA_COALESCE_REQUESTS", "true").lower() == "true"
+
+# Contadores retornados pelo Ollama no chunk final de cada geração
+USAGE_KEYS = (
+    "prompt_eval_count",
+    "prompt_eval_duration",
+    "eval_count",
+    "eval_duration",
+    "load_duration",
+    "total_duration",
+    # Estimativa local de tokens do prompt reaproveitados do KV cache (PromptCacheMonitor)
+    "prompt_cached_tokens",
+)
+
+
+def extract_usage(data: Dict[str, Any]) -> Dict[str, int]:
+    """Extrai os contadores de tokens/tempo de uma resposta (ou chunk final) do Ollama"""
+    return {key: int(data[key]) for key in USAGE_KEYS if data.get(key) is not None}
+
+
+def accumulate_usage(total: Dict[str, int], data: Dict[str, Any]) -> Dict[str, int]:
+    """Soma os contadores de uma resposta em um acumulador (várias chamadas por requisição)"""
+    for key, value in extract_usage(data).items():
+        total[key] = total.get(key, 0) + value
+    total["calls"] = total.get("calls", 0) + 1
+    return total
+
+
+class OllamaClient:
+    """
+    Cliente HTTP assíncrono para o Ollama
+
+    Funcionalidades:
+    - Sessão aiohttp única por processo (keep-alive)
+    - Vários nós Ollama com afinidade de modelo e de conversa (NodePool)
+    - Limite de conexões total e por host
+    - Timeouts configuráveis por chamada
+    - Chat com e sem streaming, consultas a /api/tags e /api/ps
+    - Coalescência de gerações idênticas em andamento (single-flight)
+    - Cache persistente opcional para gerações determinísticas
+    - Admissão por modelo via escalonador com prioridades
+    - keep_alive por requisição e residência de modelos (ModelResidencyManager)
+    - Hedge/failover para o modelo de reserva quando o primeiro token atrasa (Hedger)
+    """
+
+    def __init__(self, pool: Optional[NodePool] = None):
+        self.pool = pool or get_node_pool()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_lock = asyncio.Lock()
+        self.single_flight = SingleFlight()
+        self.cache = get_llm_cache()
+        self.scheduler = get_scheduler()
+        self.residency = ModelResidencyManager(self)
+        self.prompt_cache = get_prompt_cache_monitor()
+        self.hedger = Hedger()
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Obtém (ou cria sob demanda) a sessão compartilhada"""
+        if self._session is None or self._session.closed:
+            async with self._session_lock:
+                if self._session is None or self._session.closed:
+                    connector = aiohttp.TCPConnector(
+                        limit=MAX_CONNECTIONS,
+                        limit_per_host=MAX_CONNECTIONS_PER_HOST,
+                        keepalive_timeout=KEEPALIVE_TIMEOUT,
+                    )
+                    self._session = aiohttp.ClientSession(
+                        connector=connector,
+                        timeout=aiohttp.ClientTimeout(
+                            total=REQUEST_TIMEOUT,
+                            connect=CONNECT_TIMEOUT,
+                        ),
+                    )
+                    logger.info(
+                        f"Sessão Ollama criada ({len(self.pool.nodes)} nó(s), limit={MAX_CONNECTIONS}, "
+                        f"limit_per_host={MAX_CONNECTIONS_PER_HOST})"
+                    )
+        return self._session
+
+    async def close(self):
+        """Fecha a sessão e libera as conexões do pool"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _timeout(self, timeout: Optional[float]) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(
+            total=timeout if timeout is not None else REQUEST_TIMEOUT,
+            connect=CONNECT_TIMEOUT,
+        )
+
+    async def get_json(self, path: str, timeout: Optional[float] = 10,
+                       node: Optional[OllamaNode] = None) -> Dict[str, Any]:
+        """GET em um endpoint do Ollama retornando o JSON (no nó informado ou no primeiro saudável)"""
+        session = await self.get_session()
+        node = node or self.pool.default_node
+        async with session.get(f"{node.url}{path}", timeout=self._timeout(timeout)) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def post_json(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None,
+                        node: Optional[OllamaNode] = None) -> Dict[str, Any]:
+        """POST em um endpoint do Ollama retornando o JSON (no nó informado ou no escolhido pelo pool)"""
+        session = await self.get_session()
+        with self.pool.use(payload["model"], node) as node:
+            async with session.post(f"{node.url}{path}", json=payload, timeout=self._timeout(timeout)) as response:
+                if response.status >= 400:
+                    body = await response.text()
+                    logger.error(f"Ollama respondeu {response.status} em {node.url}{path}: {body[:500]}")
+                response.raise_for_status()
+                return await response.json()
+
+    def build_chat_payload(self, model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None,
+                           stream: bool = False, **extra: Any) -> Dict[str, Any]:
+        """Monta o payload de /api/chat"""
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": stream,
+        }
+        if options:
+            payload["options"] = options
+        payload.update({key: value for key, value in extra.items() if value is not None})
+        return payload
+
+    def _backup_for(self, model: str) -> Optional[str]:
+        """Modelo de reserva da requisição atual (None quando não há hedge)"""
+        backup = current_backup_model.get()
+        if not self.hedger.enabled or backup is None or backup == model:
+            return None
+        # Tarefas de fundo não disputam o orçamento de hedge
+        if current_priority.get() == Priority.BATCH:
+            return None
+        return backup
+
+    async def chat(self, model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None,
+                   timeout: Optional[float] = None, **extra: Any) -> Dict[str, Any]:
+        """Chat sem streaming; retorna a resposta completa do Ollama (message + contadores)"""
+        payload = self.build_chat_payload(model, messages, options, stream=False, **extra)
+        flight_key = request_key(payload)
+        cache_key = None
+        if self.cache.enabled and self.cache.is_cacheable(payload):
+            cache_key = self.cache.cache_key(payload)
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return {**cached, "cached": True}
+
+        backup = self._backup_for(model)
+        if backup is not None:
+            # Com reserva, a chamada vira streaming para observar o primeiro token
+            data = await self._collect_stream(self.hedger.stream(
+                model, backup, lambda m: self._chat_stream(m, messages, options, timeout, **extra)
+            ))
+            if cache_key is not None and data.get("model") == model:
+                await self.cache.put(cache_key, model, data)
+            return data
+
+        self.residency.record_use(model)
+        payload.setdefault("keep_alive", self.residency.keep_alive_for(model))
+
+        async def fetch() -> Dict[str, Any]:
+            async with self.scheduler.slot(model):
+                data = await self.post_json("/api/chat", payload, timeout=timeout)
+            # Sem streaming, o TTFT é aproximado por carga + avaliação do prompt
+            if data.get("prompt_eval_duration") is not None:
+                self.hedger.ttft.record(model, (data.get("load_duration", 0) + data["prompt_eval_duration"]) / 1e9)
+            if cache_key is not None and data.get("done", True):
+                await self.cache.put(cache_key, model, data)
+            cached_tokens = self.prompt_cache.observe(model, messages, data)
+            if cached_tokens is not None:
+                data["prompt_cached_tokens"] = cached_tokens
+            return data
+
+        if not COALESCE_REQUESTS:
+            return await fetch()
+        return await self.single_flight.do(flight_key, fetch)
+
+    @staticmethod
+    async def _collect_stream(chunks: AsyncIterator[Dict[str, Any]]) -> Dict[str, Any]:
+        """Junta os chunks de um streaming no formato da resposta sem streaming"""
+        parts = []
+        final: Dict[str, Any] = {}
+        async for chunk in chunks:
+            parts.append(chunk.get("message", {}).get("content", ""))
+            if chunk.get("done"):
+                final = chunk
+        return {**final, "message": {"role": "assistant", "content": "".join(parts)}, "done": True}
+
+    async def chat_stream(self, model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None,
+                          read_timeout: Optional[float] = None, **extra: Any) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Chat com streaming; produz os chunks NDJSON do Ollama.
+        Streamings idênticos compartilham uma única geração (fan-out para todos os assinantes).
+        Quando o último assinante fecha o gerador, a conexão é fechada e o Ollama para de decodificar.
+        Com modelo de reserva no contexto, o stream pode vir dele (campo "model" dos chunks).
+        """
+        backup = self._backup_for(model)
+        if backup is None:
+            source = self._chat_stream(model, messages, options, read_timeout, **extra)
+        else:
+            source = self.hedger.stream(
+                model, backup, lambda m: self._chat_stream(m, messages, options, read_timeout, **extra)
+            )
+        async for chunk in source:
+            yield chunk
+
+    async def _chat_stream(self, model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None,
+                           read_timeout: Optional[float] = None, **extra: Any) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming de um único modelo, medindo o tempo até o primeiro token"""
+        payload = self.build_chat_payload(model, messages, options, stream=True, **extra)
+        flight_key = request_key(payload)
+        self.residency.record_use(model)
+        payload.setdefault("keep_alive", self.residency.keep_alive_for(model))
+        if not COALESCE_REQUESTS:
+            source = self._stream_chat(payload, read_timeout)
+        else:
+            source = self.single_flight.stream(flight_key, lambda: self._stream_chat(payload, read_timeout))
+        start = time.monotonic()
+        first_token = False
+        try:
+            async for chunk in source:
+                if not first_token and (chunk.get("message", {}).get("content") or chunk.get("done")):
+                    first_token = True
+                    self.hedger.ttft.record(model, time.monotonic() - start)
+                yield chunk
+        except (GeneratorExit, asyncio.CancelledError):
+            if not first_token:
+                # Stream abandonado antes do primeiro token: o TTFT real é no mínimo o tempo decorrido
+                self.hedger.ttft.record(model, time.monotonic() - start)
+            raise
+
+    async def _stream_chat(self, payload: Dict[str, Any], read_timeout: Optional[float]) -> AsyncIterator[Dict[str, Any]]:
+        """Executa um /api/chat com streaming (segurando um slot do modelo até o fim)"""
+        session = await self.get_session()
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            connect=CONNECT_TIMEOUT,
+            sock_read=read_timeout if read_timeout is not None else READ_TIMEOUT,
+        )
+        async with self.scheduler.slot(payload["model"]):
+            with self.pool.use(payload["model"]) as node:
+                async with session.post(f"{node.url}/api/chat", json=payload, timeout=timeout) as response:
+                    if response.status >= 400:
+                        body = await response.text()
+                        logger.error(f"Ollama respondeu {response.status} em {node.url}/api/chat: {body[:500]}")
+                    response.raise_for_status()
+                    async for line in response.content:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if "error" in chunk:
+                            raise aiohttp.ClientPayloadError(f"Erro do Ollama durante streaming: {chunk['error']}")
+                        if chunk.get("done"):
+                            cached_tokens = self.prompt_cache.observe(payload["model"], payload["messages"], chunk)
+                            if cached_tokens is not None:
+                                chunk["prompt_cached_tokens"] = cached_tokens
+                            yield chunk
+                            break
+                        yield chunk
+
+    async def _query_nodes(self, path: str, timeout: Optional[float]) -> List[tuple]:
+        """GET em todos os nós saudáveis; retorna (nó, JSON) dos que responderam"""
+        nodes = self.pool.healthy_nodes()
+        results = await asyncio.gather(*(self.get_json(path, timeout=timeout, node=node) for node in nodes),
+                                       return_exceptions=True)
+        answered = [(node, data) for node, data in zip(nodes, results) if not isinstance(data, BaseException)]
+        if not answered:
+            raise next(result for result in results if isinstance(result, BaseException))
+        return answered
+
+    async def list_models(self, timeout: Optional[float] = 10) -> List[Dict[str, Any]]:
+        """Modelos instalados em algum nó (/api/tags)"""
+        models: Dict[str, Dict[str, Any]] = {}
+        for node, data in await self._query_nodes("/api/tags", timeout):
+            node.installed = {model["name"] for model in data.get("models", [])}
+            for model in data.get("models", []):
+                models.setdefault(model["name"], model)
+        return list(models.values())
+
+    def model_load(self, model: str) -> Dict[str, Any]:
+        """Carga atual do modelo: em execução e na fila do escalonador, em andamento por nó"""
+        return {**self.scheduler.load(model), "nodes": self.pool.model_in_flight(model)}
+
+    def get_load(self) -> Dict[str, Dict[str, Any]]:
+        """Carga atual de todos os modelos já requisitados"""
+        return {model: self.model_load(model) for model in self.scheduler.models()}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estatísticas do cliente"""
+        return {
+            "nodes": self.pool.get_stats(),
+            "coalescing": self.single_flight.get_stats() if COALESCE_REQUESTS else {"enabled": False},
+            "prompt_cache": self.prompt_cache.get_stats(),
+            "hedging": self.hedger.get_stats(),
+        }
+
+    async def list_running_models(self, timeout: Optional[float] = 5) -> List[Dict[str, Any]]:
+        """Modelos carregados em memória em algum nó (/api/ps)"""
+        models: Dict[str, Dict[str, Any]] = {}
+        for node, data in await self._query_nodes("/api/ps", timeout):
+            self.pool.update_resident(node, data.get("models", []))
+            for model in data.get("models", []):
+                models.setdefault(model["name"], model)
+        return list(models.values())
+
+
+# Singleton instance
+_client_instance = None
+
+def get_ollama_client() -> OllamaClient:
+    """Obtém instância singleton do cliente Ollama"""
+    global _client_instance
+    if _client_instance is None:
+        _client_instance = OllamaClient()
+    return _client_instance
+
+def get_residency_manager() -> ModelResidencyManager:
+    """Gerenciador de residência de modelos do cliente singleton"""
+    return get_ollama_client().residency
+
+async def close_ollama_client():
+    """Fecha a sessão do cliente singleton (shutdown da aplicação)"""
+    if _client_instance is not None:
+        await _client_instance.residency.stop()
+        await _client_instance.close()
@@ -0,0 +1,249 @@
+"""
+Pool de nós Ollama com balanceamento por afinidade de modelo
+Cada nó tem health check e inventário de modelos instalados (/api/tags) e residentes
+(/api/ps). A escolha prefere um nó com o modelo já carregado, depois o com menos
+requisições em andamento, e mantém a mesma conversa no mesmo nó (KV cache quente).
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Set, Iterator, TYPE_CHECKING
+
+import aiohttp
+
+from tools.request_context import current_conversation
+from tools.model_residency import _parse_expires_at
+
+if TYPE_CHECKING:
+    from tools.ollama_client import OllamaClient
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+# Lista separada por vírgulas; sem ela, o pool tem apenas o OLLAMA_URL
+OLLAMA_URLS = [url.strip().rstrip("/") for url in os.getenv("OLLAMA_URLS", "").split(",") if url.strip()] \
+    or [OLLAMA_URL.rstrip("/")]
+HEALTH_TIMEOUT = float(os.getenv("OLLAMA_HEALTH_TIMEOUT", "3"))
+# Falhas de conexão seguidas para tirar um nó de rotação até o próximo health check
+NODE_MAX_FAILURES = int(os.getenv("OLLAMA_NODE_MAX_FAILURES", "2"))
+# Requisições em andamento a partir das quais um nó sem o modelo carregado também entra na disputa
+SPILLOVER_IN_FLIGHT = int(os.getenv("OLLAMA_NODE_SPILLOVER_IN_FLIGHT", "4"))
+AFFINITY_TTL = float(os.getenv("OLLAMA_AFFINITY_TTL", "1800"))
+AFFINITY_MAX_ENTRIES = 10000
+
+# Erros que indicam problema no nó (e não no modelo ou na requisição)
+NODE_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError, OSError)
+
+
+def conversation_key(conversation_id: Optional[str], history: Optional[List[Dict[str, str]]],
+                     message: str) -> str:
+    """
+    Chave estável da conversa para afinidade de nó.
+    Sem id explícito, usa a primeira mensagem da conversa (igual em todos os turnos).
+    """
+    if conversation_id:
+        return conversation_id
+    first = history[0].get("content", "") if history else message
+    return hashlib.sha1(first.encode("utf-8")).hexdigest()[:16]
+
+
+class OllamaNode:
+    """Estado de um servidor Ollama do pool"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True
+        self.in_flight = 0
+        self.model_in_flight: Dict[str, int] = {}
+        self.consecutive_failures = 0
+        self.installed: Optional[Set[str]] = None  # None = inventário ainda desconhecido
+        self.resident: Dict[str, Optional[float]] = {}  # modelo -> expires_at
+        self.last_check: Optional[float] = None
+        self.last_used = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def has_model(self, model: str) -> bool:
+        return self.installed is None or model in self.installed
+
+    def is_resident(self, model: str) -> bool:
+        if model not in self.resident:
+            return False
+        expires_at = self.resident[model]
+        return expires_at is None or expires_at > time.time()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "model_in_flight": dict(self.model_in_flight),
+            "requests": self.requests,
+            "failures": self.failures,
+            "installed": sorted(self.installed) if self.installed is not None else None,
+            "resident": sorted(model for model in self.resident if self.is_resident(model)),
+            "last_check": self.last_check,
+        }
+
+
+class NodePool:
+    """
+    Conjunto de nós Ollama
+
+    - Health check com inventário de /api/tags e /api/ps (executado pelo registro de disponibilidade)
+    - Nó retirado após falhas de conexão seguidas, reintegrado pelo health check
+    - Seleção: afinidade da conversa > modelo residente > menos requisições em andamento
+    """
+
+    def __init__(self, urls: Optional[List[str]] = None):
+        self.nodes = [OllamaNode(url) for url in (urls or OLLAMA_URLS)]
+        self.affinity: "OrderedDict[str, tuple]" = OrderedDict()  # conversa -> (url, timestamp)
+        self.stats = {"selections": 0, "sticky": 0, "resident_hits": 0, "cold_selections": 0, "marked_down": 0}
+        # Contadores também são atualizados de threads (embeddings síncronos do RAG via asyncio.to_thread)
+        self._lock = threading.Lock()
+
+    @property
+    def default_node(self) -> OllamaNode:
+        """Primeiro nó saudável (consultas que não dependem de modelo)"""
+        return next((node for node in self.nodes if node.healthy), self.nodes[0])
+
+    def healthy_nodes(self) -> List[OllamaNode]:
+        return [node for node in self.nodes if node.healthy] or list(self.nodes)
+
+    # --- Seleção ---
+
+    def _sticky_node(self, conversation: Optional[str]) -> Optional[OllamaNode]:
+        if not conversation or conversation not in self.affinity:
+            return None
+        url, timestamp = self.affinity[conversation]
+        if time.time() - timestamp > AFFINITY_TTL:
+            del self.affinity[conversation]
+            return None
+        return next((node for node in self.nodes if node.url == url), None)
+
+    def _remember(self, conversation: Optional[str], node: OllamaNode):
+        if not conversation:
+            return
+        self.affinity[conversation] = (node.url, time.time())
+        self.affinity.move_to_end(conversation)
+        while len(self.affinity) > AFFINITY_MAX_ENTRIES:
+            self.affinity.popitem(last=False)
+
+    def select(self, model: str, conversation: Optional[str] = None) -> OllamaNode:
+        """Escolhe o nó para uma requisição ao modelo"""
+        self.stats["selections"] += 1
+        if len(self.nodes) == 1:
+            return self.nodes[0]
+        conversation = conversation or current_conversation.get()
+        candidates = [node for node in self.healthy_nodes() if node.has_model(model)] or self.healthy_nodes()
+        resident = [node for node in candidates if node.is_resident(model)]
+        if resident and min(node.in_flight for node in resident) >= SPILLOVER_IN_FLIGHT:
+            resident = []
+
+        sticky = self._sticky_node(conversation)
+        # A afinidade só vale enquanto o modelo está lá (ou não está carregado em nenhum outro nó)
+        if sticky in candidates and (sticky in resident or not resident):
+            self.stats["sticky"] += 1
+            self._remember(conversation, sticky)
+            return sticky
+
+        if resident:
+            self.stats["resident_hits"] += 1
+        else:
+            self.stats["cold_selections"] += 1
+        node = min(resident or candidates, key=lambda n: (n.in_flight, n.last_used))
+        self._remember(conversation, node)
+        return node
+
+    @contextmanager
+    def use(self, model: str, node: Optional[OllamaNode] = None) -> Iterator[OllamaNode]:
+        """Seleciona um nó e contabiliza a requisição em andamento (falhas de conexão derrubam o nó)"""
+        with self._lock:
+            node = node or self.select(model)
+            node.in_flight += 1
+            node.model_in_flight[model] = node.model_in_flight.get(model, 0) + 1
+            node.requests += 1
+            node.last_used = time.monotonic()
+        try:
+            yield node
+        except NODE_ERRORS:
+            self.mark_failure(node)
+            raise
+        else:
+            with self._lock:
+                node.consecutive_failures = 0
+                # O modelo acabou de rodar no nó: residente até o próximo /api/ps dizer o contrário
+                node.resident.setdefault(model, None)
+        finally:
+            with self._lock:
+                node.in_flight -= 1
+                node.model_in_flight[model] -= 1
+                if not node.model_in_flight[model]:
+                    del node.model_in_flight[model]
+
+    def model_in_flight(self, model: str) -> Dict[str, int]:
+        """Requisições em andamento do modelo por nó"""
+        return {node.url: node.model_in_flight[model] for node in self.nodes if node.model_in_flight.get(model)}
+
+    def mark_failure(self, node: OllamaNode):
+        with self._lock:
+            node.failures += 1
+            node.consecutive_failures += 1
+            marked_down = node.healthy and len(self.nodes) > 1 and node.consecutive_failures >= NODE_MAX_FAILURES
+            if marked_down:
+                node.healthy = False
+                self.stats["marked_down"] += 1
+        if marked_down:
+            logger.warning(f"Nó Ollama {node.url} fora de rotação após {node.consecutive_failures} falhas")
+
+    # --- Health check e inventário ---
+
+    def update_resident(self, node: OllamaNode, running: List[Dict[str, Any]]):
+        node.resident = {model["name"]: _parse_expires_at(model.get("expires_at")) for model in running}
+
+    async def check_node(self, client: "OllamaClient", node: OllamaNode):
+        """Atualiza saúde e inventário de um nó"""
+        try:
+            tags = await client.get_json("/api/tags", timeout=HEALTH_TIMEOUT, node=node)
+            running = await client.get_json("/api/ps", timeout=HEALTH_TIMEOUT, node=node)
+        except Exception as e:
+            if node.healthy and len(self.nodes) > 1:
+                self.stats["marked_down"] += 1
+                logger.warning(f"Health check falhou para {node.url}: {e}")
+            node.healthy = False
+            return
+        if not node.healthy:
+            logger.info(f"Nó Ollama {node.url} de volta à rotação")
+        node.healthy = True
+        node.consecutive_failures = 0
+        node.installed = {model["name"] for model in tags.get("models", [])}
+        self.update_resident(node, running.get("models", []))
+        node.last_check = time.time()
+
+    async def check_all(self, client: "OllamaClient"):
+        await asyncio.gather(*(self.check_node(client, node) for node in self.nodes))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "affinity_entries": len(self.affinity),
+                "nodes": {node.url: node.get_stats() for node in self.nodes},
+            }
+
+
+# Singleton instance
+_pool_instance = None
+
+def get_node_pool() -> NodePool:
+    """Obtém instância singleton do pool de nós"""
+    global _pool_instance
+    if _pool_instance is None:
+        _pool_instance = NodePool()
+    return _pool_instance
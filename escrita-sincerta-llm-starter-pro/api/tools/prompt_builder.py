@@ -0,0 +1,339 @@
+"""
+Montagem de prompts com orçamento de tokens
+Conta tokens por modelo (tokenizer local em cache ou estimativa), reserva espaço para a
+resposta e descarta/corta os turnos mais antigos do histórico para caber no num_ctx.
+"""
+
+import os
+import time
+import logging
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:  # tokenizers vem com sentence-transformers; sem ele usamos a estimativa
+    Tokenizer = None
+
+# Configurações
+DEFAULT_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "4096"))
+RESERVED_OUTPUT_TOKENS = int(os.getenv("PROMPT_RESERVED_OUTPUT_TOKENS", "1024"))
+# Tamanhos de contexto permitidos: poucos valores para o Ollama não recarregar o modelo a cada requisição
+NUM_CTX_BUCKETS = sorted(int(size) for size in os.getenv("OLLAMA_NUM_CTX_BUCKETS", "2048,4096,8192,16384").split(","))
+# Tempo ocioso após o qual um modelo pode voltar a um bucket menor
+NUM_CTX_SHRINK_AFTER = float(os.getenv("OLLAMA_NUM_CTX_SHRINK_AFTER", "300"))
+TOKENIZER_CACHE_DIR = Path(os.getenv("TOKENIZER_CACHE_DIR", "data/tokenizers"))
+MESSAGE_OVERHEAD_TOKENS = 4  # tokens do template de chat por mensagem
+MIN_TRIMMED_TURN_TOKENS = 64
+TRIM_MARKER = "[...] "
+
+PROMPTS_DIR = Path("prompts")
+
+# Família do modelo -> arquivo tokenizer.json em TOKENIZER_CACHE_DIR, repositório do Hugging Face
+# de onde ele é baixado (`python -m tools.fetch_tokenizers`) e média de caracteres por token
+MODEL_FAMILIES = {
+    "qwen2.5": {"tokenizer": "qwen2.5.json", "hf_repo": "Qwen/Qwen2.5-7B-Instruct", "chars_per_token": 3.3},
+    "llama3.1": {"tokenizer": "llama3.1.json", "hf_repo": "meta-llama/Llama-3.1-8B-Instruct", "chars_per_token": 3.6},
+    "phi3": {"tokenizer": "phi3.json", "hf_repo": "microsoft/Phi-3-mini-4k-instruct", "chars_per_token": 3.0},
+    "codegemma": {"tokenizer": "codegemma.json", "hf_repo": "google/codegemma-7b-it", "chars_per_token": 3.4},
+}
+DEFAULT_CHARS_PER_TOKEN = 3.2
+
+
+_prompt_files: Dict[Path, Tuple[float, str]] = {}
+
+
+def read_prompt_file(filename: str, prompts_dir: Path = PROMPTS_DIR) -> Optional[str]:
+    """
+    Lê um arquivo de prompt com cache por mtime (None se não existir).
+    O texto só muda quando o arquivo muda, mantendo o prefixo do prompt idêntico entre chamadas.
+    """
+    path = prompts_dir / filename
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        _prompt_files.pop(path, None)
+        return None
+    cached = _prompt_files.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, path.read_text(encoding="utf-8"))
+        _prompt_files[path] = cached
+    return cached[1]
+
+
+def model_family(model: str) -> str:
+    """'qwen2.5:7b' -> 'qwen2.5'"""
+    return model.split(":", 1)[0].split("/")[-1]
+
+
+@lru_cache(maxsize=16)
+def _load_tokenizer(family: str):
+    if Tokenizer is None or family not in MODEL_FAMILIES:
+        return None
+    path = TOKENIZER_CACHE_DIR / MODEL_FAMILIES[family]["tokenizer"]
+    if not path.exists():
+        return None
+    try:
+        tokenizer = Tokenizer.from_file(str(path))
+        logger.info(f"Tokenizer local carregado para {family}: {path}")
+        return tokenizer
+    except Exception as e:
+        logger.warning(f"Falha ao carregar tokenizer {path}: {e}")
+        return None
+
+
+def _count_tokens_uncached(family: str, text: str) -> int:
+    tokenizer = _load_tokenizer(family)
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    chars_per_token = MODEL_FAMILIES.get(family, {}).get("chars_per_token", DEFAULT_CHARS_PER_TOKEN)
+    return int(len(text) / chars_per_token) + 1
+
+
+# Textos que se repetem entre requisições (sistema, histórico): a contagem fica em cache
+_count_tokens = lru_cache(maxsize=4096)(_count_tokens_uncached)
+
+
+def count_tokens(model: str, text: str) -> int:
+    """Conta (ou estima) os tokens de um texto para o modelo"""
+    if not text:
+        return 0
+    return _count_tokens(model_family(model), text)
+
+
+def estimate_tokens(model: str, chars: int) -> int:
+    """Estimativa de tokens só pelo número de caracteres (sem tokenizar)"""
+    chars_per_token = MODEL_FAMILIES.get(model_family(model), {}).get("chars_per_token", DEFAULT_CHARS_PER_TOKEN)
+    return int(chars / chars_per_token) + 1
+
+
+def count_message_tokens(model: str, messages: List[Dict[str, str]]) -> int:
+    """Tokens de uma lista de mensagens, incluindo o overhead do template"""
+    return sum(count_tokens(model, m.get("content", "")) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def tokenizer_source(model: str) -> str:
+    return "tokenizer" if _load_tokenizer(model_family(model)) is not None else "heuristic"
+
+
+def _trim_to_tokens(model: str, text: str, max_tokens: int) -> str:
+    """Mantém o final do texto (parte mais recente) dentro de max_tokens"""
+    if count_tokens(model, text) <= max_tokens:
+        return text
+    family = model_family(model)
+    low, high = 0, len(text)
+    # Busca binária pelo maior sufixo que cabe no orçamento (sufixos descartáveis: fora do cache)
+    while low < high:
+        mid = (low + high) // 2
+        if _count_tokens_uncached(family, TRIM_MARKER + text[mid:]) <= max_tokens:
+            high = mid
+        else:
+            low = mid + 1
+    return TRIM_MARKER + text[low:]
+
+
+class PromptBuilder:
+    """
+    Montagem de mensagens dentro do orçamento de contexto
+
+    Orçamento = num_ctx - tokens reservados para a saída.
+    Sistema e mensagem nova são sempre mantidos; o histórico entra do turno mais recente
+    para o mais antigo até o orçamento acabar (o último turno que não cabe é cortado).
+    """
+
+    def __init__(self, num_ctx: int = DEFAULT_NUM_CTX, reserved_output: int = RESERVED_OUTPUT_TOKENS):
+        self.num_ctx = num_ctx
+        self.reserved_output = reserved_output
+
+    def build(self, model: str, system: str, history: List[Dict[str, str]], message: str,
+              num_ctx: Optional[int] = None, reserved_output: Optional[int] = None) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """Retorna as mensagens e um relatório do orçamento (tokens usados e cortados)"""
+        num_ctx = num_ctx or self.num_ctx
+        reserved_output = reserved_output if reserved_output is not None else self.reserved_output
+        budget = max(num_ctx - reserved_output, 0)
+
+        system_message = {"role": "system", "content": system}
+        user_message = {"role": "user", "content": message}
+        fixed_tokens = count_message_tokens(model, [system_message, user_message])
+        available = budget - fixed_tokens
+
+        kept: List[Dict[str, str]] = []
+        history_tokens = 0
+        kept_tokens = 0
+        trimmed = False
+        for turn in reversed(history):
+            turn_tokens = count_message_tokens(model, [turn])
+            history_tokens += turn_tokens
+            if available <= 0:
+                continue
+            if turn_tokens <= available:
+                kept.append(turn)
+                kept_tokens += turn_tokens
+                available -= turn_tokens
+            elif available >= MIN_TRIMMED_TURN_TOKENS:
+                content = _trim_to_tokens(model, turn.get("content", ""), available - MESSAGE_OVERHEAD_TOKENS)
+                trimmed_turn = {**turn, "content": content}
+                trimmed_tokens = count_message_tokens(model, [trimmed_turn])
+                kept.append(trimmed_turn)
+                kept_tokens += trimmed_tokens
+                available = 0
+                trimmed = True
+            else:
+                available = 0
+        kept.reverse()
+
+        messages = [system_message] + kept + [user_message]
+        prompt_tokens = fixed_tokens + kept_tokens
+        report = {
+            "prompt_tokens": prompt_tokens,
+            "num_ctx": num_ctx,
+            "reserved_output": reserved_output,
+            "budget": budget,
+            "history_turns": len(history),
+            "history_turns_kept": len(kept),
+            "history_turns_dropped": len(history) - len(kept),
+            "history_turn_trimmed": trimmed,
+            "tokens_cut": history_tokens - kept_tokens,
+            "over_budget": prompt_tokens > budget,
+            "token_counter": tokenizer_source(model),
+        }
+        if report["tokens_cut"]:
+            logger.info(
+                f"Histórico ajustado ao orçamento ({model}): {report['history_turns_dropped']} turnos "
+                f"descartados, {report['tokens_cut']} tokens cortados"
+            )
+        return messages, report
+
+
+class ContextSizer:
+    """
+    Escolha do num_ctx por requisição
+
+    O contexto é o menor bucket que comporta prompt + saída prevista. Como mudar o num_ctx
+    faz o Ollama recarregar o modelo, um modelo em uso recente mantém o bucket atual
+    enquanto ele couber e só reduz depois de NUM_CTX_SHRINK_AFTER segundos ocioso.
+    """
+
+    def __init__(self, buckets: List[int] = NUM_CTX_BUCKETS, shrink_after: float = NUM_CTX_SHRINK_AFTER):
+        self.buckets = buckets
+        self.shrink_after = shrink_after
+        self.current: Dict[str, Tuple[int, float]] = {}  # modelo -> (num_ctx, último uso)
+        self.stats = {"requests": 0, "resizes": 0, "overflows": 0}
+
+    def bucket_for(self, tokens: int) -> int:
+        for size in self.buckets:
+            if tokens <= size:
+                return size
+        return self.buckets[-1]
+
+    def select(self, model: str, prompt_tokens: int, num_predict: Optional[int] = None) -> int:
+        """num_ctx para um prompt de `prompt_tokens` com até `num_predict` tokens de saída"""
+        needed = prompt_tokens + (num_predict if num_predict is not None else RESERVED_OUTPUT_TOKENS)
+        num_ctx = self.bucket_for(needed)
+        now = time.time()
+        self.stats["requests"] += 1
+        if needed > num_ctx:
+            self.stats["overflows"] += 1
+            logger.warning(f"Prompt de {prompt_tokens} tokens + saída excede o maior num_ctx ({num_ctx}) para {model}")
+
+        previous = self.current.get(model)
+        if previous is not None:
+            previous_ctx, last_used = previous
+            if num_ctx < previous_ctx and now - last_used < self.shrink_after:
+                num_ctx = previous_ctx
+            elif num_ctx != previous_ctx:
+                self.stats["resizes"] += 1
+        self.current[model] = (num_ctx, now)
+        return num_ctx
+
+    def select_for_messages(self, model: str, messages: List[Dict[str, str]], num_predict: Optional[int] = None) -> int:
+        return self.select(model, count_message_tokens(model, messages), num_predict)
+
+    def max_num_ctx(self) -> int:
+        """Maior bucket: limite do orçamento do prompt (o num_ctx da chamada é escolhido pelo tamanho)"""
+        return self.buckets[-1]
+
+    def num_ctx_for(self, model: str) -> int:
+        """Bucket atual do modelo (usado na pré-carga para não recarregar na primeira requisição)"""
+        current = self.current.get(model)
+        return current[0] if current else self.bucket_for(DEFAULT_NUM_CTX)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "buckets": self.buckets,
+            "models": {model: num_ctx for model, (num_ctx, _) in self.current.items()},
+        }
+
+
+class PromptCacheMonitor:
+    """
+    Diagnóstico de reaproveitamento do cache de prompt do Ollama
+
+    O Ollama só avalia os tokens após o prefixo já presente no KV cache, então
+    prompt_eval_count abaixo do tamanho estimado do prompt indica prefixo reaproveitado.
+    """
+
+    def __init__(self):
+        self.models: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "hits": 0, "prompt_tokens": 0, "evaluated_tokens": 0, "cached_tokens": 0}
+        )
+
+    def observe(self, model: str, messages: List[Dict[str, str]], data: Dict[str, Any]) -> Optional[int]:
+        """Registra uma resposta final e retorna a estimativa de tokens reaproveitados"""
+        evaluated = data.get("prompt_eval_count")
+        if evaluated is None:
+            return None
+        estimated = count_message_tokens(model, messages)
+        cached = max(estimated - int(evaluated), 0)
+        stats = self.models[model]
+        stats["calls"] += 1
+        stats["prompt_tokens"] += estimated
+        stats["evaluated_tokens"] += int(evaluated)
+        stats["cached_tokens"] += cached
+        # Margem para o erro da estimativa sem tokenizer local
+        if cached > 0.1 * estimated:
+            stats["hits"] += 1
+        return cached
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Taxa de acerto e fração de tokens do prompt reaproveitados por modelo"""
+        return {
+            model: {
+                **stats,
+                "hit_rate": stats["hits"] / stats["calls"] if stats["calls"] else 0.0,
+                "reuse_ratio": stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0,
+            }
+            for model, stats in self.models.items()
+        }
+
+
+# Singleton instances
+_builder_instance = None
+_monitor_instance = None
+_sizer_instance = None
+
+def get_prompt_builder() -> PromptBuilder:
+    """Obtém instância singleton do montador de prompts"""
+    global _builder_instance
+    if _builder_instance is None:
+        _builder_instance = PromptBuilder()
+    return _builder_instance
+
+def get_prompt_cache_monitor() -> PromptCacheMonitor:
+    """Obtém instância singleton do diagnóstico de cache de prompt"""
+    global _monitor_instance
+    if _monitor_instance is None:
+        _monitor_instance = PromptCacheMonitor()
+    return _monitor_instance
+
+def get_context_sizer() -> ContextSizer:
+    """Obtém instância singleton do seletor de num_ctx"""
+    global _sizer_instance
+    if _sizer_instance is None:
+        _sizer_instance = ContextSizer()
+    return _sizer_instance
@@ -16,6 +16,8 @@ from sentence_transformers import SentenceTransformer
 import requests
 import json
 
+from tools.ollama_pool import get_node_pool
+
 # Configuração de logging
 logger = logging.getLogger(__name__)
 
@@ -28,7 +30,6 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', 'escrita_segura_2024')
 }
 
-OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
 EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'bge-m3')
 EMBEDDING_DIM = int(os.getenv('EMBEDDING_DIMENSION', '1024'))
 CHUNK_SIZE = int(os.getenv('RAG_CHUNK_SIZE', '1000'))
@@ -65,14 +66,15 @@ class EmbeddingGenerator:
     def _ollama_embedding(self, text: str) -> Optional[List[float]]:
         """Gera embedding via Ollama"""
         try:
-            response = requests.post(
-                f"{OLLAMA_URL}/api/embeddings",
-                json={
-                    "model": EMBEDDING_MODEL,
-                    "prompt": text
-                },
-                timeout=30
-            )
+            with get_node_pool().use(EMBEDDING_MODEL) as node:
+                response = requests.post(
+                    f"{node.url}/api/embeddings",
+                    json={
+                        "model": EMBEDDING_MODEL,
+                        "prompt": text
+                    },
+                    timeout=30
+                )
             
             if response.status_code == 200:
                 data = response.json()
@@ -0,0 +1,70 @@
+"""
+Contexto por requisição para a camada de LLM
+Valores definidos pelos endpoints (prioridade, projeto) e lidos pelo cliente Ollama
+e pelo escalonador sem precisar atravessar a assinatura de todos os agentes.
+Em geradores assíncronos, use `scoped_iter`: um `request_scope` aberto através de um `yield`
+seria fechado em outro contexto (aclose do servidor) e o reset da ContextVar falharia.
+"""
+
+from enum import IntEnum
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, AsyncIterator, TypeVar
+
+T = TypeVar("T")
+
+
+class Priority(IntEnum):
+    """Classes de prioridade (menor valor = atendido primeiro)"""
+    INTERACTIVE = 0   # chat do usuário
+    AGENT_STEP = 1    # passos de orquestrador/builder
+    BATCH = 2         # benchmarks e tarefas de fundo
+
+
+current_priority: ContextVar[Priority] = ContextVar("current_priority", default=Priority.INTERACTIVE)
+current_project: ContextVar[str] = ContextVar("current_project", default="default")
+current_agent: ContextVar[Optional[str]] = ContextVar("current_agent", default=None)
+# Próximo melhor modelo do router, usado pelo cliente para hedge/failover
+current_backup_model: ContextVar[Optional[str]] = ContextVar("current_backup_model", default=None)
+# Chave da conversa, usada pelo pool de nós para manter a conversa no mesmo servidor
+current_conversation: ContextVar[Optional[str]] = ContextVar("current_conversation", default=None)
+
+
+@contextmanager
+def request_scope(priority: Optional[Priority] = None, project: Optional[str] = None, agent: Optional[str] = None,
+                  backup_model: Optional[str] = None, conversation: Optional[str] = None):
+    """Define prioridade, projeto, agente, modelo de reserva e/ou conversa para as chamadas ao LLM dentro do bloco"""
+    tokens = []
+    if priority is not None:
+        tokens.append((current_priority, current_priority.set(priority)))
+    if project:
+        tokens.append((current_project, current_project.set(project)))
+    if agent:
+        tokens.append((current_agent, current_agent.set(agent)))
+    if backup_model:
+        tokens.append((current_backup_model, current_backup_model.set(backup_model)))
+    if conversation:
+        tokens.append((current_conversation, current_conversation.set(conversation)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+async def scoped_iter(source: AsyncIterator[T], priority: Optional[Priority] = None, project: Optional[str] = None,
+                      agent: Optional[str] = None, backup_model: Optional[str] = None,
+                      conversation: Optional[str] = None) -> AsyncIterator[T]:
+    """Repassa os itens de um gerador com o `request_scope` ativo em cada passo, mas nunca através de um yield"""
+    scope = dict(priority=priority, project=project, agent=agent, backup_model=backup_model, conversation=conversation)
+    try:
+        while True:
+            with request_scope(**scope):
+                try:
+                    item = await source.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+    finally:
+        with request_scope(**scope):
+            await source.aclose()
@@ -0,0 +1,172 @@
+"""
+Snapshots do estado aprendido pelo router
+Métricas dos modelos, decisões em cache, sketches de latência e amostras de TTFT do
+hedge são gravados periodicamente em JSON (arquivo temporário + os.replace, nunca
+um snapshot pela metade) e restaurados no startup: depois de um deploy ou reload o
+router já roteia com o que tinha aprendido. As amostras envelhecem pelo tempo em que
+o processo ficou fora: os sketches decaem desde a última gravação e a taxa de sucesso
+volta para 1.0 na mesma meia-vida.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional, TYPE_CHECKING
+
+from tools.latency_sketch import LATENCY_HALF_LIFE
+
+if TYPE_CHECKING:
+    from advanced_router import AdvancedRouter
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+ROUTER_STATE_ENABLED = os.getenv("ROUTER_STATE_ENABLED", "true").lower() == "true"
+ROUTER_STATE_PATH = Path(os.getenv("ROUTER_STATE_PATH", "data/router/state.json"))
+ROUTER_STATE_INTERVAL = float(os.getenv("ROUTER_STATE_INTERVAL", "60"))
+# Snapshots mais antigos que isso são ignorados (o aprendizado não vale mais)
+ROUTER_STATE_MAX_AGE = float(os.getenv("ROUTER_STATE_MAX_AGE", "86400"))
+# Versão do formato; snapshots de outra versão são descartados
+STATE_VERSION = 1
+
+
+def age_factor(age: float) -> float:
+    """Peso que sobra de uma amostra depois de `age` segundos (mesma meia-vida dos sketches)"""
+    return 0.5 ** (max(age, 0.0) / LATENCY_HALF_LIFE)
+
+
+class RouterStateStore:
+    """Gravação periódica e restauração do estado do router"""
+
+    def __init__(self, path: Path = ROUTER_STATE_PATH, interval: float = ROUTER_STATE_INTERVAL,
+                 enabled: bool = ROUTER_STATE_ENABLED):
+        self.path = path
+        self.interval = interval
+        self.enabled = enabled
+        self.last_save: Optional[float] = None
+        self.restored_from: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"saves": 0, "save_errors": 0, "restores": 0, "discarded": 0}
+
+    def snapshot(self, router: "AdvancedRouter") -> Dict[str, Any]:
+        return {
+            "version": STATE_VERSION,
+            "saved_at": time.time(),
+            "model_metrics": router.model_metrics,
+            "latency": router.latency.to_dict(),
+            "routing_cache": router.routing_cache.to_dict(),
+            "hedge_ttft": {model: list(samples) for model, samples in router.client.hedger.ttft.samples.items()},
+        }
+
+    def save(self, router: "AdvancedRouter") -> bool:
+        """Grava o snapshot de forma atômica"""
+        try:
+            data = self.snapshot(router)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Um temporário por processo: com vários workers, cada um grava o seu e o último vence
+            tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except (OSError, TypeError, ValueError) as e:
+            self.stats["save_errors"] += 1
+            logger.warning(f"Falha ao gravar o estado do router em {self.path}: {e}")
+            return False
+        self.last_save = data["saved_at"]
+        self.stats["saves"] += 1
+        return True
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Snapshot válido do disco (None se ausente, corrompido, de outra versão ou velho demais)"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Estado do router ilegível em {self.path}: {e}")
+            self.stats["discarded"] += 1
+            return None
+        if not isinstance(data, dict) or data.get("version") != STATE_VERSION:
+            logger.info(f"Estado do router em {self.path} é de outra versão; ignorado")
+            self.stats["discarded"] += 1
+            return None
+        if time.time() - data.get("saved_at", 0) > ROUTER_STATE_MAX_AGE:
+            logger.info(f"Estado do router em {self.path} é antigo demais; ignorado")
+            self.stats["discarded"] += 1
+            return None
+        return data
+
+    def restore(self, router: "AdvancedRouter") -> bool:
+        """Aplica o snapshot ao router, envelhecendo as amostras pelo tempo fora do ar"""
+        data = self.load()
+        if data is None:
+            return False
+        factor = age_factor(time.time() - data["saved_at"])
+        router.latency.load(data.get("latency", {}))
+        for model, metrics in data.get("model_metrics", {}).items():
+            restored = router.model_metrics.setdefault(
+                model, {"success_rate": 1.0, "avg_response_time": 0, "total_requests": 0}
+            )
+            restored["total_requests"] = int(metrics.get("total_requests", 0))
+            restored["success_rate"] = 1.0 - (1.0 - float(metrics.get("success_rate", 1.0))) * factor
+            restored["avg_response_time"] = router.latency.service_time(model) or metrics.get("avg_response_time", 0)
+        router.routing_cache.load(data.get("routing_cache", {}))
+        ttft = router.client.hedger.ttft
+        for model, samples in data.get("hedge_ttft", {}).items():
+            for sample in samples:
+                ttft.record(model, sample)
+        self.restored_from = data["saved_at"]
+        self.stats["restores"] += 1
+        logger.info(f"Estado do router restaurado de {self.path} ({time.time() - data['saved_at']:.0f}s atrás)")
+        return True
+
+    async def _run(self, router: "AdvancedRouter"):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.save(router)
+
+    def start(self, router: "AdvancedRouter"):
+        """Restaura o snapshot e inicia as gravações periódicas"""
+        if not self.enabled:
+            return
+        self.restore(router)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(router))
+
+    async def stop(self, router: "AdvancedRouter"):
+        """Para as gravações periódicas e grava o estado final"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.enabled:
+            self.save(router)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "path": str(self.path),
+            "interval": self.interval,
+            "version": STATE_VERSION,
+            "last_save": self.last_save,
+            "restored_from": self.restored_from,
+        }
+
+
+# Singleton instance
+_store_instance = None
+
+def get_router_state_store() -> RouterStateStore:
+    """Obtém instância singleton do armazenamento do estado do router"""
+    global _store_instance
+    if _store_instance is None:
+        _store_instance = RouterStateStore()
+    return _store_instance
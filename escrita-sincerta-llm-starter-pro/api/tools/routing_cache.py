@@ -0,0 +1,106 @@
+"""
+Cache de decisões de roteamento
+A chave é um digest estável das características que decidem o roteamento (tipo,
+complexidade, agente, prefer_fast), não da mensagem: mensagens diferentes com as mesmas
+características reaproveitam a decisão. LRU com TTL e limite de entradas (memória constante);
+tudo é descartado quando o registro de disponibilidade muda de versão.
+"""
+
+import os
+import time
+import json
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+# Configurações
+ROUTER_CACHE_MAX_ENTRIES = int(os.getenv("ROUTER_CACHE_MAX_ENTRIES", "512"))
+# As métricas dos modelos mudam com o tráfego; a decisão é refeita depois disso
+ROUTER_CACHE_TTL = float(os.getenv("ROUTER_CACHE_TTL", "60"))
+
+
+def routing_key(task_type: str, task_complexity: str, agent: Optional[str], prefer_fast: bool) -> str:
+    """Digest estável (igual entre processos) das características normalizadas"""
+    features = {
+        "task_type": task_type,
+        "task_complexity": task_complexity,
+        "agent": agent or "",
+        "prefer_fast": bool(prefer_fast),
+    }
+    encoded = json.dumps(features, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()[:20]
+
+
+class RoutingDecisionCache:
+    """LRU com TTL das decisões (modelo, informações do roteamento)"""
+
+    def __init__(self, max_entries: int = ROUTER_CACHE_MAX_ENTRIES, ttl: float = ROUTER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Tuple[float, str, Dict[str, Any]]]" = OrderedDict()
+        self.version: Optional[int] = None
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    def _check_version(self, version: int):
+        if self.version is None:
+            # Entradas restauradas de um snapshot: adotam a versão do registro deste processo
+            self.version = version
+        elif version != self.version:
+            if self.entries:
+                self.stats["invalidations"] += 1
+            self.entries.clear()
+            self.version = version
+
+    def get(self, key: str, version: int) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Decisão em cache para a chave (None se ausente, vencida ou de outra versão)"""
+        self._check_version(version)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        stored_at, model, routing_info = entry
+        if time.time() - stored_at > self.ttl:
+            del self.entries[key]
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return model, routing_info
+
+    def put(self, key: str, version: int, model: str, routing_info: Dict[str, Any]):
+        self._check_version(version)
+        self.entries[key] = (time.time(), model, routing_info)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"entries": [[key, stored_at, model, info] for key, (stored_at, model, info) in self.entries.items()]}
+
+    def load(self, data: Dict[str, Any]):
+        """Restaura decisões ainda dentro do TTL (o modelo é reverificado a cada acerto)"""
+        now = time.time()
+        for key, stored_at, model, info in data.get("entries", []):
+            if now - stored_at <= self.ttl:
+                self.entries[key] = (stored_at, model, info)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.version = None
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None,
+        }
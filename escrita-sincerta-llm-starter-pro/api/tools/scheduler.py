@@ -0,0 +1,193 @@
+"""
+Fila de admissão por modelo com prioridades
+Cada modelo tem um número fixo de slots de execução (alinhado ao OLLAMA_NUM_PARALLEL);
+requisições excedentes aguardam em filas por prioridade, com rodízio entre projetos.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque, OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Deque, List, Optional
+
+from tools.request_context import Priority, current_priority, current_project
+from tools.ollama_pool import OLLAMA_URLS
+from tools.shared_state import get_shared_router_state, SHARED_LEASE_POLL
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+SLOTS_PER_MODEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
+# Com vários nós, cada modelo tem os slots de todos eles (o pool escolhe o nó na admissão)
+TOTAL_SLOTS_PER_MODEL = SLOTS_PER_MODEL * len(OLLAMA_URLS)
+WAIT_SAMPLES = 500
+
+
+class _ModelQueue:
+    """Slots e filas de espera de um modelo"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.active = 0
+        # prioridade -> projeto -> fila de waiters (a ordem dos projetos define o rodízio)
+        self.waiting: Dict[Priority, "OrderedDict[str, Deque[asyncio.Future]]"] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self.admitted = {priority: 0 for priority in Priority}
+        self.wait_times: Dict[Priority, Deque[float]] = {priority: deque(maxlen=WAIT_SAMPLES) for priority in Priority}
+
+    def queued(self, priority: Optional[Priority] = None) -> int:
+        priorities = [priority] if priority is not None else list(Priority)
+        return sum(len(waiters) for p in priorities for waiters in self.waiting[p].values())
+
+    def enqueue(self, priority: Priority, project: str, future: asyncio.Future):
+        self.waiting[priority].setdefault(project, deque()).append(future)
+
+    def remove(self, priority: Priority, project: str, future: asyncio.Future):
+        waiters = self.waiting[priority].get(project)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self.waiting[priority][project]
+
+    def next_waiter(self) -> Optional[asyncio.Future]:
+        """Maior prioridade primeiro; dentro dela, rodízio entre projetos"""
+        for priority in Priority:
+            projects = self.waiting[priority]
+            while projects:
+                project, waiters = next(iter(projects.items()))
+                future = waiters.popleft()
+                if waiters:
+                    projects.move_to_end(project)
+                else:
+                    del projects[project]
+                if not future.done():
+                    return future
+        return None
+
+
+class ModelScheduler:
+    """
+    Escalonador de acesso aos modelos
+
+    - Pool limitado de slots de concorrência por modelo
+    - Prioridades: chat interativo > passos de agentes > benchmarks
+    - Rodízio justo entre projetos dentro da mesma prioridade
+    - Métricas de tempo de espera na fila
+    """
+
+    def __init__(self, slots_per_model: int = TOTAL_SLOTS_PER_MODEL):
+        self.slots_per_model = max(1, slots_per_model)
+        self._queues: Dict[str, _ModelQueue] = {}
+        # Com vários workers, os slots do modelo são leases no estado compartilhado
+        self.shared = get_shared_router_state()
+
+    def _queue(self, model: str) -> _ModelQueue:
+        if model not in self._queues:
+            self._queues[model] = _ModelQueue(self.slots_per_model)
+        return self._queues[model]
+
+    async def acquire(self, model: str, priority: Optional[Priority] = None, project: Optional[str] = None):
+        """Aguarda um slot livre do modelo"""
+        priority = priority if priority is not None else current_priority.get()
+        project = project or current_project.get()
+        queue = self._queue(model)
+        start = time.monotonic()
+
+        if queue.active < queue.capacity and queue.queued() == 0:
+            queue.active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            queue.enqueue(priority, project, future)
+            logger.debug(f"Requisição enfileirada para {model} (prioridade={priority.name}, projeto={project}, fila={queue.queued()})")
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # O slot foi concedido no mesmo instante do cancelamento
+                    self.release(model)
+                else:
+                    queue.remove(priority, project, future)
+                raise
+
+        queue.admitted[priority] += 1
+        queue.wait_times[priority].append(time.monotonic() - start)
+
+    def release(self, model: str):
+        """Libera o slot e entrega-o ao próximo da fila"""
+        queue = self._queue(model)
+        queue.active = max(0, queue.active - 1)
+        while queue.active < queue.capacity:
+            future = queue.next_waiter()
+            if future is None:
+                break
+            queue.active += 1
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: Optional[Priority] = None, project: Optional[str] = None):
+        """Context manager que segura um slot do modelo durante a geração"""
+        priority = priority if priority is not None else current_priority.get()
+        lease = None
+        if self.shared.enabled:
+            # Limite global primeiro: quem espera vaga em outro worker não prende um slot local.
+            # Prioridades mais altas tentam de novo com mais frequência.
+            lease = await self.shared.acquire_lease(model, self.slots_per_model,
+                                                    poll=SHARED_LEASE_POLL * (1 + priority))
+        try:
+            await self.acquire(model, priority, project)
+        except BaseException:
+            if lease is not None:
+                self.shared.release_lease(lease)
+            raise
+        try:
+            yield
+        finally:
+            self.release(model)
+            if lease is not None:
+                self.shared.release_lease(lease)
+
+    def load(self, model: str) -> Dict[str, int]:
+        """Requisições em execução e na fila do modelo (sem criar a fila); em execução conta todos os workers"""
+        queue = self._queues.get(model)
+        in_flight = queue.active if queue else 0
+        if self.shared.enabled:
+            in_flight = max(in_flight, self.shared.in_flight(model))
+        return {"in_flight": in_flight, "queued": queue.queued() if queue else 0, "capacity": self.slots_per_model}
+
+    def models(self) -> List[str]:
+        return list(self._queues)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Ocupação e tempos de espera por modelo e prioridade"""
+        stats = {"slots_per_model": self.slots_per_model, "models": {}}
+        for model, queue in self._queues.items():
+            waits = {}
+            for priority in Priority:
+                samples = sorted(queue.wait_times[priority])
+                waits[priority.name.lower()] = {
+                    "admitted": queue.admitted[priority],
+                    "queued": queue.queued(priority),
+                    "avg_wait": sum(samples) / len(samples) if samples else 0.0,
+                    "p95_wait": samples[int(0.95 * (len(samples) - 1))] if samples else 0.0,
+                }
+            stats["models"][model] = {
+                "active": queue.active,
+                "capacity": queue.capacity,
+                "queued": queue.queued(),
+                "priorities": waits,
+            }
+        return stats
+
+
+# Singleton instance
+_scheduler_instance = None
+
+def get_scheduler() -> ModelScheduler:
+    """Obtém instância singleton do escalonador"""
+    global _scheduler_instance
+    if _scheduler_instance is None:
+        _scheduler_instance = ModelScheduler()
+    return _scheduler_instance
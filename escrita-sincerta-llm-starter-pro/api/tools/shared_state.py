@@ -0,0 +1,369 @@
+"""
+Estado do router compartilhado entre workers (uvicorn --workers N)
+Um SQLite em modo WAL no disco local guarda o que precisa ser global no host:
+- métricas dos modelos (taxa de sucesso e tempo médio com decaimento)
+- falhas seguidas e cooldown dos modelos (disponibilidade)
+- leases de execução por modelo: o limite de concorrência vale para todos os workers
+
+Cada operação é uma transação curta (BEGIN IMMEDIATE só nas escritas) executada em uma
+thread dedicada do processo: a espera pelo lock do arquivo nunca para o event loop.
+Leases de processos mortos são recolhidos quando o limite é atingido.
+Custo por requisição e atraso do event loop: `python -m tools.bench_shared_state`.
+"""
+
+import os
+import time
+import asyncio
+import sqlite3
+import logging
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Iterator, Optional, Tuple, TypeVar
+
+from tools.latency_sketch import LATENCY_HALF_LIFE
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Configurações
+SHARED_STATE_ENABLED = os.getenv("ROUTER_SHARED_STATE_ENABLED", "false").lower() == "true"
+SHARED_STATE_PATH = Path(os.getenv("ROUTER_SHARED_STATE_PATH", "data/router/shared.db"))
+# Intervalo entre leituras das métricas e cooldowns gravados pelos outros workers (s)
+SHARED_SYNC_INTERVAL = float(os.getenv("ROUTER_SHARED_SYNC_INTERVAL", "1.0"))
+# Espera entre tentativas de obter um lease com o modelo no limite (s)
+SHARED_LEASE_POLL = float(os.getenv("ROUTER_SHARED_LEASE_POLL", "0.05"))
+# Os mesmos limites do registro de disponibilidade, agora contados entre os workers
+SHARED_MAX_FAILURES = int(os.getenv("OLLAMA_AVAILABILITY_MAX_FAILURES", "3"))
+SHARED_COOLDOWN = float(os.getenv("OLLAMA_AVAILABILITY_COOLDOWN", "30"))
+BUSY_TIMEOUT_MS = 5000
+# Contagem de leases reaproveitada no roteamento (várias consultas por requisição)
+IN_FLIGHT_CACHE_TTL = 0.05
+REAP_INTERVAL = 1.0
+SCHEMA_VERSION = 1
+# Falhas do banco compartilhado (SQLite, disco cheio, diretório sem permissão) que só desativam o estado global
+STATE_ERRORS = (sqlite3.Error, OSError)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS model_metrics (
+    model TEXT PRIMARY KEY,
+    success_rate REAL NOT NULL,
+    total_requests INTEGER NOT NULL,
+    rt_weight REAL NOT NULL,
+    rt_sum REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS model_failures (
+    model TEXT PRIMARY KEY,
+    failures INTEGER NOT NULL,
+    down_until REAL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    acquired_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS leases_model ON leases (model);
+"""
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedRouterState:
+    """
+    Métricas, cooldowns e leases dos modelos em um SQLite WAL compartilhado
+
+    Todo acesso ao SQLite roda em uma única thread dedicada (a conexão é dela): o event
+    loop nunca espera o lock do arquivo, mesmo com os workers disputando as escritas.
+    A thread e a conexão são criadas sob demanda e recriadas após um fork.
+    """
+
+    def __init__(self, path: Path = SHARED_STATE_PATH, enabled: bool = SHARED_STATE_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_thread: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._in_flight: Tuple[float, Dict[str, int]] = (0.0, {})
+        self._in_flight_refresh: Optional[Future] = None
+        self._last_reap = 0.0
+        self.stats = {"writes": 0, "reads": 0, "lease_waits": 0, "reaped": 0, "errors": 0}
+        self.op_time = 0.0
+
+    # --- Conexão (só na thread do banco) ---
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._db_thread is None or self._pid != os.getpid():
+            # Depois de um fork a thread e a conexão do processo pai não existem aqui
+            self._db_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-state")
+            self._conn = None
+            self._in_flight_refresh = None
+            self._pid = os.getpid()
+        return self._db_thread
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Durável até a última transação confirmada no WAL; o fsync fica nos checkpoints
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            conn.executescript(SCHEMA)
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+            # Leases com o pid deste processo são de um processo anterior que reusou o pid
+            conn.execute("DELETE FROM leases WHERE pid = ?", (os.getpid(),))
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transação de escrita (BEGIN IMMEDIATE: o lock de escrita é pego no início)"""
+        conn = self._connection()
+        start = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self.op_time += time.perf_counter() - start
+            self.stats["writes"] += 1
+
+    @contextmanager
+    def _read(self) -> Iterator[sqlite3.Connection]:
+        start = time.perf_counter()
+        try:
+            yield self._connection()
+        finally:
+            self.op_time += time.perf_counter() - start
+            self.stats["reads"] += 1
+
+    def _failed(self, operation: str, error: BaseException):
+        """Falha do SQLite não derruba a requisição: o worker segue só com o estado local"""
+        self.stats["errors"] += 1
+        logger.warning(f"Estado compartilhado indisponível ({operation}): {error}")
+
+    async def _call(self, function: Callable[..., T], *args: Any) -> T:
+        """Executa uma operação na thread do banco sem bloquear o event loop"""
+        return await asyncio.wrap_future(self._executor().submit(function, *args))
+
+    def _submit(self, operation: str, function: Callable[..., Any], *args: Any) -> Future:
+        """Operação sem resposta (liberar lease, atualizar contagem): enfileirada sem esperar"""
+        future = self._executor().submit(function, *args)
+        future.add_done_callback(lambda done: done.exception() and self._failed(operation, done.exception()))
+        return future
+
+    def _close_connection(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def close(self):
+        if self._db_thread is None or self._pid != os.getpid():
+            return
+        try:
+            await self._call(self._close_connection)
+        except STATE_ERRORS as e:
+            self._failed("close", e)
+        self._db_thread.shutdown(wait=False)
+        self._db_thread = None
+
+    # --- Métricas e falhas ---
+
+    async def record_request(self, model: str, success: bool,
+                             response_time: float) -> Optional[Tuple[Dict[str, Any], Optional[float]]]:
+        """
+        Registra uma requisição do modelo em todos os workers.
+        Retorna as métricas globais atualizadas e o fim do cooldown, se o modelo saiu de rotação
+        (None se o SQLite falhar).
+        """
+        try:
+            return await self._call(self._record_request, model, success, response_time)
+        except STATE_ERRORS as e:
+            self._failed("record_request", e)
+            return None
+
+    def _record_request(self, model: str, success: bool, response_time: float) -> Tuple[Dict[str, Any], Optional[float]]:
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT success_rate, total_requests, rt_weight, rt_sum, updated_at FROM model_metrics WHERE model = ?",
+                (model,)
+            ).fetchone()
+            success_rate, total_requests, rt_weight, rt_sum, updated_at = row or (1.0, 0, 0.0, 0.0, now)
+            success_rate = 0.9 * success_rate + 0.1 * (1.0 if success else 0.0)
+            if success:
+                # Média com a mesma meia-vida dos sketches de latência
+                factor = 0.5 ** (max(now - updated_at, 0.0) / LATENCY_HALF_LIFE)
+                rt_weight = rt_weight * factor + 1.0
+                rt_sum = rt_sum * factor + response_time
+                updated_at = now
+            conn.execute(
+                "INSERT OR REPLACE INTO model_metrics (model, success_rate, total_requests, rt_weight, rt_sum, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (model, success_rate, total_requests + 1, rt_weight, rt_sum, updated_at)
+            )
+            down_until = None
+            if success:
+                conn.execute("UPDATE model_failures SET failures = 0 WHERE model = ?", (model,))
+            else:
+                failure = conn.execute("SELECT failures, down_until FROM model_failures WHERE model = ?", (model,)).fetchone()
+                failures, down_until = failure or (0, None)
+                failures += 1
+                if failures >= SHARED_MAX_FAILURES and (down_until is None or down_until <= now):
+                    down_until = now + SHARED_COOLDOWN
+                    failures = 0
+                conn.execute("INSERT OR REPLACE INTO model_failures (model, failures, down_until) VALUES (?, ?, ?)",
+                             (model, failures, down_until))
+        metrics = {
+            "success_rate": success_rate,
+            "avg_response_time": rt_sum / rt_weight if rt_weight else 0,
+            "total_requests": total_requests + 1,
+        }
+        return metrics, down_until if down_until and down_until > now else None
+
+    async def read(self) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, float]]:
+        """Métricas globais por modelo e cooldowns em vigor (modelo -> fim do cooldown)"""
+        try:
+            return await self._call(self._read_all)
+        except STATE_ERRORS as e:
+            self._failed("read", e)
+            return {}, {}
+
+    def _read_all(self) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, float]]:
+        now = time.time()
+        with self._read() as conn:
+            rows = conn.execute(
+                "SELECT model, success_rate, total_requests, rt_weight, rt_sum FROM model_metrics"
+            ).fetchall()
+            down = conn.execute(
+                "SELECT model, down_until FROM model_failures WHERE down_until > ?", (now,)
+            ).fetchall()
+        metrics = {
+            model: {
+                "success_rate": success_rate,
+                "avg_response_time": rt_sum / rt_weight if rt_weight else 0,
+                "total_requests": total_requests,
+            }
+            for model, success_rate, total_requests, rt_weight, rt_sum in rows
+        }
+        return metrics, dict(down)
+
+    # --- Leases de execução ---
+
+    def _try_acquire_lease(self, model: str, limit: int) -> Optional[int]:
+        """Lease de execução do modelo se houver vaga no limite global (None se não houver)"""
+        with self._transaction() as conn:
+            (active,) = conn.execute("SELECT COUNT(*) FROM leases WHERE model = ?", (model,)).fetchone()
+            if active < limit:
+                cursor = conn.execute("INSERT INTO leases (model, pid, acquired_at) VALUES (?, ?, ?)",
+                                      (model, os.getpid(), time.time()))
+                return cursor.lastrowid
+        # No limite: vagas presas por workers mortos voltam para a próxima tentativa
+        self._reap_dead_leases()
+        return None
+
+    async def acquire_lease(self, model: str, limit: int, poll: float = SHARED_LEASE_POLL) -> Optional[int]:
+        """Aguarda uma vaga no limite global do modelo (None se o SQLite falhar: só o limite local vale)"""
+        waited = False
+        while True:
+            future = self._executor().submit(self._try_acquire_lease, model, limit)
+            try:
+                lease = await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                # A tentativa pode já estar rodando na thread: um lease obtido depois do cancelamento é devolvido
+                future.add_done_callback(self._release_orphan)
+                raise
+            except STATE_ERRORS as e:
+                self._failed("acquire_lease", e)
+                return None
+            if lease is not None:
+                return lease
+            if not waited:
+                self.stats["lease_waits"] += 1
+                waited = True
+            await asyncio.sleep(poll)
+
+    def _release_orphan(self, future: Future):
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            self.release_lease(future.result())
+
+    def release_lease(self, lease: int):
+        """Devolve o lease na thread do banco, sem esperar (seguro em finally e em cancelamentos)"""
+        self._submit("release_lease", self._release_lease, lease)
+
+    def _release_lease(self, lease: int):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE id = ?", (lease,))
+
+    def _reap_dead_leases(self):
+        """Remove leases de workers que morreram sem liberá-los"""
+        now = time.time()
+        if now - self._last_reap < REAP_INTERVAL:
+            return
+        self._last_reap = now
+        with self._read() as conn:
+            pids = [pid for (pid,) in conn.execute("SELECT DISTINCT pid FROM leases").fetchall()]
+        dead = [pid for pid in pids if not _pid_alive(pid)]
+        if not dead:
+            return
+        with self._transaction() as conn:
+            cursor = conn.execute(f"DELETE FROM leases WHERE pid IN ({','.join('?' * len(dead))})", dead)
+            self.stats["reaped"] += cursor.rowcount
+        logger.warning(f"Leases de workers encerrados removidos (pids {dead})")
+
+    def _count_in_flight(self) -> Dict[str, int]:
+        with self._read() as conn:
+            counts = dict(conn.execute("SELECT model, COUNT(*) FROM leases GROUP BY model").fetchall())
+        self._in_flight = (time.monotonic(), counts)
+        return counts
+
+    def in_flight(self, model: Optional[str] = None, max_age: float = IN_FLIGHT_CACHE_TTL):
+        """
+        Leases ativos por modelo em todos os workers, sem esperar o banco: devolve a última
+        contagem e, se ela passou de `max_age` s, agenda uma nova na thread do banco
+        """
+        cached_at, counts = self._in_flight
+        if time.monotonic() - cached_at > max_age:
+            self._executor()
+            if self._in_flight_refresh is None or self._in_flight_refresh.done():
+                self._in_flight_refresh = self._submit("in_flight", self._count_in_flight)
+        return counts if model is None else counts.get(model, 0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        operations = self.stats["writes"] + self.stats["reads"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "path": str(self.path),
+            "pid": os.getpid(),
+            "avg_operation_us": round(self.op_time / operations * 1e6, 1) if operations else None,
+            "in_flight": self.in_flight() if self.enabled else {},
+        }
+
+
+# Singleton instance
+_shared_instance = None
+
+def get_shared_router_state() -> SharedRouterState:
+    """Obtém instância singleton do estado compartilhado (uma conexão por processo)"""
+    global _shared_instance
+    if _shared_instance is None:
+        _shared_instance = SharedRouterState()
+    return _shared_instance
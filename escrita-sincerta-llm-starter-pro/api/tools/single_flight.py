@@ -0,0 +1,136 @@
+"""
+Coalescência (single-flight) de chamadas idênticas em andamento
+Requisições concorrentes com a mesma chave aguardam uma única execução compartilhada;
+em streaming, os chunks da geração única são repassados a todos os assinantes.
+"""
+
+import json
+import hashlib
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Callable, Awaitable, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(payload: Dict[str, Any]) -> str:
+    """Chave estável de uma requisição (modelo, mensagens, opções...)"""
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """Execução compartilhada sem streaming"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _StreamFlight:
+    """Execução compartilhada com streaming: buffer de chunks + sinal de atualização"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.chunks: List[Dict[str, Any]] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.updated = asyncio.Event()
+
+    def notify(self):
+        previous, self.updated = self.updated, asyncio.Event()
+        previous.set()
+
+
+class SingleFlight:
+    """
+    Agrupador de requisições idênticas em andamento
+
+    - A primeira chamada (líder) dispara a execução em uma task própria
+    - Chamadas seguintes com a mesma chave aguardam o mesmo resultado
+    - A execução só é cancelada quando todos os interessados desistem
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+        self.stats = {"executions": 0, "coalesced": 0, "stream_executions": 0, "stream_coalesced": 0}
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Executa `factory()` uma única vez por chave entre chamadas concorrentes"""
+        flight = self._calls.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.create_task(factory()))
+            self._calls[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._calls, key, flight))
+            self.stats["executions"] += 1
+        else:
+            self.stats["coalesced"] += 1
+            logger.debug(f"Requisição idêntica em andamento, aguardando resultado compartilhado ({key[:12]})")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[Dict[str, Any]]]) -> AsyncIterator[Dict[str, Any]]:
+        """Assina a geração em streaming da chave, iniciando-a se necessário"""
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _StreamFlight()
+            self._streams[key] = flight
+            flight.task = asyncio.create_task(self._pump(key, flight, factory))
+            self.stats["stream_executions"] += 1
+        else:
+            self.stats["stream_coalesced"] += 1
+            logger.debug(f"Streaming idêntico em andamento, assinando geração compartilhada ({key[:12]})")
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                # Replay do que já foi gerado e depois acompanha os novos chunks
+                while index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                if flight.finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.updated.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    async def _pump(self, key: str, flight: _StreamFlight, factory: Callable[[], AsyncIterator[Dict[str, Any]]]):
+        try:
+            async for chunk in factory():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.finished = True
+            self._forget(self._streams, key, flight)
+            flight.notify()
+
+    @staticmethod
+    def _forget(registry: Dict[str, Any], key: str, flight: Any):
+        if registry.get(key) is flight:
+            del registry[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estatísticas de coalescência"""
+        return {
+            **self.stats,
+            "in_flight": len(self._calls),
+            "in_flight_streams": len(self._streams),
+        }
@@ -0,0 +1,140 @@
+"""
+Saída estruturada (JSON) dos agentes
+Os esquemas são enviados no parâmetro `format` do Ollama, que restringe a geração
+ao JSON do esquema. A resposta é validada com pydantic; só quando a validação falha
+é feita uma única chamada curta de correção (sem o prompt do agente).
+"""
+
+import re
+import json
+import logging
+from collections import Counter
+from typing import Dict, Any, List, Optional, Type, TypeVar, Callable, Awaitable
+
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+# Tokens extras além do JSON original para a resposta da correção
+REPAIR_EXTRA_TOKENS = 256
+
+REPAIR_SYSTEM_PROMPT = "Você corrige JSON inválido. Responda somente com o JSON corrigido, sem explicações."
+
+
+# --- Esquemas ---
+
+class PlanStep(BaseModel):
+    step: int
+    agent: str
+    action: str
+    details: Dict[str, Any] = {}
+
+
+class OrchestratorPlan(BaseModel):
+    """Plano do Orquestrador: passos sequenciais delegados a agentes"""
+    plan: List[PlanStep]
+
+
+class ProjectStructure(BaseModel):
+    """Estrutura de arquivos do Builder: caminho -> propósito do arquivo"""
+    project_name: str
+    files: Dict[str, str]
+
+
+class StructuredOutputError(Exception):
+    """A resposta não pôde ser validada nem corrigida"""
+
+
+def extract_json(text: str) -> str:
+    """Remove cercas de código e texto em volta do objeto JSON"""
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.S)
+    if fenced:
+        text = fenced.group(1)
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return text.strip()
+    return text[start:end + 1]
+
+
+def parse_structured(text: str, schema: Type[T]) -> T:
+    """Valida a resposta contra o esquema (levanta ValueError com a causa)"""
+    try:
+        return schema.model_validate_json(extract_json(text))
+    except ValidationError as e:
+        raise ValueError(str(e)) from e
+
+
+def repair_messages(text: str, schema: Type[BaseModel], error: str) -> List[Dict[str, str]]:
+    """Prompt curto de correção: esquema, erro e o JSON a corrigir"""
+    return [
+        {"role": "system", "content": REPAIR_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": (
+                f"ESQUEMA:\n{json.dumps(schema.model_json_schema(), ensure_ascii=False)}\n\n"
+                f"ERRO:\n{error[:500]}\n\n"
+                f"JSON A CORRIGIR:\n{text}"
+            ),
+        },
+    ]
+
+
+class StructuredOutputStats:
+    """Falhas de validação e correções por esquema"""
+
+    def __init__(self):
+        self.counters: Dict[str, Counter] = {}
+
+    def record(self, schema: str, event: str):
+        self.counters.setdefault(schema, Counter())[event] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {}
+        for schema, counts in self.counters.items():
+            calls = counts["calls"]
+            stats[schema] = {
+                **counts,
+                "failure_rate": round(counts["parse_failures"] / calls, 3) if calls else 0.0,
+                "retry_rate": round(counts["repairs"] / calls, 3) if calls else 0.0,
+                "final_failure_rate": round(counts["repair_failures"] / calls, 3) if calls else 0.0,
+            }
+        return stats
+
+
+async def parse_or_repair(text: str, schema: Type[T],
+                          repair: Callable[[List[Dict[str, str]], int], Awaitable[str]]) -> T:
+    """
+    Valida `text`; se falhar, chama `repair(mensagens, num_predict)` uma vez e valida o resultado.
+    Levanta StructuredOutputError quando nem a correção é válida.
+    """
+    stats = get_structured_output_stats()
+    name = schema.__name__
+    stats.record(name, "calls")
+    try:
+        return parse_structured(text, schema)
+    except ValueError as e:
+        error = str(e)
+    stats.record(name, "parse_failures")
+    stats.record(name, "repairs")
+    logger.warning(f"JSON inválido para {name}, tentando correção: {error.splitlines()[0] if error else ''}")
+
+    num_predict = len(text) // 3 + REPAIR_EXTRA_TOKENS
+    try:
+        repaired = await repair(repair_messages(text, schema, error), num_predict)
+        return parse_structured(repaired, schema)
+    except ValueError as e:
+        stats.record(name, "repair_failures")
+        raise StructuredOutputError(f"{name} inválido após correção: {e}") from e
+
+
+# Singleton instance
+_stats_instance = None
+
+def get_structured_output_stats() -> StructuredOutputStats:
+    """Obtém instância singleton das métricas de saída estruturada"""
+    global _stats_instance
+    if _stats_instance is None:
+        _stats_instance = StructuredOutputStats()
+    return _stats_instance
@@ -0,0 +1,413 @@
+"""
+Classificador de tarefas por embeddings (opcional)
+A mensagem é convertida em embedding pelo EmbeddingGenerator do RAG e comparada com
+centroides de tipo e de complexidade, montados a partir dos exemplos de roteamento
+(/routing/examples) e do tráfego rotulado (data/router/labeled_traffic.jsonl, alimentado
+por /routing/feedback). Os centroides ficam em cache em disco. Se o embedding não chega
+dentro do orçamento de latência, ou a confiança é baixa, o router usa as palavras-chave.
+"""
+
+import os
+import math
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import operator
+from pathlib import Path
+from collections import Counter
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+CLASSIFIER_ENABLED = os.getenv("ROUTER_CLASSIFIER_ENABLED", "false").lower() == "true"
+# Orçamento para o embedding da mensagem; estourou, vale a classificação por palavras-chave
+CLASSIFIER_BUDGET_MS = float(os.getenv("ROUTER_CLASSIFIER_BUDGET_MS", "150"))
+CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("ROUTER_CLASSIFIER_MIN_CONFIDENCE", "0.5"))
+# Temperatura do softmax sobre as similaridades (menor = confiança mais concentrada)
+CLASSIFIER_TEMPERATURE = float(os.getenv("ROUTER_CLASSIFIER_TEMPERATURE", "0.05"))
+# Só o início de mensagens longas é usado no embedding
+CLASSIFIER_MAX_CHARS = int(os.getenv("ROUTER_CLASSIFIER_MAX_CHARS", "2000"))
+# Embeddings de classificação simultâneos; com todos ocupados (inclusive os que estouraram o
+# orçamento e ainda rodam na thread) a requisição vai direto para as palavras-chave
+CLASSIFIER_MAX_IN_FLIGHT = int(os.getenv("ROUTER_CLASSIFIER_MAX_IN_FLIGHT", "2"))
+CENTROIDS_PATH = Path(os.getenv("ROUTER_CLASSIFIER_CACHE_PATH", "data/router/task_centroids.json"))
+LABELED_TRAFFIC_PATH = Path(os.getenv("ROUTER_LABELED_TRAFFIC_PATH", "data/router/labeled_traffic.jsonl"))
+
+DIMENSIONS = ("task_type", "task_complexity")
+
+# Tipo de tarefa de cada agente esperado nos exemplos
+AGENT_TASK_TYPES = {
+    "ideator": "ideation",
+    "architect": "architecture",
+    "builder": "coding",
+    "dev_fullstack": "coding",
+    "reflexivo": "analysis",
+}
+
+ROUTING_EXAMPLES = [
+    {
+        "category": "Ideação de SaaS",
+        "messages": [
+            "Preciso de uma ideia para um SaaS de gestão de projetos para startups",
+            "Quero criar um app que resolva problemas de comunicação em equipes remotas",
+            "Gere uma ideia inovadora para marketplace de serviços digitais"
+        ],
+        "expected_agent": "ideator",
+        "expected_complexity": "medium",
+        "expected_models": ["qwen2.5:7b", "llama3.1:8b-instruct"]
+    },
+    {
+        "category": "Arquitetura de Sistema",
+        "messages": [
+            "Design a arquitetura para um sistema de e-commerce enterprise com microservices",
+            "Preciso de uma arquitetura escalável para uma plataforma de streaming",
+            "Como estruturar um sistema de chat em tempo real com alta disponibilidade"
+        ],
+        "expected_agent": "architect",
+        "expected_complexity": "expert",
+        "expected_models": ["llama3.1:8b-instruct", "qwen2.5:7b"]
+    },
+    {
+        "category": "Desenvolvimento de Código",
+        "messages": [
+            "Crie um projeto React com TypeScript e setup completo",
+            "Gere o scaffolding para uma API FastAPI com autenticação JWT",
+            "Build um app Flutter com navegação e gerenciamento de estado"
+        ],
+        "expected_agent": "builder",
+        "expected_complexity": "complex",
+        "expected_models": ["codegemma:7b", "llama3.1:8b-instruct"]
+    },
+    {
+        "category": "Desenvolvimento Simples",
+        "messages": [
+            "Crie uma função Python para calcular fibonacci",
+            "Faça um componente React básico de botão",
+            "Escreva um endpoint FastAPI simples para health check"
+        ],
+        "expected_agent": "dev_fullstack",
+        "expected_complexity": "simple",
+        "expected_models": ["phi3:3.8b", "qwen2.5:7b"]
+    },
+    {
+        "category": "Análise e Planejamento",
+        "messages": [
+            "Analise os prós e contras de usar microservices vs monolito",
+            "Revise esta arquitetura e sugira melhorias de performance",
+            "Faça uma análise estratégica deste plano de produto"
+        ],
+        "expected_agent": "reflexivo",
+        "expected_complexity": "complex",
+        "expected_models": ["llama3.1:8b-instruct", "qwen2.5:7b"]
+    }
+]
+
+
+def example_labels() -> List[Dict[str, str]]:
+    """Mensagens rotuladas dos exemplos de roteamento"""
+    return [
+        {"message": message, "task_type": AGENT_TASK_TYPES[example["expected_agent"]],
+         "task_complexity": example["expected_complexity"]}
+        for example in ROUTING_EXAMPLES for message in example["messages"]
+    ]
+
+
+def load_labeled_traffic(path: Path = LABELED_TRAFFIC_PATH) -> List[Dict[str, str]]:
+    """Tráfego rotulado (uma mensagem JSON por linha); linhas inválidas são ignoradas"""
+    if not path.exists():
+        return []
+    labels = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if item.get("message") and any(item.get(dimension) for dimension in DIMENSIONS):
+                labels.append(item)
+    return labels
+
+
+def _normalized(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else vector
+
+
+def _dot(a: List[float], b: List[float]) -> float:
+    return sum(map(operator.mul, a, b))
+
+
+def default_embedder() -> Optional[Tuple[Callable[[str], Optional[List[float]]], str]]:
+    """EmbeddingGenerator do RAG e o nome do modelo (None se as dependências do RAG não estão instaladas)"""
+    try:
+        from tools.rag import EmbeddingGenerator, EMBEDDING_MODEL
+    except ImportError as e:
+        logger.warning(f"Classificador de tarefas desativado, RAG indisponível: {e}")
+        return None
+    return EmbeddingGenerator().generate_embedding, EMBEDDING_MODEL
+
+
+def _consume_result(task: asyncio.Task):
+    """Recolhe o resultado de um embedding abandonado (sem aviso de exceção não lida)"""
+    if not task.cancelled():
+        task.exception()
+
+
+class Centroid:
+    """Média dos embeddings de um rótulo (atualizada incrementalmente)"""
+
+    def __init__(self, mean: List[float], count: int):
+        self.mean = mean
+        self.count = count
+        self.unit = _normalized(mean)
+
+    def add(self, vector: List[float]):
+        self.count += 1
+        self.mean = [m + (v - m) / self.count for m, v in zip(self.mean, vector)]
+        self.unit = _normalized(self.mean)
+
+
+class TaskClassifier:
+    """
+    Tipo e complexidade da tarefa por similaridade com centroides
+
+    - `classify` devolve rótulo e confiança por dimensão, ou None (desativado,
+      centroides ainda não montados, embedding fora do orçamento ou erro)
+    - Centroides em cache em disco, refeitos quando os exemplos ou o modelo mudam
+    - `add_label` grava tráfego rotulado e atualiza os centroides sem refazê-los
+    - Arquivos lidos e gravados fora do event loop
+    """
+
+    def __init__(self, embed: Optional[Callable[[str], Optional[List[float]]]] = None,
+                 model_name: Optional[str] = None, enabled: bool = CLASSIFIER_ENABLED):
+        self.enabled = enabled
+        self._embed = embed
+        self.model_name = model_name
+        self.centroids: Dict[str, Dict[str, Centroid]] = {dimension: {} for dimension in DIMENSIONS}
+        self.ready = False
+        # Hash encadeado do modelo e dos rótulos, na ordem do arquivo (atualizado a cada rótulo novo)
+        self.digest: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._embed_slots = asyncio.Semaphore(max(1, CLASSIFIER_MAX_IN_FLIGHT))
+        # Serializa as gravações: a ordem do arquivo de tráfego é a ordem do hash
+        self._write_lock = asyncio.Lock()
+        self.stats: Counter = Counter()
+        self.latency_total = 0.0
+
+    # --- Embeddings ---
+
+    def _embedder(self) -> Optional[Callable[[str], Optional[List[float]]]]:
+        if self._embed is None and self.enabled:
+            embedder = default_embedder()
+            if embedder is None:
+                self.enabled = False
+            else:
+                self._embed, self.model_name = embedder
+        return self._embed
+
+    async def embed(self, text: str) -> Optional[List[float]]:
+        embed = self._embedder()
+        if embed is None:
+            return None
+        # EmbeddingGenerator é síncrono (requests): roda fora do event loop
+        vector = await asyncio.to_thread(embed, text[:CLASSIFIER_MAX_CHARS])
+        return vector or None
+
+    # --- Centroides ---
+
+    def _digest(self, labels: List[Dict[str, str]]) -> str:
+        digest = hashlib.sha1(json.dumps(self.model_name).encode("utf-8")).hexdigest()
+        for label in labels:
+            digest = self._chain(digest, label)
+        return digest
+
+    @staticmethod
+    def _chain(digest: str, label: Dict[str, str]) -> str:
+        encoded = json.dumps(label, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha1(digest.encode("ascii") + encoded).hexdigest()
+
+    def _load_cache(self, digest: str) -> bool:
+        try:
+            with open(CENTROIDS_PATH, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return False
+        if data.get("digest") != digest:
+            return False
+        self.centroids = {
+            dimension: {label: Centroid(item["mean"], item["count"]) for label, item in data["centroids"].get(dimension, {}).items()}
+            for dimension in DIMENSIONS
+        }
+        return True
+
+    def _cache_data(self) -> Dict[str, Any]:
+        return {
+            "digest": self.digest,
+            "model": self.model_name,
+            "created_at": time.time(),
+            "centroids": {
+                dimension: {label: {"mean": centroid.mean, "count": centroid.count} for label, centroid in centroids.items()}
+                for dimension, centroids in self.centroids.items()
+            },
+        }
+
+    @staticmethod
+    def _write_cache(data: Dict[str, Any]):
+        CENTROIDS_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = CENTROIDS_PATH.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, CENTROIDS_PATH)
+
+    async def _save_cache(self):
+        """Grava os centroides em uma thread (o retrato é tirado no event loop)"""
+        try:
+            await asyncio.to_thread(self._write_cache, self._cache_data())
+        except OSError as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Falha ao gravar centroides em {CENTROIDS_PATH}: {e}")
+
+    @staticmethod
+    def _append_label(label: Dict[str, str]):
+        LABELED_TRAFFIC_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(LABELED_TRAFFIC_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(label, ensure_ascii=False) + "\n")
+
+    def _add_vector(self, label: Dict[str, str], vector: List[float]):
+        for dimension in DIMENSIONS:
+            value = label.get(dimension)
+            if not value:
+                continue
+            centroid = self.centroids[dimension].get(value)
+            if centroid is None:
+                self.centroids[dimension][value] = Centroid(list(vector), 1)
+            else:
+                centroid.add(vector)
+
+    async def build(self):
+        """Carrega os centroides do cache ou os monta embutindo os exemplos rotulados"""
+        if self._embedder() is None:
+            return
+        async with self._write_lock:
+            labels = example_labels() + await asyncio.to_thread(load_labeled_traffic)
+            self.digest = self._digest(labels)
+            if await asyncio.to_thread(self._load_cache, self.digest):
+                logger.info(f"Centroides do classificador carregados de {CENTROIDS_PATH}")
+            else:
+                start = time.time()
+                self.centroids = {dimension: {} for dimension in DIMENSIONS}
+                for label in labels:
+                    vector = await self.embed(label["message"])
+                    if vector:
+                        self._add_vector(label, vector)
+                if not any(self.centroids.values()):
+                    logger.warning("Classificador de tarefas sem centroides (embeddings falharam)")
+                    return
+                await self._save_cache()
+                logger.info(f"Centroides do classificador montados com {len(labels)} exemplos em {time.time() - start:.1f}s")
+            self.ready = True
+
+    async def add_label(self, message: str, task_type: Optional[str] = None,
+                        task_complexity: Optional[str] = None) -> bool:
+        """Grava uma mensagem rotulada e atualiza os centroides (e o cache) com ela"""
+        label = {"message": message, "task_type": task_type, "task_complexity": task_complexity}
+        label = {key: value for key, value in label.items() if value}
+        # O embedding vem antes: arquivo, centroides e hash mudam juntos, na mesma ordem, sob o lock
+        vector = await self.embed(message) if self.ready else None
+        async with self._write_lock:
+            await asyncio.to_thread(self._append_label, label)
+            self.stats["labels"] += 1
+            if not self.ready or not vector:
+                # Fora dos centroides e do hash: o cache deixa de bater com o arquivo e é refeito no próximo build
+                return False
+            self._add_vector(label, vector)
+            self.digest = self._chain(self.digest, label)
+            await self._save_cache()
+        return True
+
+    def start(self):
+        """Monta os centroides em background (sem atrasar o startup)"""
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.build())
+
+    # --- Classificação ---
+
+    def _score(self, vector: List[float], centroids: Dict[str, Centroid]) -> Optional[Dict[str, Any]]:
+        if not centroids:
+            return None
+        unit = _normalized(vector)
+        similarities = {label: _dot(unit, centroid.unit) for label, centroid in centroids.items()}
+        best = max(similarities, key=similarities.get)
+        top = similarities[best]
+        weights = {label: math.exp((similarity - top) / CLASSIFIER_TEMPERATURE) for label, similarity in similarities.items()}
+        return {
+            "label": best,
+            "confidence": round(weights[best] / sum(weights.values()), 3),
+            "similarity": round(top, 3),
+        }
+
+    async def classify(self, message: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Rótulo e confiança por dimensão, ou None para usar as palavras-chave"""
+        if not self.enabled or not self.ready:
+            return None
+        self.stats["requests"] += 1
+        if self._embed_slots.locked():
+            # Embeddings anteriores ainda rodando (lentos ou abandonados pelo orçamento)
+            self.stats["busy"] += 1
+            return None
+        start = time.perf_counter()
+        await self._embed_slots.acquire()
+        # O slot só volta quando a thread termina, não quando o orçamento estoura
+        embedding = asyncio.create_task(self.embed(message))
+        embedding.add_done_callback(lambda _: self._embed_slots.release())
+        try:
+            vector = await asyncio.wait_for(asyncio.shield(embedding), CLASSIFIER_BUDGET_MS / 1000)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            embedding.add_done_callback(_consume_result)
+            return None
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.debug(f"Falha no embedding do classificador: {e}")
+            return None
+        if not vector:
+            self.stats["errors"] += 1
+            return None
+        result = {dimension: self._score(vector, self.centroids[dimension]) for dimension in DIMENSIONS}
+        self.latency_total += time.perf_counter() - start
+        self.stats["classified"] += 1
+        return {dimension: score for dimension, score in result.items() if score}
+
+    def record_outcome(self, dimension: str, used_classifier: bool, agrees_with_keywords: bool):
+        self.stats[f"{dimension}_{'classifier' if used_classifier else 'low_confidence'}"] += 1
+        if agrees_with_keywords:
+            self.stats[f"{dimension}_agrees_with_keywords"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        classified = self.stats["classified"]
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "model": self.model_name,
+            "budget_ms": CLASSIFIER_BUDGET_MS,
+            "max_in_flight": CLASSIFIER_MAX_IN_FLIGHT,
+            "min_confidence": CLASSIFIER_MIN_CONFIDENCE,
+            "centroids": {dimension: {label: centroid.count for label, centroid in centroids.items()}
+                          for dimension, centroids in self.centroids.items()},
+            **self.stats,
+            "avg_latency_ms": round(self.latency_total / classified * 1000, 1) if classified else None,
+        }
+
+
+# Singleton instance
+_classifier_instance = None
+
+def get_task_classifier() -> TaskClassifier:
+    """Obtém instância singleton do classificador de tarefas"""
+    global _classifier_instance
+    if _classifier_instance is None:
+        _classifier_instance = TaskClassifier()
+    return _classifier_instance
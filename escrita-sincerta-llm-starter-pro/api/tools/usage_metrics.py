@@ -0,0 +1,80 @@
+"""
+Métricas de tokens e tempo por modelo e por agente
+Agrega os contadores que o Ollama devolve em cada geração (prompt_eval_*, eval_*,
+load_duration) em vazão de prompt e de geração (tokens/s), tempo de carga e tokens totais.
+"""
+
+from typing import Dict, Any, Optional
+
+# load_duration acima disso indica que o modelo foi carregado do disco na chamada
+COLD_LOAD_THRESHOLD = 0.5
+NS = 1e9
+
+
+class UsageAggregate:
+    """Somatório dos contadores de um modelo (ou agente)"""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.prompt_seconds = 0.0
+        self.generated_tokens = 0
+        self.generation_seconds = 0.0
+        self.load_seconds = 0.0
+        self.cold_loads = 0
+
+    def add(self, usage: Dict[str, int]):
+        self.calls += 1
+        self.prompt_tokens += usage.get("prompt_eval_count", 0)
+        self.prompt_seconds += usage.get("prompt_eval_duration", 0) / NS
+        self.generated_tokens += usage.get("eval_count", 0)
+        self.generation_seconds += usage.get("eval_duration", 0) / NS
+        load_seconds = usage.get("load_duration", 0) / NS
+        self.load_seconds += load_seconds
+        if load_seconds > COLD_LOAD_THRESHOLD:
+            self.cold_loads += 1
+
+    @property
+    def prompt_tokens_per_second(self) -> Optional[float]:
+        return self.prompt_tokens / self.prompt_seconds if self.prompt_seconds else None
+
+    @property
+    def generation_tokens_per_second(self) -> Optional[float]:
+        return self.generated_tokens / self.generation_seconds if self.generation_seconds else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        prompt_tps = self.prompt_tokens_per_second
+        generation_tps = self.generation_tokens_per_second
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "generated_tokens": self.generated_tokens,
+            "total_tokens": self.prompt_tokens + self.generated_tokens,
+            "prompt_tokens_per_second": round(prompt_tps, 1) if prompt_tps else None,
+            "generation_tokens_per_second": round(generation_tps, 1) if generation_tps else None,
+            "avg_load_time": round(self.load_seconds / self.calls, 3) if self.calls else None,
+            "cold_loads": self.cold_loads,
+        }
+
+
+class UsageMetrics:
+    """Contadores do Ollama agregados por modelo e por agente"""
+
+    def __init__(self):
+        self.by_model: Dict[str, UsageAggregate] = {}
+        self.by_agent: Dict[str, UsageAggregate] = {}
+
+    def record(self, model: str, usage: Dict[str, int], agent: Optional[str] = None):
+        if not usage:
+            return
+        self.by_model.setdefault(model, UsageAggregate()).add(usage)
+        self.by_agent.setdefault(agent or "direct_chat", UsageAggregate()).add(usage)
+
+    def for_model(self, model: str) -> Optional[UsageAggregate]:
+        return self.by_model.get(model)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "by_model": {model: aggregate.get_stats() for model, aggregate in self.by_model.items()},
+            "by_agent": {agent: aggregate.get_stats() for agent, aggregate in self.by_agent.items()},
+        }